@@ -0,0 +1,442 @@
+"""
+Priority scheduler for MamaBearAgent tasks
+- Tasks wait in one FIFO per priority (critical > high > medium > low); each priority has its
+  own concurrency limit, and max_workers caps the total
+- A task with `dependencies` (task keys, as plan subtasks carry them) is held until every
+  dependency completes, and fails if any of them does not
+- Deadlines expire tasks that haven't started in time and cancel ones still running at the
+  deadline; cancel(key) works from any thread
+- Every state change is written to the Taskmaster Task table, and recover() re-queues rows a
+  previous process left unfinished
+- Queue depth, running counts and wait times (ready -> started) are kept per priority
+- Runs its own event loop thread, since Flask gives every async view a separate loop
+"""
+import asyncio
+import atexit
+import concurrent.futures
+import json
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+
+from latency_histogram import WINDOWS, WindowedHistogram
+
+PRIORITIES = ('critical', 'high', 'medium', 'low')
+DEFAULT_LIMITS = {'critical': 4, 'high': 2, 'medium': 2, 'low': 1}
+ACTIVE_STATUSES = ('pending', 'queued', 'running')  # pending: waiting on dependencies
+
+
+class TaskCancelled(Exception):
+    """Set on a task's future when it is cancelled, expires, or a dependency does not complete."""
+
+    def __init__(self, message, status='cancelled'):
+        super().__init__(message)
+        self.status = status
+
+
+class _Entry:
+    __slots__ = ('key', 'title', 'priority', 'dependencies', 'deadline', 'details', 'future',
+                 'status', 'waiting_on', 'ready_at', 'task', 'timer')
+
+    def __init__(self, key, title, priority, dependencies, deadline, details, future):
+        self.key = key
+        self.title = title
+        self.priority = priority
+        self.dependencies = dependencies
+        self.deadline = deadline  # Wall-clock seconds, or None
+        self.details = details
+        self.future = future
+        self.status = 'pending'
+        self.waiting_on = set()
+        self.ready_at = None
+        self.task = None
+        self.timer = None
+
+
+class TaskScheduler:
+    def __init__(self, run_fn, app=None, db=None, limits=None, max_workers=None, finished_history=10000,
+                 on_metric=None):
+        """run_fn: async callable taking {'key', 'title', 'priority', 'details', 'dependencies', 'results'}
+        (results maps each dependency key to its result) and returning a JSON-serializable result.
+        Without app/db the scheduler runs in memory only."""
+        self.run_fn = run_fn
+        self.app = app
+        self.db = db
+        self.limits = {**DEFAULT_LIMITS, **(limits or {})}
+        self.max_workers = max_workers or sum(self.limits.values())
+        self.finished_history = finished_history
+        self.on_metric = on_metric
+        self._entries = {}  # key -> active _Entry
+        self._finished = OrderedDict()  # key -> (status, result), for dependents submitted later
+        self._ready = {p: deque() for p in PRIORITIES}
+        self._running = dict.fromkeys(PRIORITIES, 0)
+        self._wait_times = {p: WindowedHistogram() for p in PRIORITIES}
+        self._loop = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+        # One writer thread keeps row updates in order and off the event loop
+        self._db_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='agent-scheduler-db')
+        self.stats = {'submitted': 0, 'completed': 0, 'failed': 0, 'cancelled': 0, 'expired': 0, 'timed_out': 0,
+                      'recovered': 0}
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._loop.run_forever, name='agent-scheduler', daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def stop(self, cancel_running=True):
+        """Stop the loop; running tasks are cancelled (and re-queued by the next recover())."""
+        if self._thread is None:
+            return
+        if cancel_running:
+            def cancel_all():
+                for entry in self._entries.values():
+                    if entry.task is not None:
+                        entry.task.cancel()
+            self._loop.call_soon_threadsafe(cancel_all)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self._thread = None
+        self._db_executor.shutdown(wait=True)
+
+    # Submission
+
+    def submit(self, task):
+        """Thread-safe. task: {'key' (or 'id'), 'title', 'priority', 'dependencies', 'deadline', 'details'};
+        deadline is seconds from now or a datetime. Returns a concurrent.futures.Future for the result."""
+        self.start()
+        entry = self._entry_from(task, concurrent.futures.Future())
+        self._loop.call_soon_threadsafe(self._add, entry, True)
+        return entry.future
+
+    async def submit_async(self, task):
+        return await asyncio.wrap_future(self.submit(task))
+
+    def submit_plan(self, plan):
+        """Submit every subtask of a plan (keys prefixed with the plan id); returns {key: future}."""
+        prefix = f"{plan['id']}:"
+        futures = {}
+        for subtask in plan.get('subtasks', []):
+            task = dict(subtask)
+            task['key'] = prefix + str(subtask['id'])
+            task['dependencies'] = [prefix + str(dep) for dep in subtask.get('dependencies', [])]
+            task.setdefault('title', subtask.get('title') or subtask.get('name'))
+            futures[task['key']] = self.submit(task)
+        return futures
+
+    def cancel(self, key):
+        """Cancels a waiting or running task from any thread but the scheduler's own.
+        Returns False if the task isn't active."""
+        if self._loop is None:
+            return False
+        return asyncio.run_coroutine_threadsafe(self._cancel(key), self._loop).result(timeout=5)
+
+    @staticmethod
+    def _entry_from(task, future):
+        key = str(task.get('key') or task.get('id') or '')
+        if not key:
+            raise ValueError('Task needs a key')
+        priority = task.get('priority') or 'medium'
+        if priority not in PRIORITIES:
+            raise ValueError(f'Unknown priority: {priority}')
+        deadline = task.get('deadline')
+        if isinstance(deadline, datetime):
+            deadline = (deadline - datetime.utcnow()).total_seconds() + time.time()
+        elif deadline is not None:
+            deadline = time.time() + float(deadline)
+        details = task.get('details')
+        return _Entry(key, task.get('title') or key, priority, [str(d) for d in task.get('dependencies') or []],
+                      deadline, details, future)
+
+    # Loop-side state machine
+
+    def _add(self, entry, persist_new):
+        if entry.key in self._entries:
+            entry.future.set_exception(ValueError(f'Task {entry.key} is already scheduled'))
+            return
+        if self._creates_cycle(entry):
+            entry.future.set_exception(ValueError(f'Task {entry.key} has a dependency cycle'))
+            return
+        self._entries[entry.key] = entry
+        self._finished.pop(entry.key, None)
+        self.stats['submitted'] += 1
+        if persist_new:
+            self._persist_new(entry)
+        if entry.deadline is not None:
+            delay = max(0.0, entry.deadline - time.time())
+            entry.timer = self._loop.call_later(delay, self._on_deadline, entry)
+        for dep in entry.dependencies:
+            finished = self._finished.get(dep)
+            if finished is None:
+                entry.waiting_on.add(dep)
+            elif finished[0] != 'completed':
+                self._finish(entry, 'failed', error=f'dependency {dep} {finished[0]}')
+                return
+        if not entry.waiting_on:
+            self._make_ready(entry)
+
+    def _creates_cycle(self, entry):
+        stack, seen = list(entry.dependencies), set()
+        while stack:
+            key = stack.pop()
+            if key == entry.key:
+                return True
+            if key in seen:
+                continue
+            seen.add(key)
+            dep = self._entries.get(key)
+            if dep is not None:
+                stack.extend(dep.dependencies)
+        return False
+
+    def _make_ready(self, entry):
+        entry.status = 'queued'
+        entry.ready_at = time.monotonic()
+        self._ready[entry.priority].append(entry)
+        self._persist(entry.key, status='queued')
+        self._dispatch()
+
+    def _dispatch(self):
+        running = sum(self._running.values())
+        for priority in PRIORITIES:
+            queue = self._ready[priority]
+            while queue and running < self.max_workers and self._running[priority] < self.limits[priority]:
+                entry = queue.popleft()
+                self._running[priority] += 1
+                running += 1
+                entry.status = 'running'
+                entry.task = self._loop.create_task(self._execute(entry))
+
+    async def _execute(self, entry):
+        wait = time.monotonic() - entry.ready_at
+        self._wait_times[entry.priority].record(wait)
+        if self.on_metric is not None:
+            self.on_metric('task_wait_time', wait, {'priority': entry.priority})
+        self._persist(entry.key, status='running', started_at=datetime.utcnow())
+        task = {
+            'key': entry.key,
+            'title': entry.title,
+            'priority': entry.priority,
+            'details': entry.details,
+            'dependencies': entry.dependencies,
+            'results': {dep: self._finished[dep][1] for dep in entry.dependencies if dep in self._finished},
+        }
+        started = time.monotonic()
+        try:
+            if entry.deadline is None:
+                result = await self.run_fn(task)
+            else:
+                result = await asyncio.wait_for(self.run_fn(task), max(0.0, entry.deadline - time.time()))
+        except asyncio.TimeoutError:
+            self._finish(entry, 'timed_out', error='deadline passed while running')
+        except asyncio.CancelledError:
+            self._finish(entry, 'cancelled', error='cancelled while running')
+        except Exception as e:
+            self._finish(entry, 'failed', error=str(e))
+        else:
+            self._finish(entry, 'completed', result=result)
+        finally:
+            self._running[entry.priority] -= 1
+            if self.on_metric is not None:
+                self.on_metric('task_run_time', time.monotonic() - started, {'priority': entry.priority})
+            self._dispatch()
+
+    def _on_deadline(self, entry):
+        entry.timer = None
+        if entry.status in ('pending', 'queued'):
+            self._finish(entry, 'expired', error='deadline passed before the task started')
+        # Running tasks are timed out by wait_for in _execute
+
+    async def _cancel(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return False
+        if entry.task is not None:
+            entry.task.cancel()
+        else:
+            self._finish(entry, 'cancelled', error='cancelled before it started')
+        return True
+
+    def _finish(self, entry, status, result=None, error=None):
+        if self._entries.get(entry.key) is not entry:
+            return
+        del self._entries[entry.key]
+        if entry.timer is not None:
+            entry.timer.cancel()
+        if entry.status == 'queued':
+            try:
+                self._ready[entry.priority].remove(entry)
+            except ValueError:
+                pass
+        entry.status = status
+        self.stats[status] += 1
+        self._finished[entry.key] = (status, result)
+        while len(self._finished) > self.finished_history:
+            self._finished.popitem(last=False)
+        payload = {'result': result} if status == 'completed' else {'error': error}
+        self._persist(entry.key, status=status, finished_at=datetime.utcnow(),
+                      result=json.dumps(payload, default=str))
+        if not entry.future.done():
+            if status == 'completed':
+                entry.future.set_result(result)
+            elif status == 'failed':
+                entry.future.set_exception(RuntimeError(f'Task {entry.key} failed: {error}'))
+            else:
+                entry.future.set_exception(TaskCancelled(f'Task {entry.key} {status}: {error}', status))
+        # Release or fail dependents
+        for dependent in [e for e in self._entries.values() if entry.key in e.waiting_on]:
+            if status != 'completed':
+                self._finish(dependent, 'failed', error=f'dependency {entry.key} {status}')
+                continue
+            dependent.waiting_on.discard(entry.key)
+            if not dependent.waiting_on and dependent.status == 'pending':
+                self._make_ready(dependent)
+
+    # Persistence
+
+    def _persist_new(self, entry):
+        if self.db is None:
+            return
+        deadline = datetime.utcfromtimestamp(entry.deadline) if entry.deadline is not None else None
+        details = entry.details if isinstance(entry.details, str) or entry.details is None else json.dumps(entry.details)
+
+        def write():
+            from taskmaster_ai.models import Task
+            with self.app.app_context():
+                row = self._row(Task, entry.key)
+                if row is None:
+                    row = Task(task_key=entry.key)
+                    self.db.session.add(row)
+                row.title = entry.title[:128]
+                row.status = entry.status
+                row.priority = entry.priority
+                row.dependencies = json.dumps(entry.dependencies)
+                row.deadline = deadline
+                row.details = details
+                row.started_at = row.finished_at = row.result = None
+                self.db.session.commit()
+
+        self._write(write)
+
+    def _persist(self, key, **fields):
+        if self.db is None:
+            return
+
+        def write():
+            from taskmaster_ai.models import Task
+            with self.app.app_context():
+                row = self._row(Task, key)
+                if row is None:
+                    return
+                for name, value in fields.items():
+                    setattr(row, name, value)
+                self.db.session.commit()
+
+        self._write(write)
+
+    def _row(self, model, key):
+        return model.query.filter_by(task_key=key).order_by(model.id.desc()).first()
+
+    def _write(self, write):
+        def run():
+            try:
+                write()
+            except Exception as e:
+                print(f"[WARN] Agent scheduler could not persist task state: {e}")
+        self._db_executor.submit(run)
+
+    def recover(self):
+        """Re-queue Task rows left pending/queued/running by a previous process; returns how many.
+        Finished rows they depend on count as already finished."""
+        if self.db is None:
+            return 0
+        from taskmaster_ai.models import Task
+        with self.app.app_context():
+            rows = Task.query.filter(Task.task_key.isnot(None), Task.status.in_(ACTIVE_STATUSES)).order_by(Task.id).all()
+            deps = {dep for row in rows for dep in json.loads(row.dependencies or '[]')}
+            finished = {}
+            if deps:
+                for dep_row in Task.query.filter(Task.task_key.in_(deps)).order_by(Task.id).all():
+                    if dep_row.status not in ACTIVE_STATUSES:
+                        result = json.loads(dep_row.result or '{}').get('result')
+                        finished[dep_row.task_key] = (dep_row.status, result)
+            tasks = []
+            for row in rows:
+                now = datetime.utcnow()
+                tasks.append({
+                    'key': row.task_key,
+                    'title': row.title,
+                    'priority': row.priority or 'medium',
+                    'dependencies': json.loads(row.dependencies or '[]'),
+                    'deadline': (row.deadline - now).total_seconds() if row.deadline else None,
+                    'details': _load_details(row.details),
+                })
+        self.start()
+        for task in tasks:
+            entry = self._entry_from(task, concurrent.futures.Future())
+
+            def add(entry=entry):
+                for key, value in finished.items():
+                    self._finished.setdefault(key, value)
+                entry.status = 'pending'
+                self._persist(entry.key, status='pending', started_at=None)
+                self._add(entry, False)
+
+            self._loop.call_soon_threadsafe(add)
+        self.stats['recovered'] += len(tasks)
+        return len(tasks)
+
+    # Metrics
+
+    def get_status(self):
+        """Queue depth, running count and recent wait-time percentiles per priority."""
+        priorities = {}
+        blocked = {p: 0 for p in PRIORITIES}
+        for entry in list(self._entries.values()):
+            if entry.status == 'pending':
+                blocked[entry.priority] += 1
+        for priority in PRIORITIES:
+            waits = self._wait_times[priority].window(WINDOWS['5m'])
+            priorities[priority] = {
+                'queued': len(self._ready[priority]),
+                'blocked': blocked[priority],
+                'running': self._running[priority],
+                'limit': self.limits[priority],
+                'wait_p50': waits.percentile(50) if waits.count else None,
+                'wait_p99': waits.percentile(99) if waits.count else None,
+                'started_5m': waits.count,
+            }
+        return {**self.stats, 'max_workers': self.max_workers, 'priorities': priorities}
+
+
+def _load_details(details):
+    """Details are stored as JSON unless they were submitted as a string."""
+    try:
+        return json.loads(details) if details else details
+    except ValueError:
+        return details
+
+
+def init_scheduler(app, agent, db=None):
+    """Create the app's TaskScheduler (app.extensions['agent_scheduler']) running agent.execute_task,
+    attach it to the agent and re-queue unfinished tasks."""
+    if db is None:
+        from taskmaster_ai.models import db
+    monitoring = getattr(app, 'mama_bear_monitoring', None)
+    scheduler = TaskScheduler(
+        agent.execute_task,
+        app=app,
+        db=db,
+        limits=app.config.get('SCHEDULER_LIMITS'),
+        max_workers=app.config.get('SCHEDULER_MAX_WORKERS'),
+        on_metric=monitoring.histograms.record if monitoring is not None else None,
+    )
+    app.extensions['agent_scheduler'] = scheduler
+    agent.attach_scheduler(scheduler)
+    scheduler.recover()
+    return scheduler
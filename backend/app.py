@@ -3,43 +3,100 @@ Podplay Sanctuary Backend Bootstrap
 - Initializes Flask, SQLAlchemy, SocketIO
 - Loads config from .env and mama_bear_config_setup.py
 - Registers Taskmaster-AI, Mem0, Scrapybara, Agent blueprints
+- Registers the chat stream and live plan SocketIO handlers on the app's SocketIO
+- Runs agent tasks through the priority scheduler (agent_scheduler.py)
 - Health check endpoint
+- Per-request span tracing (Server-Timing; /api/debug/traces behind TRACE_DEBUG_ENDPOINTS)
+  and opt-in sampled profiling
+- Opt-in lazy startup (LAZY_STARTUP=1): the port is bound and /health served at once while
+  the app is built in the background, optional integrations load on first use, and model
+  warm-up runs after the app is ready
 """
 import os
-from flask import Flask, jsonify
-from flask_socketio import SocketIO
-from taskmaster_ai import init_app as init_taskmaster_ai
-from mama_bear_config_setup import load_config
-# Placeholder imports for Mem0 and Scrapybara integration
-# from mem0_integration import init_mem0
-# from scrapybara_integration import init_scrapybara
-
+import time
 import asyncio
-from mama_bear_complete_system import create_mama_bear_app, CompleteMamaBearSystem
+from startup import LazyApp, LazyIntegration, StartupTimer, Warmup, serve
+
+timer = StartupTimer()
+
+def _load_mem0():
+    return timer.timed_import('mem0_integration').persist_to_mem0
 
-async def create_enhanced_app():
+async def create_enhanced_app(lazy=False):
     print("🐻 Initializing Mama Bear Development Sanctuary...")
-    config = load_config()
-    app = await create_mama_bear_app(config)
-    init_taskmaster_ai(app)
-    try:
-        from mem0_integration import persist_to_mem0
-        app.persist_to_mem0 = persist_to_mem0
-    except ImportError:
-        print("[INFO] Mem0 integration using enhanced system")
+    with timer.phase('load config'):
+        config = timer.timed_import('mama_bear_config_setup').load_config()
+    complete_system = timer.timed_import('mama_bear_complete_system')
+    with timer.phase('create mama bear app'):
+        app = await complete_system.create_mama_bear_app(config)
+    with timer.phase('init model router'):
+        # Chat for hedged variants goes through this router (mama_bear_config_setup._routed_message)
+        if getattr(app, 'model_router', None) is None:
+            app.model_router = timer.timed_import('model_router').create_model_router(config)
+    with timer.phase('init tracing'):
+        timer.timed_import('tracing').init_tracing(app)
+    agent = getattr(app, 'mama_bear_agent', None)
+    socketio = app.extensions.get('socketio')
+    if socketio is not None:
+        with timer.phase('register socketio handlers'):
+            timer.timed_import('mama_bear_config_setup').register_socketio_handlers(socketio)
+        with timer.phase('init live plans'):
+            plans = timer.timed_import('live_plans').init_live_plans(app, socketio)
+            if hasattr(agent, 'attach_plan_store'):
+                agent.attach_plan_store(plans)
+    with timer.phase('init taskmaster'):
+        timer.timed_import('taskmaster_ai').init_app(app)
+    if hasattr(agent, 'execute_task') and hasattr(agent, 'attach_scheduler'):
+        with timer.phase('init agent scheduler'):
+            # Re-queues tasks a previous process left unfinished; stopped at exit
+            timer.timed_import('agent_scheduler').init_scheduler(app, agent)
+    app.persist_to_mem0 = LazyIntegration('Mem0', _load_mem0, timer)
+    if not lazy:
+        app.persist_to_mem0.get()
     try:
-        from scrapybara_integration import bp as scrapybara_bp
-        app.register_blueprint(scrapybara_bp, url_prefix='/api')
+        with timer.phase('register scrapybara'):
+            scrapybara = timer.timed_import('scrapybara_integration')
+            app.register_blueprint(scrapybara.bp, url_prefix='/api')
+            scrapybara.init_scrapybara(app, start=not lazy)
     except ImportError:
         print("[INFO] Scrapybara integration using enhanced system")
+    app.startup_timer = timer
     print("🎉 Mama Bear Sanctuary is ready!")
     return app
 
+def start_warm_up(app):
+    """Warm the agent's models on a background thread; None when there is nothing to warm."""
+    model_manager = getattr(getattr(app, 'mama_bear_agent', None), 'model_manager', None)
+    if not hasattr(model_manager, 'warm_up_models'):
+        return None
+    return Warmup(model_manager.warm_up_models, name='model-warm-up').start()
+
+def run_lazy(host="0.0.0.0", port=5000):
+    # Imported before the builder thread starts, so the two threads don't import werkzeug at once
+    import werkzeug.serving  # noqa: F401
+    dispatcher = LazyApp(timer)
+
+    def build():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        app = loop.run_until_complete(create_enhanced_app(lazy=True))
+        return app, start_warm_up(app)
+
+    dispatcher.build_in_background(build)
+    timer.record('until /health is served', time.perf_counter() - timer.started)
+    # Same server the SocketIO runner uses; the built app's wsgi_app carries the SocketIO middleware
+    serve(dispatcher, host, port)
+
 def run_app():
+    if os.environ.get('LAZY_STARTUP', '0') == '1':
+        run_lazy(host="0.0.0.0", port=5000)
+        return
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
     try:
         app = loop.run_until_complete(create_enhanced_app())
+        timer.mark_ready()
+        print(timer.format_report())
         system = app.mama_bear_system
         system.run(host="0.0.0.0", port=5000)
     except Exception as e:
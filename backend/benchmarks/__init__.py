@@ -0,0 +1,6 @@
+"""
+Offline benchmarks for the Podplay backend
+- A local fake Gemini server stands in for the model API (fake_gemini.py)
+- Scenarios drive the real Flask blueprints over HTTP and SocketIO (scenarios.py)
+- `python -m benchmarks` (from backend/) writes RPS, latency percentiles and error rates to JSON
+"""
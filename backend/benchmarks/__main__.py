@@ -0,0 +1,85 @@
+"""
+python -m benchmarks [--scenario NAME ...] [--scale 1.0] [--seed 0] [--out FILE] [--compare FILE]
+Runs the offline scenarios and writes one JSON report; --compare prints the change in RPS,
+p50/p99 and error rate against an earlier report (e.g. from the previous commit).
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+
+from benchmarks.scenarios import SCENARIOS
+
+COMPARED = ('rps', 'p50_ms', 'p99_ms', 'error_rate')
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _leaves(result, prefix=''):
+    """(path, summary) for every nested dict that carries the compared fields."""
+    if isinstance(result, dict):
+        if 'rps' in result:
+            yield prefix, result
+        for key, value in result.items():
+            yield from _leaves(value, f'{prefix}.{key}' if prefix else key)
+
+
+def compare(old, new):
+    old_leaves = {path: summary for name, result in old['scenarios'].items() for path, summary in _leaves(result, name)}
+    lines = [f"{'metric':<42}{'before':>12}{'after':>12}{'change':>10}"]
+    for name, result in new['scenarios'].items():
+        for path, summary in _leaves(result, name):
+            before = old_leaves.get(path)
+            if before is None:
+                continue
+            for field in COMPARED:
+                a, b = before.get(field), summary.get(field)
+                if a is None or b is None:
+                    continue
+                change = f'{(b - a) / a * 100:+.1f}%' if a else ''
+                lines.append(f'{path + "." + field:<42}{a:>12}{b:>12}{change:>10}')
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Offline Podplay backend benchmarks')
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help='Scenario to run (repeatable); all by default')
+    parser.add_argument('--scale', type=float, default=1.0, help='Multiplier for request counts')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default='benchmark-results.json')
+    parser.add_argument('--compare', help='Earlier report to compare against')
+    args = parser.parse_args(argv)
+
+    report = {
+        'meta': {
+            'git_revision': _git_revision(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'scale': args.scale,
+            'seed': args.seed,
+        },
+        'scenarios': {},
+    }
+    for name in args.scenario or list(SCENARIOS):
+        print(f'Running {name}...', file=sys.stderr)
+        report['scenarios'][name] = SCENARIOS[name](scale=args.scale, seed=args.seed)
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2, default=str)
+    print(f'Wrote {args.out}', file=sys.stderr)
+    if args.compare:
+        with open(args.compare) as f:
+            print(compare(json.load(f), report))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+"""
+Local stand-in for the Gemini REST API
+- Serves models/{model}:generateContent and :streamGenerateContent (alt=sse) on localhost
+- Latency comes from a seeded distribution (constant, uniform, exponential or lognormal);
+  streaming spreads the answer over chunks with a per-chunk delay
+- Injects 5xx errors and 429s at configured rates, and enforces an optional per-key
+  requests-per-minute quota that answers 429 with Retry-After once spent
+- gemini_backend.GeminiHTTPBackend talks to it like it talks to the real API
+"""
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+_PATH = re.compile(r'^/v1beta/models/(?P<model>[^:/]+):(?P<method>generateContent|streamGenerateContent)$')
+
+
+class LatencyModel:
+    """Seconds per call: constant(mean), uniform(low, high), exponential(mean) or lognormal(median, sigma)."""
+
+    def __init__(self, kind='lognormal', mean=0.05, low=None, high=None, sigma=0.5):
+        self.kind = kind
+        self.mean = mean
+        self.low = mean / 2 if low is None else low
+        self.high = mean * 1.5 if high is None else high
+        self.sigma = sigma
+
+    def sample(self, rng):
+        if self.kind == 'constant':
+            return self.mean
+        if self.kind == 'uniform':
+            return rng.uniform(self.low, self.high)
+        if self.kind == 'exponential':
+            return rng.expovariate(1.0 / self.mean)
+        return rng.lognormvariate(math.log(self.mean), self.sigma)  # mean is the median here
+
+    def to_dict(self):
+        return {'kind': self.kind, 'mean': self.mean, 'low': self.low, 'high': self.high, 'sigma': self.sigma}
+
+
+class FakeGeminiServer:
+    def __init__(self, latency=None, error_rate=0.0, rate_limit_rate=0.0, rpm_per_key=None, retry_after=1,
+                 stream_chunks=8, chunk_delay=0.005, seed=0, host='127.0.0.1', port=0):
+        self.latency = latency or LatencyModel()
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.rpm_per_key = rpm_per_key
+        self.retry_after = retry_after
+        self.stream_chunks = stream_chunks
+        self.chunk_delay = chunk_delay
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._calls = {}  # api key -> deque of call times in the last minute
+        self._calls_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.stats = {'requests': 0, 'ok': 0, 'streams': 0, 'errors_5xx': 0, 'rate_limited': 0, 'quota_exhausted': 0}
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-gemini', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def config(self):
+        return {'latency': self.latency.to_dict(), 'error_rate': self.error_rate,
+                'rate_limit_rate': self.rate_limit_rate, 'rpm_per_key': self.rpm_per_key,
+                'stream_chunks': self.stream_chunks, 'chunk_delay': self.chunk_delay}
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def _draw(self):
+        with self._rng_lock:
+            return self.latency.sample(self._rng), self._rng.random(), self._rng.random()
+
+    def _over_quota(self, api_key):
+        if not self.rpm_per_key:
+            return False
+        now = time.monotonic()
+        with self._calls_lock:
+            calls = self._calls.setdefault(api_key, deque())
+            while calls and calls[0] <= now - 60:
+                calls.popleft()
+            if len(calls) >= self.rpm_per_key:
+                return True
+            calls.append(now)
+            return False
+
+    def _respond(self, model, api_key, body, stream):
+        """(status, headers, payload or chunk list) for one call."""
+        self._count('requests')
+        latency, fault_roll, limit_roll = self._draw()
+        if self._over_quota(api_key):
+            self._count('quota_exhausted')
+            return 429, {'Retry-After': str(self.retry_after)}, _error(429, 'RESOURCE_EXHAUSTED', 'Quota exceeded')
+        time.sleep(latency)
+        if limit_roll < self.rate_limit_rate:
+            self._count('rate_limited')
+            return 429, {'Retry-After': str(self.retry_after)}, _error(429, 'RESOURCE_EXHAUSTED', 'Rate limited')
+        if fault_roll < self.error_rate:
+            self._count('errors_5xx')
+            status = 503 if fault_roll < self.error_rate / 2 else 500
+            return status, {}, _error(status, 'UNAVAILABLE' if status == 503 else 'INTERNAL', 'Injected error')
+        prompt = ' '.join(part.get('text', '') for content in body.get('contents', [])
+                          for part in content.get('parts', []))
+        text = f'[{model}] {prompt}'
+        self._count('ok')
+        if not stream:
+            return 200, {}, _candidate(text, prompt)
+        self._count('streams')
+        size = max(1, math.ceil(len(text) / self.stream_chunks))
+        return 200, {}, [_candidate(text[i:i + size], prompt) for i in range(0, len(text), size)]
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                match = _PATH.match(url.path)
+                length = int(self.headers.get('Content-Length') or 0)
+                raw = self.rfile.read(length) if length else b'{}'
+                if match is None:
+                    self._send(404, {}, _error(404, 'NOT_FOUND', 'Unknown method'))
+                    return
+                query = parse_qs(url.query)
+                api_key = self.headers.get('x-goog-api-key') or query.get('key', [''])[0]
+                stream = match.group('method') == 'streamGenerateContent'
+                status, headers, payload = server._respond(match.group('model'), api_key, json.loads(raw or b'{}'), stream)
+                if status != 200 or not stream:
+                    self._send(status, headers, payload)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                for chunk in payload:
+                    self.wfile.write(f'data: {json.dumps(chunk)}\r\n\r\n'.encode('utf-8'))
+                    self.wfile.flush()
+                    time.sleep(server.chunk_delay)
+                self.close_connection = True
+
+            def _send(self, status, headers, payload):
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+
+def _candidate(text, prompt):
+    return {
+        'candidates': [{'content': {'role': 'model', 'parts': [{'text': text}]}, 'finishReason': 'STOP'}],
+        'usageMetadata': {'promptTokenCount': len(prompt.split()), 'candidatesTokenCount': len(text.split()),
+                          'totalTokenCount': len(prompt.split()) + len(text.split())},
+    }
+
+
+def _error(code, status, message):
+    return {'error': {'code': code, 'status': status, 'message': message}}
@@ -0,0 +1,230 @@
+"""
+Load generation and measurement for the offline benchmarks
+- build_environment() wires the real Flask blueprints (Mama Bear chat, Taskmaster, live
+  plans over SocketIO) to a BenchAgent that calls the fake Gemini server through ModelRouter
+- run_load() drives a request function from a fixed number of client threads and records
+  per-request latency and outcome
+- Recorder.summary() gives RPS, p50/p90/p99 and error rates in one JSON-ready dict
+"""
+import asyncio
+import http.client
+import json
+import math
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from gemini_backend import GeminiHTTPBackend
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list (None when empty)."""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(p / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = []  # (latency seconds, ok, status)
+        self.started = None
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def record(self, latency, ok, status):
+        with self._lock:
+            self.samples.append((latency, ok, status))
+
+    def summary(self):
+        latencies = sorted(s[0] for s in self.samples)
+        errors = sum(1 for s in self.samples if not s[1])
+        duration = (self.finished or time.perf_counter()) - (self.started or time.perf_counter())
+        statuses = {}
+        for _latency, _ok, status in self.samples:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        ms = lambda value: round(value * 1000, 3) if value is not None else None
+        return {
+            'requests': len(self.samples),
+            'errors': errors,
+            'error_rate': round(errors / len(self.samples), 4) if self.samples else 0.0,
+            'duration_s': round(duration, 3),
+            'rps': round(len(self.samples) / duration, 2) if duration > 0 else None,
+            'p50_ms': ms(percentile(latencies, 50)),
+            'p90_ms': ms(percentile(latencies, 90)),
+            'p99_ms': ms(percentile(latencies, 99)),
+            'max_ms': ms(latencies[-1] if latencies else None),
+            'status_counts': statuses,
+        }
+
+
+def run_load(request_fn, total, concurrency, recorder=None):
+    """Call request_fn(i, client) total times from `concurrency` threads, each with its own
+    client state; request_fn returns (ok, status). Exceptions count as errors."""
+    recorder = recorder or Recorder()
+    counter = iter(range(total))
+    lock = threading.Lock()
+
+    def worker():
+        client = {}
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                break
+            started = time.perf_counter()
+            try:
+                ok, status = request_fn(i, client)
+            except Exception as e:
+                ok, status = False, type(e).__name__
+            recorder.record(time.perf_counter() - started, ok, status)
+        for conn in client.values():
+            if hasattr(conn, 'close'):
+                conn.close()
+
+    recorder.started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    recorder.finished = time.perf_counter()
+    return recorder
+
+
+class HTTPClient:
+    """Keep-alive JSON client for one load thread."""
+
+    def __init__(self, base_url):
+        host, _, port = base_url.replace('http://', '').partition(':')
+        self.host, self.port = host, int(port)
+        self.conn = None
+
+    def request(self, method, path, body=None, headers=None):
+        for attempt in (0, 1):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+            try:
+                data = json.dumps(body).encode('utf-8') if body is not None else None
+                self.conn.request(method, path, body=data, headers={'Content-Type': 'application/json', **(headers or {})})
+                response = self.conn.getresponse()
+                return response.status, response
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                self.close()
+                if attempt:
+                    raise
+
+    def json(self, method, path, body=None):
+        status, response = self.request(method, path, body)
+        payload = response.read()
+        return status, json.loads(payload) if payload else None
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+class BenchAgent:
+    """Just enough of the Mama Bear agent for the chat endpoints, backed by ModelRouter."""
+
+    def __init__(self, router, backend, variants):
+        self.router = router
+        self.backend = backend
+        self.variants = variants
+        self.model_manager = None
+
+    async def process_message(self, message, page_context='main_chat', user_id='bench', **options):
+        started = time.perf_counter()
+        result, metadata = await self.router.call({'message': message})
+        return {'content': result['content'],
+                'metadata': {**metadata, 'model_used': metadata['model'], 'variant': page_context,
+                             'processing_time': time.perf_counter() - started}}
+
+    async def process_message_stream(self, message, page_context='main_chat', user_id='bench', **options):
+        endpoint = self.router.select()
+        if endpoint is None:
+            raise RuntimeError('No healthy endpoint')
+        async for chunk in self.backend.stream(endpoint.api_key, endpoint.model, {'message': message}):
+            yield chunk
+        yield {'metadata': {'model_used': endpoint.model, 'variant': page_context}}
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class _ModelManagerStub:
+    def get_model_status(self):
+        return {}
+
+
+def build_environment(gemini_url, config_overrides=None):
+    """Flask app with the real blueprints on a temporary SQLite database, served on a local port.
+    Returns a dict with app, socketio, base_url, router and a stop() callable."""
+    database_url = f'sqlite:///{tempfile.mkdtemp(prefix="podplay-bench-")}/bench.db'
+    from flask import Flask
+    from flask_socketio import SocketIO
+    import mama_bear_config_setup as mama_bear
+    from live_plans import init_live_plans
+    from model_router import ModelRouter
+    from taskmaster_ai import init_app as init_taskmaster_ai
+    from tracing import init_tracing
+
+    config = mama_bear.load_config()
+    config.update({
+        'GEMINI_API_KEY_PRIMARY': 'bench-primary',
+        'GEMINI_API_KEY_BACKUP': 'bench-backup',
+        'ENABLE_RESPONSE_CACHING': False,
+        'RETENTION_ENABLED': False,
+        'BASE_FALLBACK_DELAY': 0.05,
+        'MAX_FALLBACK_DELAY': 2.0,
+        # Set here rather than via DATABASE_URL, which is read when the config module is imported
+        'SQLALCHEMY_DATABASE_URI': database_url,
+    })
+    if 'readonly' in config.get('SQLALCHEMY_BINDS', {}):
+        config['SQLALCHEMY_BINDS'] = {**config['SQLALCHEMY_BINDS'],
+                                      'readonly': {**config['SQLALCHEMY_BINDS']['readonly'], 'url': database_url}}
+    config.update(config_overrides or {})
+    app = Flask('podplay-bench')
+    app.config.from_mapping(config)
+    init_tracing(app)
+    init_taskmaster_ai(app)
+    app.register_blueprint(mama_bear.mama_bear_bp)
+    socketio = SocketIO(app, async_mode='threading')
+    store = init_live_plans(app, socketio)
+
+    backend = GeminiHTTPBackend(gemini_url)
+    router = ModelRouter(config, backend)
+    app.model_router = router
+    variants = {'main_chat': mama_bear.ResearchSpecialist(), 'research': mama_bear.ResearchSpecialist()}
+    app.mama_bear_agent = BenchAgent(router, backend, variants)
+
+    # Monitoring schedules its background reports on a loop; give it one that never runs them
+    monitoring_loop = asyncio.new_event_loop()
+
+    async def create_monitoring():
+        return mama_bear.MamaBearMonitoring(_ModelManagerStub())
+    app.mama_bear_monitoring = monitoring_loop.run_until_complete(create_monitoring())
+
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=_QuietHandler)
+    thread = threading.Thread(target=server.serve_forever, name='bench-app', daemon=True)
+    thread.start()
+
+    def stop():
+        server.shutdown()
+        router.stop()
+        store.stop()
+        writer = app.extensions.get('taskmaster_writer')
+        if writer is not None and hasattr(writer, 'stop'):
+            writer.stop()
+        pending = asyncio.all_tasks(monitoring_loop)
+        for task in pending:
+            task.cancel()
+        monitoring_loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        monitoring_loop.close()
+
+    return {'app': app, 'socketio': socketio, 'plans': store, 'router': router,
+            'base_url': f'http://127.0.0.1:{server.server_port}', 'stop': stop}
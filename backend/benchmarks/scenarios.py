@@ -0,0 +1,175 @@
+"""
+Benchmark scenarios; each takes (scale, seed) and returns a JSON-ready result dict
+- chat_burst: concurrent JSON chat requests, plus SSE streams timed to first token
+- log_flood: single-row Taskmaster log POSTs through the write-behind queue, then bulk batches
+- dashboard_fanout: SocketIO plan viewers receiving delta frames while HTTP viewers poll tasks
+- quota_exhaustion: chat traffic against per-key RPM quotas that run out mid-run
+Request counts and seeds are fixed per scale, so results from different commits compare
+"""
+import time
+
+from benchmarks.fake_gemini import FakeGeminiServer, LatencyModel
+from benchmarks.harness import HTTPClient, Recorder, build_environment, percentile, run_load
+
+
+def _scaled(value, scale):
+    return max(1, int(value * scale))
+
+
+def _chat(env, message, stream=False):
+    def request_fn(i, client):
+        http = client.setdefault('http', HTTPClient(env['base_url']))
+        status, payload = http.json('POST', '/api/mama-bear/chat',
+                                    {'message': f'{message} #{i}', 'page_context': 'research', 'user_id': 'bench'})
+        return status == 200 and payload.get('success', False), status
+    return request_fn
+
+
+def chat_burst(scale=1.0, seed=0):
+    gemini = FakeGeminiServer(latency=LatencyModel('lognormal', mean=0.04, sigma=0.5), error_rate=0.01,
+                              rate_limit_rate=0.01, retry_after=1, seed=seed).start()
+    env = build_environment(gemini.url)
+    try:
+        burst = run_load(_chat(env, 'Summarize the latest research on vector search'), _scaled(400, scale), 32)
+        ttft = []
+
+        def stream_fn(i, client):
+            http = client.setdefault('http', HTTPClient(env['base_url']))
+            started = time.perf_counter()
+            status, response = http.request('POST', '/api/mama-bear/chat',
+                                            {'message': f'Stream an answer #{i}', 'page_context': 'research',
+                                             'stream': True})
+            first, ok = None, False
+            for line in response:
+                if line.startswith(b'event: token') and first is None:
+                    first = time.perf_counter() - started
+                if line.startswith(b'event: done'):
+                    ok = True
+                if line.startswith(b'event: error'):
+                    break
+            response.read()
+            http.close()  # SSE responses aren't reused
+            if first is not None:
+                ttft.append(first)
+            return ok and status == 200, status
+
+        streams = run_load(stream_fn, _scaled(60, scale), 8)
+        ttft.sort()
+        return {
+            'burst': burst.summary(),
+            'stream': {**streams.summary(),
+                       'ttft_p50_ms': round(percentile(ttft, 50) * 1000, 3) if ttft else None,
+                       'ttft_p99_ms': round(percentile(ttft, 99) * 1000, 3) if ttft else None},
+            'fake_gemini': {**gemini.config(), **gemini.stats},
+        }
+    finally:
+        env['stop']()
+        gemini.stop()
+
+
+def log_flood(scale=1.0, seed=0):
+    gemini = FakeGeminiServer(seed=seed).start()
+    env = build_environment(gemini.url)
+    try:
+        def single(i, client):
+            http = client.setdefault('http', HTTPClient(env['base_url']))
+            status, _payload = http.json('POST', '/podplay-planning/podplay_logs',
+                                         {'level': 'INFO' if i % 10 else 'ERROR', 'message': f'bench log line {i}',
+                                          'context': '{"source": "bench"}'})
+            return status in (201, 202), status
+
+        rows_per_batch = 500
+
+        def batch(i, client):
+            http = client.setdefault('http', HTTPClient(env['base_url']))
+            records = [{'level': 'DEBUG', 'message': f'bulk {i}:{j}', 'context': '{}'} for j in range(rows_per_batch)]
+            status, _payload = http.json('POST', '/podplay-planning/podplay_logs/batch', records)
+            return status == 201, status
+
+        singles = run_load(single, _scaled(2000, scale), 16)
+        batches = run_load(batch, _scaled(20, scale), 4)
+        batch_summary = batches.summary()
+        ok_batches = batch_summary['requests'] - batch_summary['errors']
+        return {
+            'single_rows': singles.summary(),
+            'batches': {**batch_summary, 'rows_per_batch': rows_per_batch,
+                        'rows_per_s': round(ok_batches * rows_per_batch / batch_summary['duration_s'], 1)
+                        if batch_summary['duration_s'] else None},
+        }
+    finally:
+        env['stop']()
+        gemini.stop()
+
+
+def dashboard_fanout(scale=1.0, seed=0):
+    gemini = FakeGeminiServer(seed=seed).start()
+    env = build_environment(gemini.url)
+    app, socketio, plans = env['app'], env['socketio'], env['plans']
+    try:
+        viewers = [socketio.test_client(app) for _ in range(_scaled(50, scale))]
+        plan = {'id': 'bench-plan', 'title': 'Bench plan', 'status': 'in-progress',
+                'subtasks': [{'id': str(i), 'title': f'Step {i}', 'status': 'pending', 'agent': 'scout',
+                              'dependencies': []} for i in range(20)]}
+        plans.upsert_plan('bench', plan)
+        plans.flush()
+        for viewer in viewers:
+            viewer.emit('get_agent_plans', {'user_id': 'bench'})
+            viewer.get_received()
+
+        # Updates arrive faster than the flush tick; each flush fans one coalesced frame out to every viewer
+        updates = _scaled(2000, scale)
+        flushes = Recorder()
+        flushes.started = time.perf_counter()
+        for i in range(updates):
+            plans.update_subtask('bench', 'bench-plan', str(i % 20), status=('in-progress', 'completed')[i % 2],
+                                 progress=i)
+            if i % 50 == 49:
+                started = time.perf_counter()
+                plans.flush()
+                flushes.record(time.perf_counter() - started, True, 'flush')
+        plans.flush()
+        flushes.finished = time.perf_counter()
+        frames = [len([m for m in viewer.get_received() if m['name'] == 'agent_plans_delta']) for viewer in viewers]
+        for viewer in viewers:
+            viewer.disconnect()
+
+        def poll(i, client):
+            http = client.setdefault('http', HTTPClient(env['base_url']))
+            status, _payload = http.json('GET', '/podplay-planning/podplay_tasks?limit=50')
+            return status == 200, status
+
+        polling = run_load(poll, _scaled(1000, scale), 16)
+        return {
+            'socketio': {**flushes.summary(), 'viewers': len(viewers), 'updates': updates,
+                         'frames_per_viewer_min': min(frames), 'frames_per_viewer_max': max(frames),
+                         'plan_store': dict(plans.stats)},
+            'task_polling': polling.summary(),
+        }
+    finally:
+        env['stop']()
+        gemini.stop()
+
+
+def quota_exhaustion(scale=1.0, seed=0):
+    # Two keys, each allowed 60 calls a minute (at scale 1): the run outlasts the quota
+    gemini = FakeGeminiServer(latency=LatencyModel('constant', mean=0.02), rpm_per_key=_scaled(60, scale),
+                              retry_after=1, seed=seed).start()
+    env = build_environment(gemini.url, {'MAX_FALLBACK_ATTEMPTS': 4, 'MAX_FALLBACK_DELAY': 1.0})
+    try:
+        load = run_load(_chat(env, 'Check the remaining Gemini quota'), _scaled(300, scale), 8)
+        return {
+            'chat': load.summary(),
+            'router': env['router'].get_status(),
+            'fake_gemini': {**gemini.config(), **gemini.stats},
+        }
+    finally:
+        env['stop']()
+        gemini.stop()
+
+
+SCENARIOS = {
+    'chat_burst': chat_burst,
+    'log_flood': log_flood,
+    'dashboard_fanout': dashboard_fanout,
+    'quota_exhaustion': quota_exhaustion,
+}
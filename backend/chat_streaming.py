@@ -0,0 +1,164 @@
+"""
+Incremental token streaming for Mama Bear chat
+- Tokens come from the agent's process_message_stream when it has one, otherwise from the
+  model router's streaming call for the page's variant
+- Runs the token stream on a shared event loop thread, so the stream outlives the Flask view
+  that started it and can be cancelled from any thread
+- Each stream reports events to a sink: ('token', text), ('done', content, metadata),
+  ('error', message) or ('cancelled',)
+- Cancelling a stream cancels the upstream task, which aborts the in-flight model call
+- SSE framing for the HTTP endpoint lives here too; SocketIO emits straight from the sink
+"""
+import asyncio
+import contextvars
+import json
+import queue
+import threading
+import time
+
+
+async def routed_token_stream(router, upstream, models, page_context):
+    """Yield the model's text chunks as they arrive through ModelRouter.stream, then its metadata
+    in the shape process_message returns."""
+    async for chunk in router.stream(upstream, models=models):
+        if isinstance(chunk, dict):
+            metadata = chunk['metadata']
+            yield {'metadata': {**metadata, 'model_used': metadata['model'], 'variant': page_context}}
+        else:
+            yield chunk
+
+
+async def agent_token_stream(mama_bear, request_args):
+    """Yield text chunks, then one {'metadata': ...} dict, from an agent with or without streaming.
+    Without process_message_stream the whole answer arrives as one chunk."""
+    if hasattr(mama_bear, 'process_message_stream'):
+        async for chunk in mama_bear.process_message_stream(**request_args):
+            yield chunk
+        return
+    response = await mama_bear.process_message(**request_args)
+    yield response['content']
+    yield {'metadata': response.get('metadata', {})}
+
+
+class StreamHandle:
+    def __init__(self, loop):
+        self._loop = loop
+        self.task = None
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+        if self.task is not None:
+            self._loop.call_soon_threadsafe(self.task.cancel)
+
+
+class StreamRunner:
+    def __init__(self):
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self.stats = {'started': 0, 'completed': 0, 'cancelled': 0, 'failed': 0}
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name='chat-streams', daemon=True)
+                self._thread.start()
+        return self._loop
+
+    def start(self, source, sink, on_complete=None):
+        """source: async iterator of text chunks and an optional final {'metadata': ...} dict.
+        on_complete(content, metadata) runs on success, after metadata gains
+        time_to_first_token and processing_time."""
+        loop = self._ensure_loop()
+        handle = StreamHandle(loop)
+        ready = threading.Event()
+        context = contextvars.copy_context()  # The caller's request trace and Flask app context
+
+        def create():
+            handle.task = loop.create_task(self._run(source, sink, on_complete), context=context)
+            if handle.cancelled:
+                handle.task.cancel()
+            ready.set()
+
+        loop.call_soon_threadsafe(create)
+        ready.wait()
+        self.stats['started'] += 1
+        return handle
+
+    async def _run(self, source, sink, on_complete):
+        started = time.monotonic()
+        first_token = None
+        parts = []
+        metadata = {}
+        try:
+            async for chunk in source:
+                if isinstance(chunk, dict):
+                    metadata.update(chunk.get('metadata', {}))
+                    continue
+                if not chunk:
+                    continue
+                if first_token is None:
+                    first_token = time.monotonic() - started
+                parts.append(chunk)
+                sink('token', chunk)
+        except asyncio.CancelledError:
+            self.stats['cancelled'] += 1
+            sink('cancelled')
+            return
+        except Exception as e:
+            self.stats['failed'] += 1
+            sink('error', str(e))
+            return
+        content = ''.join(parts)
+        metadata.setdefault('time_to_first_token', first_token)
+        metadata.setdefault('processing_time', time.monotonic() - started)
+        if on_complete is not None:
+            try:
+                on_complete(content, metadata)
+            except Exception as e:
+                print(f"[WARN] Chat stream completion hook failed: {e}")
+        self.stats['completed'] += 1
+        sink('done', content, metadata)
+
+
+def sse_event(event, data):
+    return f'event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n'
+
+
+def sse_response_body(runner, source, on_complete=None, heartbeat=15.0):
+    """Start the stream now, from the view, so it runs in the request's context (trace, app
+    context); returns the generator of SSE frames, and closing that generator (client gone)
+    cancels the upstream call."""
+    events = queue.Queue()
+    handle = runner.start(source, lambda *event: events.put(event), on_complete)
+    return _sse_frames(events, handle, heartbeat)
+
+
+def _sse_frames(events, handle, heartbeat):
+    finished = False
+    try:
+        while True:
+            try:
+                event = events.get(timeout=heartbeat)
+            except queue.Empty:
+                yield ': keep-alive\n\n'  # Lets the server notice a disconnected client
+                continue
+            kind = event[0]
+            if kind == 'token':
+                yield sse_event('token', {'text': event[1]})
+            elif kind == 'done':
+                finished = True
+                yield sse_event('done', {'response': event[1], 'metadata': event[2]})
+                return
+            elif kind == 'error':
+                finished = True
+                yield sse_event('error', {'error': event[1]})
+                return
+            else:
+                finished = True
+                return
+    finally:
+        if not finished:
+            handle.cancel()
@@ -0,0 +1,6 @@
+"""
+pytest setup for the backend
+- Backend modules import each other as top-level modules, so this directory is the import root
+- The bundled virtualenv is not collected
+"""
+collect_ignore = ['venv']
@@ -0,0 +1,141 @@
+"""
+Token-aware context assembly for Mama Bear model calls
+- Each variant's system prompt is tokenized once and reused until the prompt text changes
+- Snippets (memories, plans, page context) are counted once each and added by priority until
+  the budget is spent; lower-priority snippets are dropped whole
+- The system prompt and snippets marked stable form a byte-identical prefix, identified by a
+  hash, so upstream context caching can reuse it across calls
+- Token counts come from a pluggable counter; the default estimate needs no tokenizer download
+"""
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+_PIECES = re.compile(r"\w+|[^\w\s]")
+CHARS_PER_TOKEN = 4  # Rough subword length for the fallback estimate
+
+
+def estimate_tokens(text):
+    """Word/punctuation pieces, with long words split into ~4 character subwords."""
+    return sum((len(piece) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN for piece in _PIECES.findall(text))
+
+
+class ContextSnippet:
+    __slots__ = ('text', 'priority', 'kind', 'stable', 'id')
+
+    def __init__(self, text, priority=0, kind='context', stable=False, id=None):
+        """Higher priority survives trimming first; stable snippets join the cacheable prefix."""
+        self.text = text
+        self.priority = priority
+        self.kind = kind
+        self.stable = stable
+        self.id = id
+
+
+class AssembledContext:
+    def __init__(self, system_prompt, prefix, variable, message, tokens, budget, dropped, prefix_hash, prefix_tokens):
+        self.system_prompt = system_prompt
+        self.prefix = prefix  # Stable snippets, in a deterministic order
+        self.variable = variable  # Per-call snippets that fit the budget
+        self.message = message
+        self.tokens = tokens
+        self.budget = budget
+        self.dropped = dropped
+        self.prefix_hash = prefix_hash
+        self.prefix_tokens = prefix_tokens
+
+    @property
+    def context_hash(self):
+        """Identifies everything attached besides the message: prefix plus per-call snippets."""
+        digest = hashlib.sha256(self.prefix_hash.encode('ascii'))
+        for snippet in self.variable:
+            digest.update(b'\0' + snippet.text.encode('utf-8'))
+        return digest.hexdigest()
+
+    @property
+    def over_budget(self):
+        return self.tokens > self.budget
+
+    def to_dict(self):
+        return {
+            'system_prompt': self.system_prompt,
+            'stable_context': [s.text for s in self.prefix],
+            'context': [{'kind': s.kind, 'text': s.text} for s in self.variable],
+            'message': self.message,
+            'tokens': self.tokens,
+            'budget': self.budget,
+            'dropped': self.dropped,
+            'prefix_hash': self.prefix_hash,
+            'prefix_tokens': self.prefix_tokens,
+            'context_hash': self.context_hash,
+        }
+
+
+class ContextBuilder:
+    def __init__(self, max_tokens=8192, count_tokens=None, cache_size=4096):
+        self.max_tokens = max_tokens
+        self.count_tokens = count_tokens or estimate_tokens
+        self.cache_size = cache_size
+        self._prompts = {}  # variant name -> (prompt text, tokens)
+        self._counts = OrderedDict()  # snippet text -> tokens
+        self._lock = threading.Lock()
+        self.stats = {'prompt_tokenizations': 0, 'snippet_tokenizations': 0, 'snippet_cache_hits': 0, 'dropped': 0}
+
+    def prompt_tokens(self, name, prompt):
+        with self._lock:
+            cached = self._prompts.get(name)
+            if cached is not None and cached[0] == prompt:
+                return cached[1]
+        tokens = self.count_tokens(prompt)
+        with self._lock:
+            self._prompts[name] = (prompt, tokens)
+            self.stats['prompt_tokenizations'] += 1
+        return tokens
+
+    def snippet_tokens(self, text):
+        with self._lock:
+            tokens = self._counts.get(text)
+            if tokens is not None:
+                self._counts.move_to_end(text)
+                self.stats['snippet_cache_hits'] += 1
+                return tokens
+        tokens = self.count_tokens(text)
+        with self._lock:
+            self._counts[text] = tokens
+            self.stats['snippet_tokenizations'] += 1
+            if len(self._counts) > self.cache_size:
+                self._counts.popitem(last=False)
+        return tokens
+
+    def build(self, name, system_prompt, message, snippets=(), max_tokens=None):
+        """Fit system prompt + message + as many snippets as the budget allows.
+        The prompt and message are always kept; the result reports over_budget if they alone exceed it."""
+        budget = max_tokens or self.max_tokens
+        used = self.prompt_tokens(name, system_prompt) + self.count_tokens(message)
+        # Highest priority first; ties keep the caller's order
+        ranked = sorted(enumerate(snippets), key=lambda item: (-item[1].priority, item[0]))
+        kept, dropped = [], []
+        for index, snippet in ranked:
+            tokens = self.snippet_tokens(snippet.text)
+            if used + tokens <= budget:
+                used += tokens
+                kept.append((index, snippet, tokens))
+            else:
+                dropped.append(snippet.id if snippet.id is not None else index)
+        if dropped:
+            with self._lock:
+                self.stats['dropped'] += len(dropped)
+        # Stable snippets are ordered by content so the prefix bytes don't depend on call order
+        prefix = sorted((s for _i, s, _t in kept if s.stable), key=lambda s: (s.kind, s.text))
+        variable = [s for _i, s, _t in sorted(kept, key=lambda item: item[0]) if not s.stable]
+        digest = hashlib.sha256(system_prompt.encode('utf-8'))
+        for snippet in prefix:
+            digest.update(b'\0' + snippet.text.encode('utf-8'))
+        prefix_tokens = self.prompt_tokens(name, system_prompt) + sum(t for _i, s, t in kept if s.stable)
+        return AssembledContext(system_prompt, prefix, variable, message, used, budget, dropped,
+                                digest.hexdigest(), prefix_tokens)
+
+    def get_status(self):
+        with self._lock:
+            return {**self.stats, 'prompts': len(self._prompts), 'cached_snippets': len(self._counts)}
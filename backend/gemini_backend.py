@@ -0,0 +1,149 @@
+"""
+Gemini REST backend for ModelRouter
+- generateContent for whole answers, streamGenerateContent (SSE) for token streams
+- HTTP errors become ModelCallError with the status and Retry-After, so the router can tell
+  rate limits (cooldown) from failures (circuit breaker)
+- Blocking http.client calls run in worker threads; cancelling the awaiting task (a lost hedge,
+  a closed stream) shuts the connection down, so the worker stops instead of reading on
+- The base URL can point at any Gemini-shaped server, such as the benchmark suite's fake
+"""
+import asyncio
+import http.client
+import json
+import socket
+import threading
+import urllib.parse
+
+from model_router import ModelCallError
+
+DEFAULT_BASE_URL = 'https://generativelanguage.googleapis.com'
+# request key -> generationConfig field
+GENERATION_FIELDS = {'temperature': 'temperature', 'top_p': 'topP', 'top_k': 'topK', 'max_tokens': 'maxOutputTokens',
+                     'response_mime_type': 'responseMimeType'}
+
+
+class _Call:
+    """One HTTP exchange run on a worker thread; abort() may be called from any thread."""
+
+    def __init__(self, backend, api_key, model, method, request):
+        url = urllib.parse.urlsplit(backend.base_url)
+        connection = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+        self.conn = connection(url.hostname, url.port, timeout=backend.timeout)
+        self.path = f'{url.path}/v1beta/models/{model}:{method}' + ('?alt=sse' if method == 'streamGenerateContent' else '')
+        self.body = json.dumps(_body(request)).encode('utf-8')
+        self.headers = {'Content-Type': 'application/json', 'x-goog-api-key': api_key}
+        self.aborted = threading.Event()
+
+    def open(self):
+        try:
+            self.conn.connect()
+            if self.aborted.is_set():
+                raise ModelCallError('request aborted', status=499)
+            self.conn.request('POST', self.path, body=self.body, headers=self.headers)
+            response = self.conn.getresponse()
+        except (OSError, http.client.HTTPException) as e:
+            raise ModelCallError(str(e) or type(e).__name__, status=499 if self.aborted.is_set() else 503)
+        if response.status >= 400:
+            retry_after = response.getheader('Retry-After')
+            raw = response.read()
+            try:
+                message = json.loads(raw).get('error', {}).get('message') or raw.decode('utf-8', 'replace')
+            except ValueError:
+                message = raw.decode('utf-8', 'replace') or response.reason
+            raise ModelCallError(message, status=response.status,
+                                 retry_after=float(retry_after) if retry_after else None)
+        return response
+
+    def abort(self):
+        """Stop the exchange: a connect still in progress is dropped, a blocked read fails at once."""
+        self.aborted.set()
+        sock = self.conn.sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def close(self):
+        self.conn.close()
+
+
+def _body(request):
+    body = {'contents': [{'role': 'user', 'parts': [{'text': request.get('message', '')}]}]}
+    if request.get('system_prompt'):
+        body['systemInstruction'] = {'parts': [{'text': request['system_prompt']}]}
+    generation = {name: request[key] for key, name in GENERATION_FIELDS.items() if request.get(key) is not None}
+    if generation:
+        body['generationConfig'] = generation
+    return body
+
+
+class GeminiHTTPBackend:
+    """ModelRouter backend: request dicts carry message, system_prompt and sampling settings."""
+
+    def __init__(self, base_url=DEFAULT_BASE_URL, timeout=60.0):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    @staticmethod
+    def _generate(call):
+        try:
+            payload = json.loads(call.open().read())
+        except (OSError, http.client.HTTPException) as e:
+            raise ModelCallError(str(e) or type(e).__name__, status=499 if call.aborted.is_set() else 503)
+        finally:
+            call.close()
+        return {'content': _text(payload), 'usage': {'total_tokens': payload.get('usageMetadata', {}).get('totalTokenCount', 0)}}
+
+    async def generate(self, api_key, model, request):
+        call = _Call(self, api_key, model, 'generateContent', request)
+        try:
+            return await asyncio.to_thread(self._generate, call)
+        except asyncio.CancelledError:
+            call.abort()
+            raise
+
+    async def stream(self, api_key, model, request):
+        """Yield text chunks as the SSE frames arrive."""
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue()
+        call = _Call(self, api_key, model, 'streamGenerateContent', request)
+
+        def put(item):
+            if not call.aborted.is_set():
+                loop.call_soon_threadsafe(chunks.put_nowait, item)
+
+        def read():
+            try:
+                response = call.open()
+                for line in response:
+                    if line.startswith(b'data: '):
+                        put(_text(json.loads(line[6:])))
+                put(None)
+            except (OSError, http.client.HTTPException) as e:
+                put(ModelCallError(str(e) or type(e).__name__, status=503))
+            except Exception as e:
+                put(e)
+            finally:
+                call.close()
+
+        loop.run_in_executor(None, read)
+        finished = False
+        try:
+            while True:
+                chunk = await chunks.get()
+                if chunk is None:
+                    finished = True
+                    return
+                if isinstance(chunk, Exception):
+                    finished = True
+                    raise chunk
+                yield chunk
+        finally:
+            if not finished:
+                call.abort()  # Cancelled or closed early: stop reading the upstream stream
+
+
+def _text(payload):
+    candidates = payload.get('candidates') or [{}]
+    return ''.join(part.get('text', '') for part in candidates[0].get('content', {}).get('parts', []))
@@ -0,0 +1,150 @@
+"""
+Fixed-memory latency histograms for Mama Bear monitoring
+- Log-bucketed (HDR-style) histograms: constant relative error, constant memory
+- Sliding-window views over the last 1m / 5m / 1h from rings of time slots
+- Registry keyed by metric and dimension (model, billing account, variant)
+"""
+import math
+import threading
+import time
+from array import array
+
+WINDOWS = {'1m': 60, '5m': 300, '1h': 3600}
+PERCENTILES = (50, 90, 99)
+
+
+class LogHistogram:
+    """Buckets grow by 2**(1/sub_buckets); values below min_value land in a zero bucket."""
+
+    def __init__(self, min_value=1e-3, max_value=600.0, sub_buckets=8):
+        self.min_value = min_value
+        self.max_value = max_value
+        self.sub_buckets = sub_buckets
+        self._scale = sub_buckets / math.log(2)
+        self.size = int(math.ceil(math.log(max_value / min_value) * self._scale)) + 2
+        self.counts = array('Q', bytes(8 * self.size))
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def _index(self, value):
+        if value < self.min_value:
+            return 0
+        return min(self.size - 1, int(math.log(value / self.min_value) * self._scale) + 1)
+
+    def _value_at(self, index):
+        if index == 0:
+            return 0.0
+        # Geometric midpoint of the bucket
+        return self.min_value * math.exp((index - 0.5) / self._scale)
+
+    def record(self, value):
+        self.counts[self._index(value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        for i, c in enumerate(other.counts):
+            if c:
+                self.counts[i] += c
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, p):
+        if not self.count:
+            return 0.0
+        rank = max(1, int(math.ceil(self.count * p / 100.0)))
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank:
+                return min(self._value_at(i), self.max)
+        return self.max
+
+    def empty_like(self):
+        return LogHistogram(self.min_value, self.max_value, self.sub_buckets)
+
+    def summary(self):
+        result = {'count': self.count, 'mean': self.total / self.count if self.count else 0.0, 'max': self.max}
+        for p in PERCENTILES:
+            result[f'p{p}'] = self.percentile(p)
+        return result
+
+
+class WindowedHistogram:
+    """Cumulative histogram plus 10s slots (for 1m/5m) and 60s slots (for 1h), allocated lazily."""
+
+    TIERS = ((10, 30), (60, 60))  # (slot seconds, slots kept)
+
+    def __init__(self, **histogram_args):
+        self._args = histogram_args
+        self.total = LogHistogram(**histogram_args)
+        self._slots = [{} for _ in self.TIERS]
+
+    def record(self, value, now=None):
+        now = time.time() if now is None else now
+        self.total.record(value)
+        for (width, keep), slots in zip(self.TIERS, self._slots):
+            slot = int(now // width)
+            hist = slots.get(slot)
+            if hist is None:
+                for old in [s for s in slots if s <= slot - keep]:
+                    del slots[old]
+                hist = slots[slot] = LogHistogram(**self._args)
+            hist.record(value)
+
+    def window(self, seconds, now=None):
+        now = time.time() if now is None else now
+        tier = 0 if seconds <= self.TIERS[0][0] * self.TIERS[0][1] else 1
+        width, _keep = self.TIERS[tier]
+        oldest = int(now // width) - int(math.ceil(seconds / width)) + 1
+        merged = self.total.empty_like()
+        for slot, hist in self._slots[tier].items():
+            if slot >= oldest:
+                merged.merge(hist)
+        return merged
+
+
+class HistogramRegistry:
+    """Histograms per (metric, dimension, value), e.g. ('processing_time', 'model', 'gemini-2.5-pro')."""
+
+    def __init__(self, metric_args=None):
+        self.metric_args = metric_args or {}
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def record(self, metric, value, dimensions):
+        now = time.time()
+        with self._lock:
+            for dimension, label in list(dimensions.items()) + [('all', 'all')]:
+                key = (metric, dimension, str(label))
+                series = self._series.get(key)
+                if series is None:
+                    series = self._series[key] = WindowedHistogram(**self.metric_args.get(metric, {}))
+                series.record(value, now)
+
+    def summary(self, window=None):
+        """Nested {metric: {dimension: {label: stats}}}; window is a WINDOWS key or None for cumulative."""
+        now = time.time()
+        result = {}
+        with self._lock:
+            for (metric, dimension, label), series in self._series.items():
+                hist = series.total if window is None else series.window(WINDOWS[window], now)
+                result.setdefault(metric, {}).setdefault(dimension, {})[label] = hist.summary()
+        return result
+
+    def percentile(self, metric, dimension, label, p, window='5m'):
+        """Percentile of one series over a window, with its sample count; (None, 0) if unseen."""
+        with self._lock:
+            series = self._series.get((metric, dimension, str(label)))
+            if series is None:
+                return None, 0
+            hist = series.window(WINDOWS[window])
+        return hist.percentile(p), hist.count
+
+    def items(self):
+        with self._lock:
+            return list(self._series.items())
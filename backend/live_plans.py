@@ -0,0 +1,240 @@
+"""
+Versioned live plan store with delta broadcasts
+- Each user has a version counter; every plan/subtask change bumps it and queues a
+  JSON-patch style op (add / remove / replace, paths keyed by plan and subtask id)
+- Ops queued within one tick are coalesced per path and sent to the user's room as one
+  `agent_plans_delta` frame {from_version, to_version, ops}
+- Recent frames are kept so a reconnecting client can resync from its last version;
+  anything older gets a full `agent_plans_update` snapshot instead
+- Op values are read from the store at flush time, so re-applying a frame is harmless
+- Versions restart with the process, so every frame and snapshot carries the store's random
+  epoch; a client resyncing with another epoch's version gets a snapshot
+"""
+import atexit
+import copy
+import threading
+import uuid
+from collections import deque
+
+DELTA_EVENT = 'agent_plans_delta'
+SNAPSHOT_EVENT = 'agent_plans_update'
+
+
+def room_for(user_id):
+    return f'plans:{user_id}'
+
+
+def _split(path):
+    return path.strip('/').split('/')
+
+
+class _UserPlans:
+    def __init__(self, history):
+        self.plans = {}  # plan id -> plan dict, subtasks as a list
+        self.version = 0
+        self.flushed_version = 0
+        self.pending = {}  # path -> op name, insertion ordered
+        self.frames = deque(maxlen=history)
+
+
+class PlanStore:
+    def __init__(self, emit, tick=0.1, history=256):
+        """emit(event, data, room) delivers a frame, e.g. lambda e, d, r: socketio.emit(e, d, to=r)."""
+        self.emit = emit
+        self.tick = tick
+        self.history = history
+        self.epoch = uuid.uuid4().hex
+        self._users = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = {'frames': 0, 'ops_queued': 0, 'ops_sent': 0, 'snapshots': 0}
+
+    def _user(self, user_id):
+        user = self._users.get(user_id)
+        if user is None:
+            user = self._users[user_id] = _UserPlans(self.history)
+        return user
+
+    def _queue(self, user, op, path):
+        user.version += 1
+        self.stats['ops_queued'] += 1
+        # A change to a path supersedes anything queued beneath it
+        prefix = path + '/'
+        for queued in [p for p in user.pending if p.startswith(prefix)]:
+            del user.pending[queued]
+        # Changes inside a plan added this tick ride along with the add
+        parts = _split(path)
+        if len(parts) > 2 and user.pending.get('/' + '/'.join(parts[:2])) == 'add':
+            return
+        user.pending.pop(path, None)
+        user.pending[path] = op
+        self.start()
+
+    # Mutations
+
+    def upsert_plan(self, user_id, plan):
+        with self._lock:
+            user = self._user(user_id)
+            user.plans[plan['id']] = copy.deepcopy(plan)
+            self._queue(user, 'add', f"/plans/{plan['id']}")
+
+    def remove_plan(self, user_id, plan_id):
+        with self._lock:
+            user = self._user(user_id)
+            if user.plans.pop(plan_id, None) is not None:
+                self._queue(user, 'remove', f'/plans/{plan_id}')
+
+    def update_plan(self, user_id, plan_id, **fields):
+        with self._lock:
+            user = self._user(user_id)
+            plan = user.plans.get(plan_id)
+            if plan is None:
+                return False
+            for name, value in fields.items():
+                if plan.get(name) != value:
+                    plan[name] = value
+                    self._queue(user, 'replace', f'/plans/{plan_id}/{name}')
+            return True
+
+    def update_subtask(self, user_id, plan_id, subtask_id, **fields):
+        with self._lock:
+            user = self._user(user_id)
+            subtask = self._find_subtask(user, plan_id, subtask_id)
+            if subtask is None:
+                return False
+            for name, value in fields.items():
+                if subtask.get(name) != value:
+                    subtask[name] = value
+                    self._queue(user, 'replace', f'/plans/{plan_id}/subtasks/{subtask_id}/{name}')
+            return True
+
+    @staticmethod
+    def _find_subtask(user, plan_id, subtask_id):
+        plan = user.plans.get(plan_id)
+        if plan is None:
+            return None
+        return next((s for s in plan.get('subtasks', []) if s.get('id') == subtask_id), None)
+
+    # Reads
+
+    def snapshot(self, user_id):
+        with self._lock:
+            user = self._user(user_id)
+            self.stats['snapshots'] += 1
+            return {'epoch': self.epoch, 'version': user.version, 'plans': copy.deepcopy(list(user.plans.values()))}
+
+    def sync(self, user_id, since_version=None, epoch=None):
+        """(event, data) that brings a client at since_version of epoch up to date."""
+        if epoch != self.epoch:
+            since_version = None  # A version from before a restart means nothing here
+        with self._lock:
+            user = self._user(user_id)
+            if since_version is not None and user.flushed_version <= since_version <= user.version:
+                # Nothing flushed since; queued changes arrive with the next frame
+                return DELTA_EVENT, {'epoch': self.epoch, 'from_version': since_version, 'to_version': since_version,
+                                     'ops': []}
+            frames = user.frames
+            if since_version is not None and frames and frames[0]['from_version'] <= since_version:
+                ops = [op for frame in frames if frame['to_version'] > since_version for op in frame['ops']]
+                return DELTA_EVENT, {'epoch': self.epoch, 'from_version': since_version,
+                                     'to_version': user.flushed_version, 'ops': ops}
+        return SNAPSHOT_EVENT, self.snapshot(user_id)
+
+    def _value(self, user, path):
+        parts = _split(path)
+        node = user.plans.get(parts[1])
+        if len(parts) == 2:
+            return copy.deepcopy(node)
+        if len(parts) == 3:
+            return copy.deepcopy(node.get(parts[2])) if node else None
+        subtask = self._find_subtask(user, parts[1], parts[3])
+        return copy.deepcopy(subtask.get(parts[4])) if subtask else None
+
+    # Broadcast
+
+    def flush(self):
+        """Send one coalesced frame per user with queued changes."""
+        frames = []
+        with self._lock:
+            for user_id, user in self._users.items():
+                if not user.pending:
+                    continue
+                ops = []
+                for path, op in user.pending.items():
+                    if op == 'remove':
+                        ops.append({'op': 'remove', 'path': path})
+                    else:
+                        ops.append({'op': op, 'path': path, 'value': self._value(user, path)})
+                frame = {'epoch': self.epoch, 'from_version': user.flushed_version, 'to_version': user.version,
+                         'ops': ops}
+                user.frames.append(frame)
+                user.flushed_version = user.version
+                user.pending = {}
+                frames.append((room_for(user_id), frame))
+                self.stats['frames'] += 1
+                self.stats['ops_sent'] += len(ops)
+        for room, frame in frames:
+            try:
+                self.emit(DELTA_EVENT, frame, room)
+            except Exception as e:
+                print(f"[WARN] Plan delta broadcast to {room} failed: {e}")
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='plan-store-flush', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.tick):
+            self.flush()
+
+
+def register_plan_handlers(socketio, store):
+    """`get_agent_plans` joins the user's room and syncs (optionally from since_version of epoch);
+    `agent_plan_action` (run / pause / reassign) updates the subtask and is broadcast as a delta."""
+    from flask_socketio import emit, join_room
+
+    @socketio.on('get_agent_plans')
+    def handle_get_agent_plans(data):
+        user_id = data.get('user_id', 'default_user')
+        join_room(room_for(user_id))
+        event, payload = store.sync(user_id, data.get('since_version'), data.get('epoch'))
+        emit(event, payload)
+
+    @socketio.on('agent_plan_action')
+    def handle_agent_plan_action(data):
+        user_id = data.get('user_id', 'default_user')
+        action = data.get('action')
+        fields = {
+            'run': {'status': 'in-progress'},
+            'pause': {'status': 'paused'},
+            'reassign': {'agent': data.get('new_agent')},
+        }.get(action)
+        if fields is None:
+            emit('agent_plan_error', {'error': f'Unknown plan action: {action}'})
+            return
+        if not store.update_subtask(user_id, data.get('plan_id'), data.get('subtask_id'), **fields):
+            emit('agent_plan_error', {'error': 'Plan or subtask not found'})
+
+
+def init_live_plans(app, socketio):
+    """Create the app's PlanStore (app.extensions['live_plans']) and register its SocketIO handlers."""
+    store = PlanStore(
+        lambda event, data, room: socketio.emit(event, data, to=room),
+        tick=app.config.get('PLAN_DELTA_TICK_MS', 100) / 1000.0,
+        history=app.config.get('PLAN_DELTA_HISTORY', 256),
+    )
+    app.extensions['live_plans'] = store
+    register_plan_handlers(socketio, store)
+    return store
@@ -2,24 +2,86 @@
 Mama Bear Agent Core Logic
 - Proactive routines, usage/quota tracking, orchestration hooks
 - Extensible for specialist variants and Scout agent
+- Tasks run through an attached TaskScheduler (agent_scheduler.py) when one is present
+- Plans are published to an attached PlanStore (live_plans.py); subtask status changes reach
+  the user's plan viewers as deltas
 """
+import asyncio
 import datetime
+import threading
 class MamaBearAgent:
     def __init__(self, config, quota_manager, log_func):
         self.config = config
         self.quota_manager = quota_manager
         self.log = log_func
         self.state = {}
+        self._state_lock = threading.Lock()
+        self.scheduler = None
+        self.plans = None
         self.log('MamaBearAgent initialized', level='INFO')
+    def attach_scheduler(self, scheduler):
+        self.scheduler = scheduler
+    def attach_plan_store(self, store):
+        self.plans = store
     def daily_briefing(self):
         # Example: Log daily status and quota usage
         status = self.quota_manager.get_status()
         self.log(f"Daily briefing: {status}", level='INFO')
     def perform_task(self, task):
-        # Placeholder for agentic task execution
-        self.log(f"Performing task: {task}", level='INFO')
-        # ...complex logic can be designed by Dev Agent...
-        pass
+        """Queue a task ({'key', 'title', 'priority', 'dependencies', 'deadline', 'details'}) on the
+        scheduler and return its future; without a scheduler the task is only logged."""
+        if self.scheduler is None:
+            self.log(f"Performing task: {task}", level='INFO')
+            return None
+        self.log(f"Scheduling task: {task.get('key') or task.get('id')} ({task.get('priority', 'medium')})", level='DEBUG')
+        return self.scheduler.submit(task)
+    def run_plan(self, user_id, plan):
+        """Publish a plan to the user's viewers and schedule its subtasks; returns {key: future}
+        (empty without a scheduler). Subtask status follows the tasks as they run."""
+        if self.plans is not None:
+            self.plans.upsert_plan(user_id, plan)
+        if self.scheduler is None:
+            return {}
+        subtasks = []
+        for subtask in plan.get('subtasks', []):
+            details = {**(subtask.get('details') or {}),
+                       'plan': {'user_id': user_id, 'plan_id': plan['id'], 'subtask_id': subtask['id']}}
+            subtasks.append({**subtask, 'details': details})
+        return self.scheduler.submit_plan({**plan, 'subtasks': subtasks})
+    def update_plan(self, user_id, plan_id, **fields):
+        if self.plans is not None:
+            self.plans.update_plan(user_id, plan_id, **fields)
+    def update_subtask(self, user_id, plan_id, subtask_id, **fields):
+        if self.plans is not None:
+            self.plans.update_subtask(user_id, plan_id, subtask_id, **fields)
+    def remove_plan(self, user_id, plan_id):
+        if self.plans is not None:
+            self.plans.remove_plan(user_id, plan_id)
+    async def execute_task(self, task):
+        # Placeholder for agentic task execution; runs on the scheduler's loop
+        details = task.get('details')
+        plan = details.get('plan') if isinstance(details, dict) else None
+        status = 'failed'
+        if plan:
+            self.update_subtask(plan['user_id'], plan['plan_id'], plan['subtask_id'], status='in-progress')
+        try:
+            self.log(f"Performing task: {task['key']}", level='INFO')
+            # ...complex logic can be designed by Dev Agent...
+            self.update_state(f"task:{task['key']}", 'completed')
+            status = 'completed'
+            return None
+        except asyncio.CancelledError:
+            status = 'cancelled'
+            raise
+        finally:
+            if plan:
+                self.update_subtask(plan['user_id'], plan['plan_id'], plan['subtask_id'], status=status)
     def update_state(self, key, value):
-        self.state[key] = value
+        with self._state_lock:
+            self.state[key] = value
         self.log(f"State updated: {key}={value}", level='DEBUG')
+    def get_state(self, key=None, default=None):
+        with self._state_lock:
+            if key is None:
+                return dict(self.state)
+            return self.state.get(key, default)
@@ -1,7 +1,8 @@
 # backend/config/mama_bear_config.py
+import functools
 import os
-from typing import Dict, Any
-from dataclasses import dataclass
+from typing import Dict, Any, List
+from dataclasses import dataclass, field
 
 @dataclass
 class MamaBearConfig:
@@ -12,6 +13,10 @@ class MamaBearConfig:
     GEMINI_API_KEY_BACKUP: str = os.getenv('GEMINI_API_KEY_BACKUP', '')  # Add your second key here
     
     # Model Configuration
+    GEMINI_API_BASE_URL: str = os.getenv('GEMINI_API_BASE_URL', 'https://generativelanguage.googleapis.com')
+    GEMINI_MODELS: List[str] = field(default_factory=lambda: [
+        'gemini-2.5-pro', 'gemini-2.5-flash', 'gemini-2.0-flash',
+    ])  # Routed across both keys, each (key, model) with its own circuit breaker
     DEFAULT_TEMPERATURE: float = 0.7
     DEFAULT_MAX_TOKENS: int = 8192
     DEFAULT_TOP_P: float = 0.95
@@ -19,6 +24,8 @@ class MamaBearConfig:
     
     # Quota Management
     QUOTA_SAFETY_MARGIN: float = 0.1  # 10% safety margin
+    QUOTA_DB_PATH: str = os.getenv('QUOTA_DB_PATH', 'quota.db')  # Shared by all worker processes
+    QUOTA_RESERVATION_TTL: int = 120  # Seconds before an uncommitted reservation is released
     MAX_FALLBACK_ATTEMPTS: int = 6
     BASE_FALLBACK_DELAY: float = 1.0
     MAX_FALLBACK_DELAY: float = 30.0
@@ -27,12 +34,96 @@ class MamaBearConfig:
     HEALTH_CHECK_INTERVAL: int = 300  # 5 minutes
     ERROR_THRESHOLD: int = 3  # Consecutive errors before marking unhealthy
     RECOVERY_TIMEOUT: int = 1800  # 30 minutes before attempting recovery
+    CIRCUIT_PROBE_INTERVAL: int = 15  # Seconds between sweeps for half-open endpoints to probe
     
     # Performance Optimization
-    ENABLE_REQUEST_BATCHING: bool = True
+    ENABLE_REQUEST_HEDGING: bool = False  # Opt-in; only variants with hedge_requests are hedged
+    HEDGE_BUDGET_RATIO: float = 0.05  # Hedges allowed as a share of all calls, across workers
+    HEDGE_PERCENTILE: int = 90  # Hedge once a call outlives this percentile of its variant's latency
+    HEDGE_MIN_SAMPLES: int = 20  # Below this many recent samples, HEDGE_DEFAULT_DELAY_MS is used
+    HEDGE_DEFAULT_DELAY_MS: int = 2000
+    ENABLE_REQUEST_BATCHING: bool = False  # Packs concurrent background prompts for a variant into one routed call
     BATCH_SIZE: int = 5
+    BATCH_MAX_WAIT_MS: int = 50  # Longest a request waits for its batch to fill
+    VARIANT_ROUTER_CACHE_SIZE: int = 4096  # Routing decisions kept for repeated messages
     ENABLE_RESPONSE_CACHING: bool = True
+    STREAM_HEARTBEAT_SECONDS: int = 15  # SSE keep-alive; also how soon a closed client is noticed
     CACHE_TTL: int = 3600  # 1 hour
+    RESPONSE_CACHE_MAX_BYTES: int = 64 * 1024 * 1024  # In-memory LRU budget
+    RESPONSE_CACHE_DISK_PATH: str = os.getenv('RESPONSE_CACHE_DISK_PATH', '')  # Empty disables the disk tier
+    RESPONSE_CACHE_DISK_MAX_BYTES: int = 512 * 1024 * 1024
+    ENABLE_SEMANTIC_CACHE: bool = False  # Near-duplicate matching; needs numpy
+    SEMANTIC_CACHE_THRESHOLD: float = 0.85  # Cosine similarity required for a hit
+    SEMANTIC_CACHE_CAPACITY: int = 1000  # Entries kept per variant/model namespace
+    SEMANTIC_CACHE_DIM: int = 512
+    SEMANTIC_CACHE_MAX_NAMESPACES: int = 64  # Namespaces kept; least recently used dropped first
+    
+    # Taskmaster Database
+    DATABASE_URL: str = os.getenv('DATABASE_URL', 'sqlite:///podplay.db')
+    SQLITE_JOURNAL_MODE: str = 'WAL'  # Readers no longer block on the agent's writes
+    SQLITE_SYNCHRONOUS: str = 'NORMAL'  # Durable under WAL, without an fsync per commit
+    SQLITE_CACHE_SIZE_KB: int = 65536
+    SQLITE_MMAP_SIZE: int = 268435456  # 256 MB
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: int = 30
+    ENABLE_READ_ENGINE: bool = True  # Separate query_only engine for GET endpoints
+    DB_READ_POOL_SIZE: int = 10
+    
+    # Taskmaster Storage
+    TASKMASTER_WRITE_BATCH_SIZE: int = 100  # Rows per write-behind transaction
+    TASKMASTER_WRITE_FLUSH_MS: int = 50  # Max time a row waits for its batch
+    TASKMASTER_WRITE_QUEUE_SIZE: int = 10000  # Bounded queue; POSTs get 503 when full
+    TASKMASTER_MAX_BULK_RECORDS: int = 5000
+    SNAPSHOT_COMPRESSION_LEVEL: int = 6  # zlib level for SnapshotBlob bodies
+    SNAPSHOT_DELTA_ENABLED: bool = True  # Delta-encode against the previous snapshot of the same agent/session
+    SNAPSHOT_MAX_DELTA_DEPTH: int = 8  # Longest delta chain a fetch has to replay
+    SNAPSHOT_CACHE_BYTES: int = 32 * 1024 * 1024
+    
+    # Log Retention
+    RETENTION_ENABLED: bool = True
+    LOG_RETENTION_HOURS: Dict[str, int] = field(default_factory=lambda: {
+        'DEBUG': 6,
+        'INFO': 24 * 7,
+        'WARNING': 24 * 30,
+        'ERROR': 24 * 180,
+        'CRITICAL': 24 * 365,
+    })
+    LOG_RETENTION_DEFAULT_HOURS: int = 24 * 30  # Levels missing from LOG_RETENTION_HOURS
+    RETENTION_INTERVAL: int = 600  # Seconds between compaction runs
+    RETENTION_CHUNK_SIZE: int = 5000  # Rows rolled up and deleted per transaction
+    RETENTION_VACUUM_PAGES: int = 2000  # Pages released per incremental VACUUM
+    
+    # Live Plans
+    PLAN_DELTA_TICK_MS: int = 100  # Plan changes within one tick go out as a single delta frame
+    PLAN_DELTA_HISTORY: int = 256  # Frames kept per user for resync; older clients get a snapshot
+    
+    # Agent Task Scheduler
+    SCHEDULER_LIMITS: Dict[str, int] = field(default_factory=lambda: {
+        'critical': 4, 'high': 2, 'medium': 2, 'low': 1,
+    })  # Agent tasks running at once, per priority
+    SCHEDULER_MAX_WORKERS: int = 6  # Cap across all priorities
+    
+    # Scrapybara VM Pool
+    SCRAPYBARA_BACKEND: str = os.getenv('SCRAPYBARA_BACKEND', 'scrapybara')  # 'fake' runs the pool offline
+    VM_POOL_TARGETS: Dict[str, int] = field(default_factory=lambda: {'ubuntu': 1})  # Idle warm VMs per vm_type
+    VM_POOL_MAX_SIZE: int = 5  # Instances per vm_type, leased or idle
+    VM_POOL_IDLE_TIMEOUT: int = 600  # Seconds before a surplus idle VM is terminated
+    VM_POOL_CHECK_INTERVAL: int = 30  # Seconds between refill/reap sweeps
+    VM_LEASE_TIMEOUT: int = 120  # Longest start_vm waits for a free instance
+    VM_STATUS_INTERVAL: int = 5  # Seconds between bulk status sweeps
+    VM_STATUS_CONCURRENCY: int = 8  # Provider status calls in flight per sweep
+    VM_STATUS_CHUNK_SIZE: int = 25  # Instances per provider status call
+    
+    # Request Tracing
+    TRACING_ENABLED: bool = True
+    TRACE_BUFFER_SIZE: int = 500  # Finished requests kept for /api/debug/traces
+    TRACE_DEBUG_ENDPOINTS: bool = os.getenv('TRACE_DEBUG_ENDPOINTS', '0') == '1'  # Route /api/debug/traces; off by default
+    TRACE_DEBUG_TOKEN: str = os.getenv('TRACE_DEBUG_TOKEN', '')  # Bearer token the debug endpoints require, when set
+    PROFILE_SAMPLE_RATE: float = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))  # Share of requests profiled, e.g. 0.01
+    PROFILE_INTERVAL_MS: int = 5  # Stack sampling period while a profiled request runs
+    PROFILE_DIR: str = os.getenv('PROFILE_DIR', '')  # Collapsed stacks written here as <request id>.folded
     
     # Logging
     LOG_LEVEL: str = os.getenv('LOG_LEVEL', 'INFO')
@@ -54,40 +145,135 @@ class MamaBearConfig:
 
 # --- Cascade Addition: Flask config loader ---
 def load_config() -> dict:
-    """Return config as a dict for Flask app.config.from_mapping."""
+    """Return config as a dict for Flask app.config.from_mapping.
+    Built once per process; callers get their own shallow copy."""
+    return dict(_build_config())
+
+@functools.lru_cache(maxsize=1)
+def _build_config() -> dict:
     cfg = MamaBearConfig()
-    return {
+    config = {
         'GEMINI_API_KEY_PRIMARY': cfg.GEMINI_API_KEY_PRIMARY,
         'GEMINI_API_KEY_BACKUP': cfg.GEMINI_API_KEY_BACKUP,
+        'GEMINI_API_BASE_URL': cfg.GEMINI_API_BASE_URL,
+        'GEMINI_MODELS': cfg.GEMINI_MODELS,
         'DEFAULT_TEMPERATURE': cfg.DEFAULT_TEMPERATURE,
         'DEFAULT_MAX_TOKENS': cfg.DEFAULT_MAX_TOKENS,
         'DEFAULT_TOP_P': cfg.DEFAULT_TOP_P,
         'DEFAULT_TOP_K': cfg.DEFAULT_TOP_K,
         'QUOTA_SAFETY_MARGIN': cfg.QUOTA_SAFETY_MARGIN,
+        'QUOTA_DB_PATH': cfg.QUOTA_DB_PATH,
+        'QUOTA_RESERVATION_TTL': cfg.QUOTA_RESERVATION_TTL,
         'MAX_FALLBACK_ATTEMPTS': cfg.MAX_FALLBACK_ATTEMPTS,
         'BASE_FALLBACK_DELAY': cfg.BASE_FALLBACK_DELAY,
         'MAX_FALLBACK_DELAY': cfg.MAX_FALLBACK_DELAY,
         'HEALTH_CHECK_INTERVAL': cfg.HEALTH_CHECK_INTERVAL,
         'ERROR_THRESHOLD': cfg.ERROR_THRESHOLD,
         'RECOVERY_TIMEOUT': cfg.RECOVERY_TIMEOUT,
+        'CIRCUIT_PROBE_INTERVAL': cfg.CIRCUIT_PROBE_INTERVAL,
+        'ENABLE_REQUEST_HEDGING': cfg.ENABLE_REQUEST_HEDGING,
+        'HEDGE_BUDGET_RATIO': cfg.HEDGE_BUDGET_RATIO,
+        'HEDGE_PERCENTILE': cfg.HEDGE_PERCENTILE,
+        'HEDGE_MIN_SAMPLES': cfg.HEDGE_MIN_SAMPLES,
+        'HEDGE_DEFAULT_DELAY_MS': cfg.HEDGE_DEFAULT_DELAY_MS,
         'ENABLE_REQUEST_BATCHING': cfg.ENABLE_REQUEST_BATCHING,
         'BATCH_SIZE': cfg.BATCH_SIZE,
+        'BATCH_MAX_WAIT_MS': cfg.BATCH_MAX_WAIT_MS,
+        'VARIANT_ROUTER_CACHE_SIZE': cfg.VARIANT_ROUTER_CACHE_SIZE,
         'ENABLE_RESPONSE_CACHING': cfg.ENABLE_RESPONSE_CACHING,
+        'STREAM_HEARTBEAT_SECONDS': cfg.STREAM_HEARTBEAT_SECONDS,
         'CACHE_TTL': cfg.CACHE_TTL,
+        'RESPONSE_CACHE_MAX_BYTES': cfg.RESPONSE_CACHE_MAX_BYTES,
+        'RESPONSE_CACHE_DISK_PATH': cfg.RESPONSE_CACHE_DISK_PATH,
+        'RESPONSE_CACHE_DISK_MAX_BYTES': cfg.RESPONSE_CACHE_DISK_MAX_BYTES,
+        'ENABLE_SEMANTIC_CACHE': cfg.ENABLE_SEMANTIC_CACHE,
+        'SEMANTIC_CACHE_THRESHOLD': cfg.SEMANTIC_CACHE_THRESHOLD,
+        'SEMANTIC_CACHE_CAPACITY': cfg.SEMANTIC_CACHE_CAPACITY,
+        'SEMANTIC_CACHE_DIM': cfg.SEMANTIC_CACHE_DIM,
+        'SEMANTIC_CACHE_MAX_NAMESPACES': cfg.SEMANTIC_CACHE_MAX_NAMESPACES,
+        'TASKMASTER_WRITE_BATCH_SIZE': cfg.TASKMASTER_WRITE_BATCH_SIZE,
+        'TASKMASTER_WRITE_FLUSH_MS': cfg.TASKMASTER_WRITE_FLUSH_MS,
+        'TASKMASTER_WRITE_QUEUE_SIZE': cfg.TASKMASTER_WRITE_QUEUE_SIZE,
+        'TASKMASTER_MAX_BULK_RECORDS': cfg.TASKMASTER_MAX_BULK_RECORDS,
+        'SNAPSHOT_COMPRESSION_LEVEL': cfg.SNAPSHOT_COMPRESSION_LEVEL,
+        'SNAPSHOT_DELTA_ENABLED': cfg.SNAPSHOT_DELTA_ENABLED,
+        'SNAPSHOT_MAX_DELTA_DEPTH': cfg.SNAPSHOT_MAX_DELTA_DEPTH,
+        'SNAPSHOT_CACHE_BYTES': cfg.SNAPSHOT_CACHE_BYTES,
+        'RETENTION_ENABLED': cfg.RETENTION_ENABLED,
+        'LOG_RETENTION_HOURS': cfg.LOG_RETENTION_HOURS,
+        'LOG_RETENTION_DEFAULT_HOURS': cfg.LOG_RETENTION_DEFAULT_HOURS,
+        'RETENTION_INTERVAL': cfg.RETENTION_INTERVAL,
+        'RETENTION_CHUNK_SIZE': cfg.RETENTION_CHUNK_SIZE,
+        'RETENTION_VACUUM_PAGES': cfg.RETENTION_VACUUM_PAGES,
+        'PLAN_DELTA_TICK_MS': cfg.PLAN_DELTA_TICK_MS,
+        'PLAN_DELTA_HISTORY': cfg.PLAN_DELTA_HISTORY,
+        'SCHEDULER_LIMITS': cfg.SCHEDULER_LIMITS,
+        'SCHEDULER_MAX_WORKERS': cfg.SCHEDULER_MAX_WORKERS,
+        'SCRAPYBARA_BACKEND': cfg.SCRAPYBARA_BACKEND,
+        'VM_POOL_TARGETS': cfg.VM_POOL_TARGETS,
+        'VM_POOL_MAX_SIZE': cfg.VM_POOL_MAX_SIZE,
+        'VM_POOL_IDLE_TIMEOUT': cfg.VM_POOL_IDLE_TIMEOUT,
+        'VM_POOL_CHECK_INTERVAL': cfg.VM_POOL_CHECK_INTERVAL,
+        'VM_LEASE_TIMEOUT': cfg.VM_LEASE_TIMEOUT,
+        'VM_STATUS_INTERVAL': cfg.VM_STATUS_INTERVAL,
+        'VM_STATUS_CONCURRENCY': cfg.VM_STATUS_CONCURRENCY,
+        'VM_STATUS_CHUNK_SIZE': cfg.VM_STATUS_CHUNK_SIZE,
+        'TRACING_ENABLED': cfg.TRACING_ENABLED,
+        'TRACE_BUFFER_SIZE': cfg.TRACE_BUFFER_SIZE,
+        'TRACE_DEBUG_ENDPOINTS': cfg.TRACE_DEBUG_ENDPOINTS,
+        'TRACE_DEBUG_TOKEN': cfg.TRACE_DEBUG_TOKEN,
+        'PROFILE_SAMPLE_RATE': cfg.PROFILE_SAMPLE_RATE,
+        'PROFILE_INTERVAL_MS': cfg.PROFILE_INTERVAL_MS,
+        'PROFILE_DIR': cfg.PROFILE_DIR,
         'LOG_LEVEL': cfg.LOG_LEVEL,
         'LOG_MODEL_USAGE': cfg.LOG_MODEL_USAGE,
         'LOG_QUOTA_WARNINGS': cfg.LOG_QUOTA_WARNINGS,
-        'SQLALCHEMY_DATABASE_URI': 'sqlite:///podplay.db',
+        'SQLALCHEMY_DATABASE_URI': cfg.DATABASE_URL,
         'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'SQLITE_JOURNAL_MODE': cfg.SQLITE_JOURNAL_MODE,
+        'SQLITE_SYNCHRONOUS': cfg.SQLITE_SYNCHRONOUS,
+        'SQLITE_CACHE_SIZE_KB': cfg.SQLITE_CACHE_SIZE_KB,
+        'SQLITE_MMAP_SIZE': cfg.SQLITE_MMAP_SIZE,
+        'SQLITE_BUSY_TIMEOUT_MS': cfg.SQLITE_BUSY_TIMEOUT_MS,
     }
+    config.update(_engine_options(cfg))
+    return config
+
+def _engine_options(cfg: MamaBearConfig) -> dict:
+    """Pool sizing for the primary engine plus the optional read-only bind."""
+    url = cfg.DATABASE_URL
+    if url.startswith('sqlite') and (url.rstrip('/') in ('sqlite:', 'sqlite+pysqlite:') or ':memory:' in url):
+        return {}  # In-memory SQLite is a single static connection
+    options = {
+        'SQLALCHEMY_ENGINE_OPTIONS': {
+            'pool_size': cfg.DB_POOL_SIZE,
+            'max_overflow': cfg.DB_MAX_OVERFLOW,
+            'pool_timeout': cfg.DB_POOL_TIMEOUT,
+        }
+    }
+    if cfg.ENABLE_READ_ENGINE:
+        options['SQLALCHEMY_BINDS'] = {
+            'readonly': {
+                'url': url,
+                'pool_size': cfg.DB_READ_POOL_SIZE,
+                'max_overflow': cfg.DB_MAX_OVERFLOW,
+                'pool_timeout': cfg.DB_POOL_TIMEOUT,
+            }
+        }
+    return options
 
 # backend/services/mama_bear_specialized_variants.py
 from abc import ABC, abstractmethod
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Tuple
 
 class MamaBearVariant(ABC):
     """Base class for all Mama Bear specialized variants"""
     
+    # Lowercase substrings; variant_router.VariantRouter checks every variant's in one pass
+    ROUTING_KEYWORDS: Tuple[str, ...] = ()  # Messages that belong to this variant
+    REASONING_KEYWORDS: Tuple[str, ...] = ()  # Messages that need a reasoning model here
+    ALWAYS_REASON: bool = False
+    
     @abstractmethod
     def get_system_prompt(self) -> str:
         pass
@@ -98,11 +284,15 @@ class MamaBearVariant(ABC):
     
     def should_use_reasoning_model(self, message: str) -> bool:
         """Determine if this variant should prefer reasoning-capable models"""
-        return False
+        lowered = message.lower()
+        return self.ALWAYS_REASON or any(keyword in lowered for keyword in self.REASONING_KEYWORDS)
 
 class ResearchSpecialist(MamaBearVariant):
     """Mama Bear variant for research and information gathering"""
     
+    ROUTING_KEYWORDS = ('research', 'source', 'citation', 'paper', 'summarize', 'fact-check', 'find out')
+    REASONING_KEYWORDS = ('research', 'analyze', 'compare', 'investigate', 'study', 'examine')
+    
     def get_system_prompt(self) -> str:
         return """You are Mama Bear's Research Specialist variant - a caring, thorough AI assistant who loves discovering connections and helping with research. 
 
@@ -128,14 +318,12 @@ Always maintain Mama Bear's caring, supportive tone while being incredibly helpf
             'temperature': 0.3,  # Lower for accuracy
             'requires_reasoning': True
         }
-    
-    def should_use_reasoning_model(self, message: str) -> bool:
-        research_keywords = ['research', 'analyze', 'compare', 'investigate', 'study', 'examine']
-        return any(keyword in message.lower() for keyword in research_keywords)
 
 class DevOpsSpecialist(MamaBearVariant):
     """Mama Bear variant for VM and infrastructure management"""
     
+    ROUTING_KEYWORDS = ('vm', 'deploy', 'docker', 'server', 'environment', 'infrastructure', 'scrapybara', 'debug')
+    
     def get_system_prompt(self) -> str:
         return """You are Mama Bear's DevOps Specialist variant - a protective, efficient AI assistant who ensures everything runs smoothly.
 
@@ -160,12 +348,16 @@ Always maintain Mama Bear's caring nature while being the reliable guardian of t
         return {
             'prefers_pro_model': False,  # DevOps tasks often need speed
             'temperature': 0.2,  # Very low for precision
-            'requires_reasoning': False
+            'requires_reasoning': False,
+            'hedge_requests': True  # Slow answers during incidents cost more than a duplicate call
         }
 
 class ScoutCommander(MamaBearVariant):
     """Mama Bear variant for autonomous task execution"""
     
+    ROUTING_KEYWORDS = ('scout', 'autonomous', 'explore', 'end-to-end', 'long-running', 'multi-step')
+    ALWAYS_REASON = True  # Scout always benefits from reasoning
+    
     def get_system_prompt(self) -> str:
         return """You are Mama Bear's Scout Commander variant - an adventurous, autonomous AI assistant who takes initiative while keeping humans in control.
 
@@ -191,13 +383,12 @@ Always maintain Mama Bear's warmth while being the brave explorer who ventures i
             'temperature': 0.5,  # Balanced for creativity and precision
             'requires_reasoning': True
         }
-    
-    def should_use_reasoning_model(self, message: str) -> bool:
-        return True  # Scout always benefits from reasoning
 
 class ModelCoordinator(MamaBearVariant):
     """Mama Bear variant for managing multiple AI models"""
     
+    ROUTING_KEYWORDS = ('model', 'gemini', 'quota', 'fallback', 'billing', 'token')
+    
     def get_system_prompt(self) -> str:
         return """You are Mama Bear's Model Coordinator variant - a diplomatic, knowledgeable AI assistant who knows all about different AI models.
 
@@ -227,6 +418,8 @@ Always maintain Mama Bear's supportive nature while being the wise guide through
 class ToolCurator(MamaBearVariant):
     """Mama Bear variant for MCP tools and integrations"""
     
+    ROUTING_KEYWORDS = ('tool', 'mcp', 'plugin', 'extension', 'library', 'package')
+    
     def get_system_prompt(self) -> str:
         return """You are Mama Bear's Tool Curator variant - an enthusiastic, helpful AI assistant who loves discovering and recommending the perfect tools.
 
@@ -256,6 +449,8 @@ Always maintain Mama Bear's caring nature while being the excited curator of ama
 class IntegrationArchitect(MamaBearVariant):
     """Mama Bear variant for building integrations"""
     
+    ROUTING_KEYWORDS = ('integration', 'integrate', 'webhook', 'oauth', 'api key', 'endpoint', 'connector')
+    
     def get_system_prompt(self) -> str:
         return """You are Mama Bear's Integration Architect variant - a methodical, security-conscious AI assistant who builds rock-solid connections.
 
@@ -285,6 +480,8 @@ Always maintain Mama Bear's supportive nature while being the careful architect
 class LiveAPISpecialist(MamaBearVariant):
     """Mama Bear variant for real-time API interactions"""
     
+    ROUTING_KEYWORDS = ('real-time', 'realtime', 'live', 'stream', 'audio', 'video', 'websocket', 'latency')
+    
     def get_system_prompt(self) -> str:
         return """You are Mama Bear's Live API Specialist variant - a dynamic, experimental AI assistant who thrives in real-time interactions.
 
@@ -308,7 +505,8 @@ Always maintain Mama Bear's warmth while being the agile specialist who makes re
         return {
             'prefers_pro_model': False,  # Live APIs need speed
             'temperature': 0.5,  # Balanced for responsiveness
-            'requires_reasoning': False
+            'requires_reasoning': False,
+            'hedge_requests': True  # Tail latency matters more than the extra call
         }
 
 # backend/utils/mama_bear_monitoring.py
@@ -317,6 +515,7 @@ import logging
 from datetime import datetime, timedelta
 from typing import Dict, Any, List
 import json
+from latency_histogram import HistogramRegistry, WINDOWS
 
 class MamaBearMonitoring:
     """Advanced monitoring and analytics for Mama Bear system"""
@@ -333,8 +532,19 @@ class MamaBearMonitoring:
             'avg_response_time': 0.0,
             'model_usage': {},
             'billing_account_usage': {},
-            'hourly_stats': {}
+            'hourly_stats': {},
+            'response_cache': {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0, 'expired': 0,
+                               'semantic_hits': 0, 'semantic_misses': 0, 'semantic_evictions': 0},
+            'batching': {'batches': 0, 'items': 0, 'slots': 0}
         }
+        # Tail latency lives here rather than in self.metrics, which stays JSON-serializable
+        self.histograms = HistogramRegistry({
+            'processing_time': {'min_value': 1e-3, 'max_value': 600.0},
+            'time_to_first_token': {'min_value': 1e-3, 'max_value': 600.0},
+            'fallback_count': {'min_value': 1.0, 'max_value': 64.0},
+            'batch_fill_ratio': {'min_value': 0.01, 'max_value': 1.0, 'sub_buckets': 16},
+            'batch_queue_delay': {'min_value': 1e-4, 'max_value': 60.0},
+        })
         
         # Start monitoring tasks
         asyncio.create_task(self._hourly_metrics_reset())
@@ -373,10 +583,45 @@ class MamaBearMonitoring:
         if fallback_count > 0:
             self.metrics['fallbacks_triggered'] += fallback_count
         
+        # Latency and fallback distributions per model, billing account and variant
+        dimensions = {
+            'model': response_metadata.get('model_used', 'unknown'),
+            'billing_account': response_metadata.get('billing_account', 'unknown'),
+            'variant': response_metadata.get('variant', 'unknown'),
+        }
+        if 'error' not in response_metadata:
+            self.histograms.record('processing_time', response_metadata.get('processing_time', 0), dimensions)
+            if response_metadata.get('time_to_first_token') is not None:
+                self.histograms.record('time_to_first_token', response_metadata['time_to_first_token'], dimensions)
+        self.histograms.record('fallback_count', fallback_count, dimensions)
+        
         # Track quota warnings
         quota_warnings = response_metadata.get('quota_warnings', [])
         self.metrics['quota_warnings'] += len(quota_warnings)
     
+    def hedge_delay(self, variant: str, config: Dict[str, Any]) -> float:
+        """Seconds to wait before hedging a call for this variant: its recent p90 (HEDGE_PERCENTILE)"""
+        value, samples = self.histograms.percentile(
+            'processing_time', 'variant', variant, config.get('HEDGE_PERCENTILE', 90))
+        if samples < config.get('HEDGE_MIN_SAMPLES', 20):
+            return config.get('HEDGE_DEFAULT_DELAY_MS', 2000) / 1000.0
+        return value
+    
+    def record_cache_event(self, event: str, count: int = 1):
+        """Count response cache hits, misses and evictions"""
+        cache_stats = self.metrics['response_cache']
+        cache_stats[event] = cache_stats.get(event, 0) + count
+    
+    def record_batch(self, size: int, capacity: int, queue_delays: List[float]):
+        """Record one dispatched micro-batch: how full it was and how long its items waited"""
+        batching = self.metrics['batching']
+        batching['batches'] += 1
+        batching['items'] += size
+        batching['slots'] += capacity
+        self.histograms.record('batch_fill_ratio', size / max(capacity, 1), {})
+        for delay in queue_delays:
+            self.histograms.record('batch_queue_delay', delay, {})
+    
     async def _hourly_metrics_reset(self):
         """Reset hourly metrics and store historical data"""
         while True:
@@ -447,6 +692,8 @@ class MamaBearMonitoring:
             },
             'model_performance': model_performance,
             'billing_distribution': billing_distribution,
+            'latency': self.histograms.summary(),
+            'latency_windows': {window: self.histograms.summary(window) for window in WINDOWS},
             'model_health': model_status,
             'recommendations': self._generate_recommendations()
         }
@@ -469,6 +716,11 @@ class MamaBearMonitoring:
         if self.metrics['avg_response_time'] > 5.0:
             recommendations.append(f"Average response time is {self.metrics['avg_response_time']:.2f}s - consider optimizing model selection")
         
+        # Check tail latency
+        p99 = self.histograms.summary().get('processing_time', {}).get('all', {}).get('all', {}).get('p99', 0.0)
+        if p99 > 20.0:
+            recommendations.append(f"p99 response time is {p99:.2f}s - check slow models and fallback chains")
+        
         # Check model distribution
         if len(self.metrics['model_usage']) == 1:
             recommendations.append("Only using one model - consider enabling additional models for better reliability")
@@ -480,47 +732,405 @@ class MamaBearMonitoring:
         return recommendations
 
 # backend/api/mama_bear_endpoints.py
-from flask import Blueprint, request, jsonify
-from flask_socketio import emit
+from flask import Blueprint, request, jsonify, current_app, Response
 import asyncio
+import time
 from datetime import datetime
+from tracing import current_request_id, span
 
 mama_bear_bp = Blueprint('mama_bear', __name__)
 
+def _get_response_cache():
+    """Lazily build the app's response cache from config, reporting events to monitoring."""
+    cache = current_app.extensions.get('mama_bear_response_cache')
+    if cache is None:
+        from response_cache import ResponseCache
+        monitoring = getattr(current_app, 'mama_bear_monitoring', None)
+        cache = ResponseCache(
+            ttl=current_app.config.get('CACHE_TTL', 3600),
+            max_bytes=current_app.config.get('RESPONSE_CACHE_MAX_BYTES', 64 * 1024 * 1024),
+            disk_path=current_app.config.get('RESPONSE_CACHE_DISK_PATH') or None,
+            disk_max_bytes=current_app.config.get('RESPONSE_CACHE_DISK_MAX_BYTES', 512 * 1024 * 1024),
+            on_event=monitoring.record_cache_event if monitoring else None,
+        )
+        current_app.extensions['mama_bear_response_cache'] = cache
+    return cache
+
+def _get_semantic_cache():
+    """Semantic cache, or None when disabled or numpy is unavailable."""
+    if not current_app.config.get('ENABLE_SEMANTIC_CACHE'):
+        return None
+    if 'mama_bear_semantic_cache' not in current_app.extensions:
+        cache = None
+        try:
+            from semantic_cache import SemanticCache
+            monitoring = getattr(current_app, 'mama_bear_monitoring', None)
+            cache = SemanticCache(
+                threshold=current_app.config.get('SEMANTIC_CACHE_THRESHOLD', 0.85),
+                capacity=current_app.config.get('SEMANTIC_CACHE_CAPACITY', 1000),
+                dim=current_app.config.get('SEMANTIC_CACHE_DIM', 512),
+                ttl=current_app.config.get('CACHE_TTL', 3600),
+                max_namespaces=current_app.config.get('SEMANTIC_CACHE_MAX_NAMESPACES', 64),
+                on_event=monitoring.record_cache_event if monitoring else None,
+            )
+        except ImportError:
+            print("[INFO] Semantic cache disabled: numpy is not installed")
+        current_app.extensions['mama_bear_semantic_cache'] = cache
+    return current_app.extensions['mama_bear_semantic_cache']
+
+def _batching_enabled(mama_bear, page_context):
+    """Batches go upstream as one model router call, so the variant's prompt must be known."""
+    return (current_app.config.get('ENABLE_REQUEST_BATCHING') and hasattr(current_app, 'model_router')
+            and page_context in getattr(mama_bear, 'variants', {}))
+
+def _batch_key(upstream, models):
+    """Requests share a batch only when everything but the message matches."""
+    return tuple(models), tuple(sorted((k, v) for k, v in upstream.items() if k != 'message'))
+
+def _get_request_batcher():
+    """Micro-batcher for non-interactive requests; each batch is one model router call."""
+    batcher = current_app.extensions.get('mama_bear_request_batcher')
+    if batcher is None:
+        from request_batcher import RequestBatcher
+        app = current_app._get_current_object()
+        
+        async def process_batch(items):
+            with app.app_context():
+                return await _routed_batch(app.model_router, items)
+        
+        monitoring = getattr(current_app, 'mama_bear_monitoring', None)
+        batcher = RequestBatcher(
+            process_batch,
+            batch_size=current_app.config.get('BATCH_SIZE', 5),
+            max_wait=current_app.config.get('BATCH_MAX_WAIT_MS', 50) / 1000.0,
+            on_batch=monitoring.record_batch if monitoring else None,
+        )
+        current_app.extensions['mama_bear_request_batcher'] = batcher
+    return batcher
+
+def _get_variant_router():
+    """One compiled keyword router over the agent's variants, built on first use."""
+    router = current_app.extensions.get('mama_bear_variant_router')
+    if router is None:
+        from variant_router import VariantRouter
+        router = VariantRouter(getattr(current_app.mama_bear_agent, 'variants', {}),
+                               cache_size=current_app.config.get('VARIANT_ROUTER_CACHE_SIZE', 4096))
+        current_app.extensions['mama_bear_variant_router'] = router
+    return router
+
+def _response_cache_key(mama_bear, message, page_context, options):
+    """Cache key over everything that shapes the answer: prompt, message, model and sampling."""
+    from response_cache import make_cache_key
+    variant = getattr(mama_bear, 'variants', {}).get(page_context)
+    system_prompt = variant.get_system_prompt() if variant else page_context
+    preferences = variant.get_model_preferences() if variant else {}
+    if 'context_window' in options:
+        system_prompt += '\0' + options['context_window']['context_hash']
+    config = current_app.config
+    return make_cache_key(
+        system_prompt,
+        message,
+        options.get('model', 'auto'),
+        options.get('temperature', preferences.get('temperature', config.get('DEFAULT_TEMPERATURE'))),
+        options.get('top_p', config.get('DEFAULT_TOP_P')),
+        options.get('top_k', config.get('DEFAULT_TOP_K')),
+    )
+
+def _cache_lookup(mama_bear, message, page_context, options, bypass_cache):
+    """Exact then semantic cache lookup; returns (cached entry or None, status, store context)."""
+    if not current_app.config.get('ENABLE_RESPONSE_CACHING') or bypass_cache:
+        return None, None, None
+    cache = _get_response_cache()
+    cache_key = _response_cache_key(mama_bear, message, page_context, options)
+    cached = cache.get(cache_key)
+    cache_status = 'hit'
+    semantic = _get_semantic_cache()
+    namespace = None
+    if semantic is not None:
+        # Same prompt/model/sampling with an empty message names the namespace
+        namespace = _response_cache_key(mama_bear, '', page_context, options)
+        if cached is None:
+            cached, similarity = semantic.lookup(namespace, message)
+            cache_status = f'semantic:{similarity:.3f}'
+    return cached, cache_status, (cache, cache_key, semantic, namespace)
+
+def _cache_store(store, message, content, metadata):
+    if store is None or 'error' in metadata:
+        return
+    cache, cache_key, semantic, namespace = store
+    entry = {'content': content, 'metadata': metadata}
+    cache.put(cache_key, entry)
+    if semantic is not None:
+        semantic.store(namespace, message, entry)
+
+def _hedge_after(mama_bear, page_context):
+    """Seconds before a variant's upstream call is hedged, or None when it isn't: hedging must be
+    enabled, the app must have a model router and the variant must ask for hedge_requests."""
+    config = current_app.config
+    variant = getattr(mama_bear, 'variants', {}).get(page_context)
+    if not config.get('ENABLE_REQUEST_HEDGING') or getattr(current_app, 'model_router', None) is None:
+        return None
+    if variant is None or not variant.get_model_preferences().get('hedge_requests'):
+        return None
+    monitoring = getattr(current_app, 'mama_bear_monitoring', None)
+    if monitoring is None:
+        return config.get('HEDGE_DEFAULT_DELAY_MS', 2000) / 1000.0
+    return monitoring.hedge_delay(page_context, config)
+
+def _model_order(preferences, options):
+    """Models to try in order: an explicit options['model'], else GEMINI_MODELS, pro first when preferred."""
+    if options.get('model', 'auto') != 'auto':
+        return [options['model']]
+    models = list(current_app.config.get('GEMINI_MODELS', []))
+    if not preferences.get('prefers_pro_model'):
+        models.sort(key=lambda model: 'pro' in model)
+    return models
+
+def _upstream_request(mama_bear, request_args):
+    """(request dict, models in order) for sending request_args straight to the model router."""
+    config = current_app.config
+    variant = mama_bear.variants[request_args['page_context']]
+    preferences = variant.get_model_preferences()
+    upstream = {
+        'message': request_args['message'],
+        'system_prompt': variant.get_system_prompt(),
+        'temperature': request_args.get('temperature', preferences.get('temperature', config.get('DEFAULT_TEMPERATURE'))),
+        'top_p': request_args.get('top_p', config.get('DEFAULT_TOP_P')),
+        'top_k': request_args.get('top_k', config.get('DEFAULT_TOP_K')),
+        'max_tokens': request_args.get('max_tokens', config.get('DEFAULT_MAX_TOKENS')),
+    }
+    window = request_args.get('context_window')
+    if window:
+        # Stable prefix first, so the provider's prompt cache can reuse it
+        upstream['system_prompt'] = '\n\n'.join([window['system_prompt'] or upstream['system_prompt'],
+                                                 *window['stable_context'], *(c['text'] for c in window['context'])])
+    return upstream, _model_order(preferences, request_args)
+
+async def _routed_message(mama_bear, request_args, hedge_after):
+    """One upstream call through the app's ModelRouter, hedged after hedge_after seconds;
+    returns the same {content, metadata} shape as process_message."""
+    started = time.perf_counter()
+    page_context = request_args['page_context']
+    upstream, models = _upstream_request(mama_bear, request_args)
+    result, metadata = await current_app.model_router.call(upstream, models=models, hedge_after=hedge_after)
+    return {
+        'content': result['content'],
+        'metadata': {**metadata, 'model_used': metadata['model'], 'variant': page_context,
+                     'usage': result.get('usage', {}), 'processing_time': time.perf_counter() - started},
+    }
+
+BATCH_PROMPT = (
+    'Answer each of the {count} numbered requests below on its own, as if it were the only one. '
+    'Reply with only a JSON array of {count} strings, where item i is the answer to request i.\n\n{requests}'
+)
+
+def _batch_answers(content, count):
+    """The JSON array of answers from a batched reply; ValueError if it isn't one."""
+    text = content.strip()
+    if text.startswith('```'):
+        text = text.strip('`').removeprefix('json').strip()
+    answers = json.loads(text)
+    if not isinstance(answers, list) or len(answers) != count or not all(isinstance(a, str) for a in answers):
+        raise ValueError(f'expected a JSON array of {count} answers')
+    return answers
+
+async def _routed_batch(router, items):
+    """One upstream call for items sharing a _batch_key: the messages go out as a numbered list
+    and come back as a JSON array. A reply that doesn't parse raises, and RequestBatcher then
+    sends each item on its own (a single item goes out unchanged)."""
+    started = time.perf_counter()
+    upstream, models = items[0]['upstream'], items[0]['models']
+    if len(items) > 1:
+        numbered = '\n\n'.join(f"{i + 1}. {json.dumps(item['upstream']['message'])}" for i, item in enumerate(items))
+        upstream = {**upstream, 'message': BATCH_PROMPT.format(count=len(items), requests=numbered),
+                    'response_mime_type': 'application/json'}
+        if upstream.get('max_tokens'):
+            upstream['max_tokens'] *= len(items)
+    result, metadata = await router.call(upstream, models=models)
+    answers = [result['content']] if len(items) == 1 else _batch_answers(result['content'], len(items))
+    total_tokens = result.get('usage', {}).get('total_tokens', 0)
+    elapsed = time.perf_counter() - started
+    return [{
+        'content': answer,
+        'metadata': {**metadata, 'model_used': metadata['model'], 'variant': item['page_context'],
+                     'batch_size': len(items), 'usage': {'total_tokens': total_tokens / len(items)},
+                     'processing_time': elapsed},
+    } for item, answer in zip(items, answers)]
+
+def _get_context_builder():
+    builder = current_app.extensions.get('mama_bear_context_builder')
+    if builder is None:
+        from context_builder import ContextBuilder
+        builder = ContextBuilder(max_tokens=current_app.config.get('DEFAULT_MAX_TOKENS', 8192))
+        current_app.extensions['mama_bear_context_builder'] = builder
+    return builder
+
+class ChatRequestError(ValueError):
+    """A malformed chat request body; the endpoint answers 400."""
+
+def _context_snippets(context):
+    """Validate attached context: a list of strings or {text, priority, kind, stable, id} dicts."""
+    from context_builder import ContextSnippet
+    if not isinstance(context, list):
+        raise ChatRequestError('context must be a list')
+    snippets = []
+    for index, item in enumerate(context):
+        if isinstance(item, str):
+            snippets.append(ContextSnippet(item))
+        elif isinstance(item, dict) and isinstance(item.get('text'), str):
+            priority = item.get('priority', 0)
+            if not isinstance(priority, (int, float)) or isinstance(priority, bool):
+                raise ChatRequestError(f'context[{index}].priority must be a number')
+            snippets.append(ContextSnippet(item['text'], priority=priority, kind=str(item.get('kind', 'context')),
+                                           stable=bool(item.get('stable', False)), id=item.get('id')))
+        else:
+            raise ChatRequestError(f'context[{index}] must be a string or an object with a text string')
+    return snippets
+
+def _assemble_context(page_context, message, context):
+    """Fit attached context snippets ({text, priority, kind, stable}) into the token budget."""
+    snippets = _context_snippets(context)
+    variant = getattr(current_app.mama_bear_agent, 'variants', {}).get(page_context)
+    system_prompt = variant.get_system_prompt() if variant else ''
+    return _get_context_builder().build(page_context, system_prompt, message, snippets)
+
+def _parse_chat_request(data, headers):
+    if not isinstance(data, dict):
+        raise ChatRequestError('request body must be a JSON object')
+    options = data.get('options')
+    if options is not None and not isinstance(options, dict):
+        raise ChatRequestError('options must be an object')
+    options = dict(options or {})
+    message = data.get('message', '')
+    if not isinstance(message, str):
+        raise ChatRequestError('message must be a string')
+    page_context = data.get('page_context', 'main_chat')
+    if page_context == 'auto':
+        # Let the message pick its specialist
+        with span('variant_routing'):
+            page_context = _get_variant_router().route(message).variant
+    if data.get('context'):
+        # Budgeted context with a stable, cacheable prefix; the agent sends it instead of raw snippets
+        with span('context_assembly'):
+            options['context_window'] = _assemble_context(page_context, message, data['context']).to_dict()
+    return {
+        'message': message,
+        'page_context': page_context,
+        'user_id': data.get('user_id', 'default_user'),
+        'options': options,
+        'bypass_cache': options.pop('bypass_cache', False) or 'no-cache' in headers.get('Cache-Control', ''),
+        'interactive': options.pop('interactive', True),
+    }
+
+def _get_stream_runner():
+    runner = current_app.extensions.get('mama_bear_stream_runner')
+    if runner is None:
+        from chat_streaming import StreamRunner
+        runner = current_app.extensions['mama_bear_stream_runner'] = StreamRunner()
+    return runner
+
+def _start_chat_stream(chat, sink=None):
+    """Start streaming one chat request; returns (runner, source, on_complete) for the transport."""
+    from chat_streaming import agent_token_stream, routed_token_stream
+    mama_bear = current_app.mama_bear_agent
+    monitoring = getattr(current_app, 'mama_bear_monitoring', None)
+    with span('cache_lookup'):
+        cached, cache_status, store = _cache_lookup(
+            mama_bear, chat['message'], chat['page_context'], chat['options'], chat['bypass_cache'])
+    if cached is not None:
+        async def source():
+            yield cached['content']
+            yield {'metadata': {**cached.get('metadata', {}), 'cache': cache_status}}
+        return _get_stream_runner(), source(), None
+    
+    request_args = dict(message=chat['message'], page_context=chat['page_context'],
+                        user_id=chat['user_id'], **chat['options'])
+    
+    def on_complete(content, metadata):
+        if monitoring is not None:
+            monitoring.record_request(metadata)
+        _cache_store(store, chat['message'], content, metadata)
+    
+    router = getattr(current_app, 'model_router', None)
+    if (not hasattr(mama_bear, 'process_message_stream') and router is not None
+            and chat['page_context'] in getattr(mama_bear, 'variants', {})):
+        # The agent can only answer whole; stream the variant's call through the router instead
+        upstream, models = _upstream_request(mama_bear, request_args)
+        source = routed_token_stream(router, upstream, models, chat['page_context'])
+    else:
+        source = agent_token_stream(mama_bear, request_args)
+    return _get_stream_runner(), source, on_complete
+
+def _wants_stream(data):
+    return bool(data.get('stream')) or 'text/event-stream' in request.headers.get('Accept', '')
+
 @mama_bear_bp.route('/api/mama-bear/chat', methods=['POST'])
 async def mama_bear_chat():
     """Main chat endpoint with intelligent model selection"""
     try:
         data = request.json
+        chat = _parse_chat_request(data, request.headers)
+        message, page_context, user_id, options = chat['message'], chat['page_context'], chat['user_id'], chat['options']
         
-        # Extract request data
-        message = data.get('message', '')
-        page_context = data.get('page_context', 'main_chat')
-        user_id = data.get('user_id', 'default_user')
-        options = data.get('options', {})
+        # Token-by-token Server-Sent Events instead of one JSON body
+        if _wants_stream(data):
+            from chat_streaming import sse_response_body
+            runner, source, on_complete = _start_chat_stream(chat)
+            # Starts the stream before returning, while the request trace and app context are current
+            body = sse_response_body(runner, source, on_complete,
+                                     heartbeat=current_app.config.get('STREAM_HEARTBEAT_SECONDS', 15))
+            return Response(body, mimetype='text/event-stream',
+                            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
         
         # Get Mama Bear instance
         mama_bear = current_app.mama_bear_agent
         
-        # Process message
-        response = await mama_bear.process_message(
-            message=message,
-            page_context=page_context,
-            user_id=user_id,
-            **options
-        )
+        # Serve repeated prompts from the response cache, then from near-duplicates
+        with span('cache_lookup'):
+            cached, cache_status, store = _cache_lookup(mama_bear, message, page_context, options, chat['bypass_cache'])
+        if cached is not None:
+            return jsonify({
+                'success': True,
+                'response': cached['content'],
+                'metadata': {**cached.get('metadata', {}), 'cache': cache_status, 'request_id': current_request_id()},
+                'timestamp': datetime.now().isoformat()
+            })
+        
+        # Process message; background work (briefings, Scout subtasks, summaries) is micro-batched
+        request_args = dict(message=message, page_context=page_context, user_id=user_id, **options)
+        if not chat['interactive'] and _batching_enabled(mama_bear, page_context):
+            upstream, models = _upstream_request(mama_bear, request_args)
+            item = {'upstream': upstream, 'models': models, 'page_context': page_context}
+            with span('batch_wait'):
+                response = await _get_request_batcher().submit_async(item, key=_batch_key(upstream, models))
+        elif (hedge_after := _hedge_after(mama_bear, page_context)) is not None:
+            # Tail-latency-sensitive variants go straight through the router so a slow call can be hedged
+            with span('agent', hedged=True):
+                response = await _routed_message(mama_bear, request_args, hedge_after)
+        else:
+            with span('agent'):
+                response = await mama_bear.process_message(**request_args)
         
         # Record metrics
         if hasattr(current_app, 'mama_bear_monitoring'):
             current_app.mama_bear_monitoring.record_request(response.get('metadata', {}))
         
+        with span('cache_store'):
+            _cache_store(store, message, response['content'], response.get('metadata', {}))
+        
         return jsonify({
             'success': True,
             'response': response['content'],
-            'metadata': response.get('metadata', {}),
+            'metadata': {**response.get('metadata', {}), 'request_id': current_request_id()},
             'timestamp': datetime.now().isoformat()
         })
         
+    except ChatRequestError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'timestamp': datetime.now().isoformat()
+        }), 400
     except Exception as e:
         return jsonify({
             'success': False,
@@ -528,6 +1138,48 @@ async def mama_bear_chat():
             'timestamp': datetime.now().isoformat()
         }), 500
 
+def register_socketio_handlers(socketio):
+    """SocketIO chat streaming: `mama_bear_chat_stream` starts a stream, tokens arrive as
+    `mama_bear_chat_token`, then `mama_bear_chat_done` or `mama_bear_chat_error`;
+    `mama_bear_chat_cancel` or a disconnect aborts the upstream call."""
+    from flask_socketio import emit
+    streams = {}  # sid -> {stream_id: StreamHandle}
+    
+    @socketio.on('mama_bear_chat_stream')
+    def handle_chat_stream(data):
+        sid = request.sid
+        stream_id = data.get('stream_id') or f'{sid}:{datetime.now().timestamp()}'
+        
+        def sink(kind, *args):
+            if kind == 'token':
+                socketio.emit('mama_bear_chat_token', {'stream_id': stream_id, 'text': args[0]}, to=sid)
+                return
+            streams.get(sid, {}).pop(stream_id, None)
+            if kind == 'done':
+                socketio.emit('mama_bear_chat_done',
+                              {'stream_id': stream_id, 'response': args[0], 'metadata': args[1]}, to=sid)
+            elif kind == 'error':
+                socketio.emit('mama_bear_chat_error', {'stream_id': stream_id, 'error': args[0]}, to=sid)
+        
+        try:
+            runner, source, on_complete = _start_chat_stream(_parse_chat_request(data, {}))
+            streams.setdefault(sid, {})[stream_id] = runner.start(source, sink, on_complete)
+        except Exception as e:
+            emit('mama_bear_chat_error', {'stream_id': stream_id, 'error': str(e)})
+            return
+        return {'stream_id': stream_id}
+    
+    @socketio.on('mama_bear_chat_cancel')
+    def handle_chat_cancel(data):
+        handle = streams.get(request.sid, {}).pop(data.get('stream_id'), None)
+        if handle is not None:
+            handle.cancel()
+    
+    @socketio.on('disconnect')
+    def handle_chat_disconnect(*_args):
+        for handle in streams.pop(request.sid, {}).values():
+            handle.cancel()
+
 @mama_bear_bp.route('/api/mama-bear/status', methods=['GET'])
 async def mama_bear_status():
     """Get comprehensive system status"""
@@ -575,6 +1227,28 @@ async def mama_bear_metrics():
             'timestamp': datetime.now().isoformat()
         }), 500
 
+@mama_bear_bp.route('/api/mama-bear/endpoints', methods=['GET'])
+def mama_bear_endpoints():
+    """Circuit breaker state, latency and quota headroom per (key, model) endpoint"""
+    router = getattr(current_app, 'model_router', None)
+    if router is None:
+        return jsonify({
+            'success': False,
+            'error': 'Model router not enabled',
+            'timestamp': datetime.now().isoformat()
+        }), 503
+    return jsonify({
+        'success': True,
+        'endpoints': router.get_status(),
+        'timestamp': datetime.now().isoformat()
+    })
+
+@mama_bear_bp.route('/metrics', methods=['GET'])
+def mama_bear_openmetrics():
+    """OpenMetrics scrape endpoint rendered from in-memory counters"""
+    from metrics_exporter import render_openmetrics, CONTENT_TYPE
+    return Response(render_openmetrics(current_app._get_current_object()), content_type=CONTENT_TYPE)
+
 @mama_bear_bp.route('/api/mama-bear/warm-up', methods=['POST'])
 async def warm_up_models():
     """Manually trigger model warm-up"""
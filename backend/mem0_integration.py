@@ -1,21 +1,359 @@
 """
 Mem0 Integration for Persistent Logging and Context
 - Persists logs, tasks, plans, and context snapshots to Mem0
-- Handles fallback to local storage if Mem0 is unavailable
+- Entities are batched and uploaded off the request thread over a pooled keep-alive session;
+  batches go to MEM0_BATCH_URL as {"items": [...]}, or entity by entity to MEM0_API_URL in
+  the original {"type", "data"} shape when no batch URL is configured
+- Undelivered batches are spooled to a local SQLite outbox and replayed with exponential backoff;
+  an entity that fails is moved behind the rest of the outbox, and after MEM0_MAX_ATTEMPTS it
+  goes to a dead-letter table instead of blocking the queue
 """
-import requests
+import atexit
+import json
 import os
+import queue
+import random
+import sqlite3
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from tracing import current_request_id, span
 
 MEM0_API_URL = os.environ.get("MEM0_API_URL", "https://your-mem0-endpoint/upload")
+MEM0_BATCH_URL = os.environ.get("MEM0_BATCH_URL", "")  # Only set for endpoints that accept {"items": [...]}
 MEM0_API_KEY = os.environ.get("MEM0_API_KEY", "")
+MEM0_OUTBOX_PATH = os.environ.get("MEM0_OUTBOX_PATH", "mem0_outbox.db")
+MEM0_BATCH_SIZE = int(os.environ.get("MEM0_BATCH_SIZE", "50"))
+MEM0_FLUSH_INTERVAL = float(os.environ.get("MEM0_FLUSH_INTERVAL", "1.0"))
+MEM0_MAX_ATTEMPTS = int(os.environ.get("MEM0_MAX_ATTEMPTS", "8"))
 
-def persist_to_mem0(entity_type, data):
-    headers = {"Authorization": f"Bearer {MEM0_API_KEY}"}
-    payload = {"type": entity_type, "data": data}
-    try:
-        response = requests.post(MEM0_API_URL, json=payload, headers=headers, timeout=5)
-        response.raise_for_status()
+
+# 4xx answers that usually mean a misconfigured endpoint or key, or a transient limit:
+# spooled and retried rather than dropped. Payload errors (400, 415) are permanent.
+RETRYABLE_4XX = {401, 403, 404, 408, 429}
+
+
+class PermanentMem0Error(Exception):
+    """Mem0 rejected the upload with a 4xx outside RETRYABLE_4XX; retrying will not help."""
+
+
+class Mem0SendError(Exception):
+    """A send failed after handling the first `done` items, `delivered` of them successfully;
+    the next `failed` items were tried and failed, anything after them was not tried."""
+
+    def __init__(self, cause, done=0, delivered=0, failed=1):
+        super().__init__(str(cause))
+        self.done = done
+        self.delivered = delivered
+        self.failed = failed
+
+
+class Mem0Outbox:
+    """Spool of undelivered entities, replayed in next_attempt order once due, plus a
+    dead-letter table for entities that ran out of attempts."""
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " payload TEXT NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " next_attempt REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_outbox_next_attempt ON outbox (next_attempt, id)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS outbox_dead ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " payload TEXT NOT NULL,"
+            " attempts INTEGER NOT NULL,"
+            " error TEXT,"
+            " failed_at REAL NOT NULL)"
+        )
+
+    def add(self, items, next_attempt, attempts=0):
+        rows = [(json.dumps(item), attempts, next_attempt) for item in items]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany("INSERT INTO outbox (payload, attempts, next_attempt) VALUES (?, ?, ?)", rows)
+            self._conn.execute("COMMIT")
+
+    def due(self, limit, now):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, payload, attempts FROM outbox WHERE next_attempt <= ? ORDER BY next_attempt, id LIMIT ?",
+                (now, limit),
+            ).fetchall()
+        return [(row_id, json.loads(payload), attempts) for row_id, payload, attempts in rows]
+
+    def ack(self, ids):
+        with self._lock:
+            self._conn.executemany("DELETE FROM outbox WHERE id = ?", [(i,) for i in ids])
+
+    def retry(self, rows):
+        """rows: [(id, attempts, next_attempt)]"""
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE outbox SET attempts = ?, next_attempt = ? WHERE id = ?",
+                [(attempts, next_attempt, i) for i, attempts, next_attempt in rows],
+            )
+
+    def bury(self, ids, error):
+        """Move rows to the dead-letter table."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT INTO outbox_dead (payload, attempts, error, failed_at)"
+                " SELECT payload, attempts + 1, ?, ? FROM outbox WHERE id = ?",
+                [(error, now, i) for i in ids],
+            )
+            self._conn.executemany("DELETE FROM outbox WHERE id = ?", [(i,) for i in ids])
+            self._conn.execute("COMMIT")
+
+    def add_dead(self, items, attempts, error):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO outbox_dead (payload, attempts, error, failed_at) VALUES (?, ?, ?, ?)",
+                [(json.dumps(item), attempts, error, now) for item in items],
+            )
+
+    def depth(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def dead_depth(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM outbox_dead").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class Mem0Client:
+    def __init__(self, api_url=MEM0_API_URL, batch_url=MEM0_BATCH_URL, api_key=MEM0_API_KEY,
+                 outbox_path=MEM0_OUTBOX_PATH, batch_size=MEM0_BATCH_SIZE, flush_interval=MEM0_FLUSH_INTERVAL,
+                 timeout=5.0, base_backoff=1.0, max_backoff=300.0, max_queue=10000, pool_size=4,
+                 max_attempts=MEM0_MAX_ATTEMPTS):
+        self.api_url = api_url
+        self.batch_url = batch_url or None
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.timeout = timeout
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.max_attempts = max(1, max_attempts)
+        self.outbox = Mem0Outbox(outbox_path)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Authorization": f"Bearer {api_key}"})
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._retry_at = 0.0
+        self._thread = None
+        self._lock = threading.Lock()
+        self.stats = {
+            "submitted": 0,
+            "delivered": 0,
+            "batches": 0,
+            "spooled": 0,
+            "replayed": 0,
+            "dropped": 0,
+            "failures": 0,
+            "dead_lettered": 0,
+        }
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="mem0-uploader", daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def submit(self, entity_type, data):
+        """Queue one entity for upload; never blocks the caller on the network."""
+        self.start()
+        item = {"type": entity_type, "data": data}
+        self.stats["submitted"] += 1
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self._spool([item], time.time())
         return True
-    except Exception as e:
-        print(f"[Mem0] Fallback: {e}")
-        return False
+
+    def stop(self, timeout=10.0):
+        """Stop the uploader; anything not delivered by then stays in the outbox."""
+        self._stop.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+        self._thread = None
+        leftover = []
+        while True:
+            try:
+                leftover.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if leftover:
+            self._spool(leftover, time.time())
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._collect()
+            if batch:
+                if time.time() < self._retry_at:
+                    self._spool(batch, self._retry_at)
+                else:
+                    self._deliver_fresh(batch)
+            self._replay_due()
+
+    def _collect(self):
+        try:
+            first = self._queue.get(timeout=self.flush_interval)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _post(self, url, payload):
+        response = self.session.post(url, json=payload, timeout=self.timeout)
+        if 400 <= response.status_code < 500 and response.status_code not in RETRYABLE_4XX:
+            raise PermanentMem0Error(f"{response.status_code} {response.text[:200]}")
+        response.raise_for_status()
+
+    def _send(self, items):
+        """Upload items; returns how many were delivered. Raises PermanentMem0Error when the
+        batch endpoint rejects the whole batch, Mem0SendError on anything worth retrying."""
+        if self.batch_url:
+            try:
+                self._post(self.batch_url, {"items": items})
+            except PermanentMem0Error:
+                raise
+            except Exception as e:
+                raise Mem0SendError(e, failed=len(items)) from e
+            return len(items)
+        delivered = 0
+        for i, item in enumerate(items):
+            try:
+                self._post(self.api_url, item)
+            except PermanentMem0Error as e:
+                self.stats["dropped"] += 1
+                print(f"[Mem0] Dropping {item.get('type')} entity: {e}")
+                continue
+            except Exception as e:
+                raise Mem0SendError(e, done=i, delivered=delivered) from e
+            delivered += 1
+        return delivered
+
+    def _backoff(self, attempts):
+        delay = min(self.max_backoff, self.base_backoff * (2 ** attempts))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _deliver_fresh(self, batch):
+        try:
+            delivered = self._send(batch)
+        except PermanentMem0Error as e:
+            self.stats["dropped"] += len(batch)
+            print(f"[Mem0] Dropping {len(batch)} entities: {e}")
+        except Mem0SendError as e:
+            self.stats["failures"] += 1
+            self.stats["delivered"] += e.delivered
+            failed, untried = batch[e.done:e.done + e.failed], batch[e.done + e.failed:]
+            self._retry_at = time.time() + self._backoff(0)
+            # Untried entities first, so a failing one queues behind them
+            if untried:
+                self._spool(untried, self._retry_at)
+            if self.max_attempts <= 1:
+                self._dead_letter_items(failed, 1, str(e))
+            else:
+                self._spool(failed, self._retry_at + self._backoff(1), attempts=1)
+            print(f"[Mem0] Fallback: {e}; spooled {len(failed) + len(untried)} entities")
+        else:
+            self.stats["delivered"] += delivered
+            self.stats["batches"] += 1
+
+    def _replay_due(self):
+        now = time.time()
+        if now < self._retry_at:
+            return
+        rows = self.outbox.due(self.batch_size, now)
+        if not rows:
+            return
+        ids = [row_id for row_id, _item, _attempts in rows]
+        try:
+            replayed = self._send([item for _id, item, _attempts in rows])
+        except PermanentMem0Error as e:
+            self.outbox.ack(ids)
+            self.stats["dropped"] += len(ids)
+            print(f"[Mem0] Dropping {len(ids)} spooled entities: {e}")
+        except Mem0SendError as e:
+            self.stats["failures"] += 1
+            self.stats["replayed"] += e.delivered
+            if e.done:
+                self.outbox.ack(ids[:e.done])
+            failed = rows[e.done:e.done + e.failed]
+            self._retry_at = now + self._backoff(max(a for _id, _item, a in failed))
+            # Failed rows move behind everything else due; rows after them were not tried and stay put
+            retry = [(row_id, a + 1, self._retry_at + self._backoff(a + 1))
+                     for row_id, _item, a in failed if a + 1 < self.max_attempts]
+            dead = [row_id for row_id, _item, a in failed if a + 1 >= self.max_attempts]
+            if retry:
+                self.outbox.retry(retry)
+            if dead:
+                self.outbox.bury(dead, str(e))
+                self.stats["dead_lettered"] += len(dead)
+                print(f"[Mem0] Dead-lettered {len(dead)} entities after {self.max_attempts} attempts: {e}")
+        else:
+            self.outbox.ack(ids)
+            self.stats["replayed"] += replayed
+            self.stats["batches"] += 1
+
+    def _dead_letter_items(self, items, attempts, error):
+        self.outbox.add_dead(items, attempts, error)
+        self.stats["dead_lettered"] += len(items)
+        print(f"[Mem0] Dead-lettered {len(items)} entities after {attempts} attempts: {error}")
+
+    def _spool(self, items, next_attempt, attempts=0):
+        self.outbox.add(items, next_attempt, attempts)
+        self.stats["spooled"] += len(items)
+
+    def get_status(self):
+        return {**self.stats, "queue_depth": self._queue.qsize(), "outbox_depth": self.outbox.depth(),
+                "dead_letter_depth": self.outbox.dead_depth()}
+
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_mem0_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = Mem0Client()
+        return _client
+
+def persist_to_mem0(entity_type, data):
+    request_id = current_request_id()
+    if request_id is not None and isinstance(data, dict) and 'request_id' not in data:
+        data = {**data, 'request_id': request_id}
+    with span('mem0_persist'):
+        return get_mem0_client().submit(entity_type, data)
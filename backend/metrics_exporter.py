@@ -0,0 +1,223 @@
+"""
+OpenMetrics exposition for Mama Bear and Taskmaster
+- Renders counters and gauges already held in memory (monitoring, write queue, Mem0 client)
+- Latency histograms are exported as summaries from their cumulative buckets
+- Quota usage needs SQLite reads, so it is cached for a few seconds between scrapes
+"""
+import threading
+import time
+
+CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+QUANTILES = (0.5, 0.9, 0.99)
+SECONDS_METRICS = {'processing_time', 'time_to_first_token', 'batch_queue_delay', 'task_wait_time', 'task_run_time'}
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + '}'
+
+
+class MetricWriter:
+    def __init__(self):
+        self.lines = []
+
+    def family(self, name, metric_type, help_text):
+        self.lines.append(f'# TYPE {name} {metric_type}')
+        self.lines.append(f'# HELP {name} {help_text}')
+
+    def sample(self, name, value, labels=None):
+        self.lines.append(f'{name}{_labels(labels)} {float(value):.17g}')
+
+    def counter(self, name, help_text, value, labels=None):
+        self.family(name, 'counter', help_text)
+        self.sample(f'{name}_total', value, labels)
+
+    def gauge(self, name, help_text, value, labels=None):
+        self.family(name, 'gauge', help_text)
+        self.sample(name, value, labels)
+
+    def render(self):
+        return '\n'.join(self.lines + ['# EOF']) + '\n'
+
+
+class _TTLCache:
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._value = None
+        self._expires = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, compute):
+        with self._lock:
+            now = time.monotonic()
+            if now >= self._expires:
+                self._value = compute()
+                self._expires = now + self.ttl
+            return self._value
+
+_quota_cache = _TTLCache(ttl=5.0)
+
+
+def _monitoring_metrics(out, monitoring):
+    m = monitoring.metrics
+    out.counter('mama_bear_requests', 'Chat requests handled', m['requests_total'])
+    out.counter('mama_bear_requests_successful', 'Chat requests that succeeded', m['requests_successful'])
+    out.counter('mama_bear_requests_failed', 'Chat requests that failed', m['requests_failed'])
+    out.counter('mama_bear_fallbacks', 'Model fallbacks triggered', m['fallbacks_triggered'])
+    out.counter('mama_bear_quota_warnings', 'Quota warnings returned by the model manager', m['quota_warnings'])
+    out.gauge('mama_bear_avg_response_seconds', 'Mean processing time of successful requests', m['avg_response_time'])
+    out.family('mama_bear_model_requests', 'counter', 'Successful requests per model')
+    for model, count in m['model_usage'].items():
+        out.sample('mama_bear_model_requests_total', count, {'model': model})
+    out.family('mama_bear_billing_account_requests', 'counter', 'Successful requests per billing account')
+    for account, count in m['billing_account_usage'].items():
+        out.sample('mama_bear_billing_account_requests_total', count, {'account': account})
+    batching = m.get('batching', {})
+    if batching:
+        out.counter('mama_bear_batches', 'Micro-batches dispatched', batching['batches'])
+        out.counter('mama_bear_batched_requests', 'Requests sent inside micro-batches', batching['items'])
+    out.family('mama_bear_response_cache_events', 'counter', 'Response cache lookups and evictions by outcome')
+    for event, count in m.get('response_cache', {}).items():
+        out.sample('mama_bear_response_cache_events_total', count, {'event': event})
+
+    families = {}
+    for (metric, dimension, label), series in monitoring.histograms.items():
+        families.setdefault(metric, []).append((dimension, label, series.total))
+    for metric, series_list in families.items():
+        name = f'mama_bear_{metric}' + ('_seconds' if metric in SECONDS_METRICS else '')
+        out.family(name, 'summary', f'Distribution of {metric.replace("_", " ")}')
+        for dimension, label, hist in series_list:
+            labels = {'dimension': dimension, 'value': label}
+            for q in QUANTILES:
+                out.sample(name, hist.percentile(q * 100), {**labels, 'quantile': q})
+            out.sample(f'{name}_count', hist.count, labels)
+            out.sample(f'{name}_sum', hist.total, labels)
+
+def _router_metrics(out, router):
+    status = router.get_status()
+    out.family('mama_bear_endpoint_circuit_state', 'stateset', 'Circuit breaker state per key and model')
+    for e in status:
+        for state in ('closed', 'open', 'half_open'):
+            out.sample('mama_bear_endpoint_circuit_state', int(e['state'] == state),
+                       {'key': e['key'], 'model': e['model'], 'mama_bear_endpoint_circuit_state': state})
+    out.family('mama_bear_endpoint_latency_seconds', 'gauge', 'Latency EWMA per key and model')
+    for e in status:
+        if e['latency_ewma'] is not None:
+            out.sample('mama_bear_endpoint_latency_seconds', e['latency_ewma'], {'key': e['key'], 'model': e['model']})
+    out.family('mama_bear_endpoint_errors', 'counter', 'Failed calls per key and model')
+    for e in status:
+        out.sample('mama_bear_endpoint_errors_total', e['errors'], {'key': e['key'], 'model': e['model']})
+    out.family('mama_bear_endpoint_rate_limited', 'counter', '429 responses per key and model')
+    for e in status:
+        out.sample('mama_bear_endpoint_rate_limited_total', e['rate_limited'], {'key': e['key'], 'model': e['model']})
+
+    hedging = router.get_hedge_status()
+    if hedging['enabled']:
+        out.counter('mama_bear_hedged_requests', 'Calls that fired a hedge request', hedging['hedged'])
+        out.counter('mama_bear_hedge_wins', 'Hedge requests that finished first', hedging['hedge_wins'])
+        out.counter('mama_bear_hedges_denied', 'Hedges skipped because the hedge budget was spent', hedging['budget_denied'])
+
+def _quota_metrics(out, quota_manager):
+    def snapshot():
+        usage = {key: quota_manager.get_usage(key) for key in quota_manager.config.get('quota', {})}
+        return quota_manager.get_status(), usage
+    totals, usage = _quota_cache.get(snapshot)
+    out.family('mama_bear_quota_usage', 'counter', 'Lifetime usage recorded per quota key')
+    for key, amount in totals.items():
+        out.sample('mama_bear_quota_usage_total', amount, {'key': key})
+    out.family('mama_bear_quota_window_used', 'gauge', 'Usage inside each quota window, including reservations')
+    for key, limits in usage.items():
+        for limit_name, u in limits.items():
+            out.sample('mama_bear_quota_window_used', u['used'], {'key': key, 'limit': limit_name})
+    out.family('mama_bear_quota_window_limit', 'gauge', 'Effective limit per quota window after the safety margin')
+    for key, limits in usage.items():
+        for limit_name, u in limits.items():
+            out.sample('mama_bear_quota_window_limit', u['effective_limit'], {'key': key, 'limit': limit_name})
+
+def _taskmaster_metrics(out, extensions):
+    writer = extensions.get('taskmaster_writer')
+    if writer is not None:
+        out.gauge('taskmaster_write_queue_depth', 'Rows waiting in the write-behind queue', writer.depth)
+        out.counter('taskmaster_rows_committed', 'Rows committed by the write-behind queue', writer.stats['committed'])
+        out.counter('taskmaster_write_batches', 'Write-behind transactions committed', writer.stats['batches'])
+        out.counter('taskmaster_rows_rejected', 'Rows rejected because the write queue was full', writer.stats['rejected'])
+        out.counter('taskmaster_rows_failed', 'Rows whose write-behind flush failed', writer.stats['failed'])
+        out.counter('taskmaster_write_batches_retried', 'Write-behind batches retried row by row after a failed commit',
+                    writer.stats['retried_batches'])
+    retention = extensions.get('taskmaster_retention')
+    if retention is not None:
+        out.counter('taskmaster_log_rows_pruned', 'Log rows removed by retention', retention.stats['rows_pruned'])
+        out.counter('taskmaster_bytes_reclaimed', 'Bytes released by incremental vacuum', retention.stats['bytes_reclaimed'])
+
+def _scheduler_metrics(out, scheduler):
+    status = scheduler.get_status()
+    out.family('mama_bear_task_queue_depth', 'gauge', 'Agent tasks ready to run, per priority')
+    for priority, p in status['priorities'].items():
+        out.sample('mama_bear_task_queue_depth', p['queued'], {'priority': priority})
+    out.family('mama_bear_tasks_blocked', 'gauge', 'Agent tasks waiting on dependencies, per priority')
+    for priority, p in status['priorities'].items():
+        out.sample('mama_bear_tasks_blocked', p['blocked'], {'priority': priority})
+    out.family('mama_bear_tasks_running', 'gauge', 'Agent tasks running, per priority')
+    for priority, p in status['priorities'].items():
+        out.sample('mama_bear_tasks_running', p['running'], {'priority': priority})
+    out.family('mama_bear_tasks_finished', 'counter', 'Agent tasks finished, by outcome')
+    for outcome in ('completed', 'failed', 'cancelled', 'expired', 'timed_out'):
+        out.sample('mama_bear_tasks_finished_total', status[outcome], {'outcome': outcome})
+
+def _vm_pool_metrics(out, pool):
+    status = pool.get_status()
+    out.counter('scrapybara_vm_leases', 'VM leases handed out', status['leases'])
+    out.counter('scrapybara_vm_pool_hits', 'Leases served by a warm idle VM', status['hits'])
+    out.counter('scrapybara_vm_pool_misses', 'Leases that waited for a cold boot', status['misses'])
+    out.counter('scrapybara_vm_lease_timeouts', 'Leases that gave up waiting for a VM', status['timeouts'])
+    out.counter('scrapybara_vm_boot_failures', 'VM boots that failed', status['boot_failures'])
+    out.counter('scrapybara_vm_reaped', 'Idle VMs terminated after the idle timeout', status['reaped'])
+    out.family('scrapybara_vm_pool_instances', 'gauge', 'Pool instances per vm_type and state')
+    for vm_type, counts in status['types'].items():
+        for state in ('idle', 'leased', 'booting'):
+            out.sample('scrapybara_vm_pool_instances', counts[state], {'vm_type': vm_type, 'state': state})
+    hist = pool.lease_wait_histogram()
+    out.family('scrapybara_vm_lease_wait_seconds', 'summary', 'Time from lease request to a usable VM')
+    for q in QUANTILES:
+        out.sample('scrapybara_vm_lease_wait_seconds', hist.percentile(q * 100), {'quantile': q})
+    out.sample('scrapybara_vm_lease_wait_seconds_count', hist.count)
+    out.sample('scrapybara_vm_lease_wait_seconds_sum', hist.total)
+
+def _mem0_metrics(out):
+    import mem0_integration
+    client = mem0_integration._client
+    if client is None:
+        return
+    out.gauge('mem0_queue_depth', 'Entities waiting for the next Mem0 batch', client._queue.qsize())
+    out.counter('mem0_entities_delivered', 'Entities uploaded on first attempt', client.stats['delivered'])
+    out.counter('mem0_entities_replayed', 'Entities uploaded from the outbox', client.stats['replayed'])
+    out.counter('mem0_entities_spooled', 'Entities written to the outbox', client.stats['spooled'])
+    out.counter('mem0_entities_dead_lettered', 'Entities moved to the dead-letter table', client.stats['dead_lettered'])
+
+def render_openmetrics(app):
+    out = MetricWriter()
+    if hasattr(app, 'mama_bear_monitoring'):
+        _monitoring_metrics(out, app.mama_bear_monitoring)
+    if hasattr(app, 'model_router'):
+        _router_metrics(out, app.model_router)
+    if hasattr(app, 'quota_manager'):
+        _quota_metrics(out, app.quota_manager)
+    _taskmaster_metrics(out, app.extensions)
+    if 'agent_scheduler' in app.extensions:
+        _scheduler_metrics(out, app.extensions['agent_scheduler'])
+    if 'vm_pool' in app.extensions:
+        _vm_pool_metrics(out, app.extensions['vm_pool'])
+    if 'vm_status' in app.extensions:
+        status = app.extensions['vm_status'].get_status()
+        out.counter('scrapybara_vm_status_sweeps', 'Bulk VM status sweeps', status['sweeps'])
+        out.counter('scrapybara_vm_status_calls', 'Provider status calls made by sweeps', status['provider_calls'])
+        out.gauge('scrapybara_vm_status_instances', 'VMs in the status table', status['instances'])
+    try:
+        _mem0_metrics(out)
+    except ImportError:
+        pass
+    return out.render()
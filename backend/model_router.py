@@ -0,0 +1,522 @@
+"""
+Health- and load-aware routing across Gemini API keys and models
+- One circuit breaker per (key, model): closed -> open after ERROR_THRESHOLD consecutive
+  errors, half-open after RECOVERY_TIMEOUT, closed again once a background probe succeeds
+- 429s put an endpoint on an exponential cooldown (BASE/MAX_FALLBACK_DELAY) without
+  counting against its health
+- Each call goes to the best closed endpoint, scored on latency EWMA, in-flight requests,
+  quota headroom and the caller's model preference; recovery never spends user requests
+- stream() routes token streams the same way, failing over only until the first chunk
+- Optional hedging: a call still running after hedge_after seconds gets a second request on
+  another endpoint, the first to finish wins and the other is cancelled; hedges are capped at
+  a share of all calls through QuotaManager so every worker process draws on one budget. A
+  cancelled call that had already been sent still counts as a request against its quota
+"""
+import asyncio
+import atexit
+import logging
+import random
+import threading
+import time
+
+from quota_manager import QuotaExceeded
+from tracing import span
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+LATENCY_ALPHA = 0.2  # Weight of the newest sample in the latency EWMA
+PREFERENCE_PENALTY = 0.5  # Score multiplier per step down the caller's model list
+HEADROOM_TTL = 1.0  # Seconds a quota headroom reading is reused
+MIN_HEADROOM = 0.01
+HEDGE_KEY = 'hedge:extra'
+HEDGE_BASE_KEY = 'hedge:primary'
+HEDGE_WINDOW = 3600  # Seconds over which the hedge share is enforced
+
+
+class ModelCallError(Exception):
+    """Raised by a backend for a failed call; status 429 marks rate limiting."""
+
+    def __init__(self, message, status=500, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class NoHealthyEndpoint(Exception):
+    """Every endpoint for the requested models is open, cooling down or out of quota."""
+
+
+class CircuitBreaker:
+    def __init__(self, error_threshold=3, recovery_timeout=1800):
+        self.error_threshold = error_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.last_error = None
+
+    def record_success(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.last_error = None
+
+    def record_failure(self, error, now):
+        self.failures += 1
+        self.last_error = str(error)
+        if self.state == HALF_OPEN or self.failures >= self.error_threshold:
+            self.state = OPEN
+            self.opened_at = now
+
+    def probe_due(self, now):
+        """Move an open breaker to half-open once its recovery timeout has passed."""
+        if self.state == OPEN and now - self.opened_at >= self.recovery_timeout:
+            self.state = HALF_OPEN
+        return self.state == HALF_OPEN
+
+
+class Endpoint:
+    def __init__(self, key_name, api_key, model, breaker):
+        self.key_name = key_name
+        self.api_key = api_key
+        self.model = model
+        self.breaker = breaker
+        self.quota_key = f'{key_name}:{model}'
+        self.latency = None  # EWMA seconds
+        self.in_flight = 0
+        self.cooldown_until = 0.0
+        self.rate_limits = 0  # Consecutive 429s, drives the cooldown backoff
+        self.headroom = 1.0
+        self.headroom_at = 0.0
+        self.stats = {'calls': 0, 'errors': 0, 'rate_limited': 0, 'probes': 0}
+
+    @property
+    def name(self):
+        return self.quota_key
+
+    def status(self, now):
+        return {
+            'key': self.key_name,
+            'model': self.model,
+            'state': self.breaker.state,
+            'consecutive_errors': self.breaker.failures,
+            'last_error': self.breaker.last_error,
+            'latency_ewma': self.latency,
+            'in_flight': self.in_flight,
+            'cooldown_remaining': max(0.0, self.cooldown_until - now),
+            'quota_headroom': self.headroom,
+            **self.stats,
+        }
+
+
+class ModelRouter:
+    def __init__(self, config, backend, quota_manager=None, log_func=None):
+        """backend: object with `async generate(api_key, model, request) -> dict` raising
+        ModelCallError on failure, and optionally `async probe(api_key, model)`."""
+        self.backend = backend
+        self.quota_manager = quota_manager
+        self.log = log_func or (lambda message, level='INFO': None)
+        self.max_attempts = config.get('MAX_FALLBACK_ATTEMPTS', 6)
+        self.base_delay = config.get('BASE_FALLBACK_DELAY', 1.0)
+        self.max_delay = config.get('MAX_FALLBACK_DELAY', 30.0)
+        self.probe_interval = config.get('CIRCUIT_PROBE_INTERVAL', 15)
+        keys = [('primary', config.get('GEMINI_API_KEY_PRIMARY')), ('backup', config.get('GEMINI_API_KEY_BACKUP'))]
+        self.endpoints = [
+            Endpoint(key_name, api_key, model,
+                     CircuitBreaker(config.get('ERROR_THRESHOLD', 3), config.get('RECOVERY_TIMEOUT', 1800)))
+            for key_name, api_key in keys if api_key
+            for model in config.get('GEMINI_MODELS', [])
+        ]
+        self.hedge_share = config.get('HEDGE_BUDGET_RATIO', 0.05) if config.get('ENABLE_REQUEST_HEDGING') else 0.0
+        if self.hedge_share and quota_manager is not None:
+            quota_manager.track(HEDGE_KEY, HEDGE_WINDOW)
+            quota_manager.track(HEDGE_BASE_KEY, HEDGE_WINDOW)
+        self.hedge_stats = {'hedged': 0, 'hedge_wins': 0, 'budget_denied': 0}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    # Selection
+
+    def _headroom(self, endpoint, now):
+        if self.quota_manager is None:
+            return 1.0
+        if now - endpoint.headroom_at >= HEADROOM_TTL:
+            endpoint.headroom = self.quota_manager.headroom(endpoint.quota_key)
+            endpoint.headroom_at = now
+        return endpoint.headroom
+
+    def _score(self, endpoint, rank, now):
+        # Unmeasured endpoints score 0 so they get traffic (and a latency reading) first
+        latency = endpoint.latency or 0.0
+        headroom = max(self._headroom(endpoint, now), MIN_HEADROOM)
+        load = (1 + endpoint.in_flight) * (1 + endpoint.breaker.failures)
+        return latency * load / headroom * (1 + PREFERENCE_PENALTY * rank)
+
+    def select(self, models=None, exclude=()):
+        """Best closed endpoint for the given models (in preference order), or None."""
+        now = time.time()
+        order = {model: rank for rank, model in enumerate(models)} if models else None
+        best, best_score = None, None
+        with self._lock:
+            for endpoint in self.endpoints:
+                if endpoint in exclude or endpoint.breaker.state != CLOSED or endpoint.cooldown_until > now:
+                    continue
+                if order is not None and endpoint.model not in order:
+                    continue
+                if self._headroom(endpoint, now) <= 0.0:
+                    continue
+                score = self._score(endpoint, order[endpoint.model] if order else 0, now)
+                if best_score is None or score < best_score:
+                    best, best_score = endpoint, score
+            if best is not None:
+                best.in_flight += 1
+        return best
+
+    def _next_cooldown(self, models):
+        """Seconds until the first rate-limited (not broken) endpoint is usable again, or None."""
+        now = time.time()
+        waits = [
+            e.cooldown_until - now for e in self.endpoints
+            if e.breaker.state == CLOSED and e.cooldown_until > now and (not models or e.model in models)
+        ]
+        return min(waits, default=None)
+
+    # Calls
+
+    async def call(self, request, models=None, hedge_after=None):
+        """Run request on the healthiest endpoint, failing over up to MAX_FALLBACK_ATTEMPTS times.
+        Returns (result, metadata) where metadata names the endpoint and fallback count.
+        With hedge_after (seconds) and hedging enabled, a slow call is raced against a hedge.
+        The first call starts the background probe thread."""
+        self.start()
+        if not self.hedge_share or self.quota_manager is None:
+            return await self._call(request, models, [])
+        await self.quota_manager.record_usage_async(HEDGE_BASE_KEY, 0)  # Every call earns hedge budget
+        if hedge_after is None:
+            return await self._call(request, models, [])
+        tried = []  # Shared, so the hedge avoids whatever the primary is using
+        primary = asyncio.ensure_future(self._call(request, models, tried))
+        done, _pending = await asyncio.wait({primary}, timeout=hedge_after)
+        if done:
+            return primary.result()
+        try:
+            reservation = await self.quota_manager.reserve_share_async(
+                HEDGE_KEY, HEDGE_BASE_KEY, self.hedge_share, HEDGE_WINDOW)
+        except QuotaExceeded:
+            self.hedge_stats['budget_denied'] += 1
+            return await primary
+        self.hedge_stats['hedged'] += 1
+        await self.quota_manager.commit_async(reservation)
+        hedge = asyncio.ensure_future(self._call(request, models, tried))
+        return await self._race(primary, hedge)
+
+    async def _race(self, primary, hedge):
+        """First successful result wins; the loser is cancelled. Fails only if both fail."""
+        pending = {primary, hedge}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        result, metadata = task.result()
+                        if task is hedge:
+                            self.hedge_stats['hedge_wins'] += 1
+                        return result, {**metadata, 'hedged': True, 'hedge_won': task is hedge}
+            return primary.result()  # Both failed: surface the primary's error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _acquire(self, models, tried):
+        """Next endpoint to try (counted in flight), waiting out a short cooldown if only
+        rate-limited endpoints remain; None when there is nothing left to try."""
+        endpoint = self.select(models, exclude=tried)
+        while endpoint is None:
+            wait = self._next_cooldown(models)
+            if wait is None or wait > self.max_delay:
+                return None
+            # Only rate-limited endpoints remain; waiting out the shortest cooldown beats failing
+            with span('fallback_wait'):
+                await asyncio.sleep(wait)
+            tried.clear()  # In place: a racing hedge shares this list
+            endpoint = self.select(models, exclude=tried)
+        tried.append(endpoint)
+        return endpoint
+
+    async def _call(self, request, models, tried):
+        last_error = None
+        for attempt in range(self.max_attempts):
+            endpoint = await self._acquire(models, tried)
+            if endpoint is None:
+                break
+            try:
+                # Retries after the first attempt show up as their own stage
+                with span('upstream' if attempt == 0 else 'fallback', model=endpoint.model, key=endpoint.key_name):
+                    result = await self._invoke(endpoint, request)
+            except (ModelCallError, QuotaExceeded) as e:
+                last_error = e
+                continue
+            return result, {
+                'model': endpoint.model,
+                'billing_account': endpoint.key_name,
+                'fallback_count': attempt,
+            }
+        raise NoHealthyEndpoint(f'No healthy endpoint for {models or "any model"}: {last_error}')
+
+    async def _invoke(self, endpoint, request):
+        reservation = None
+        sent = False
+        started = time.monotonic()
+        try:
+            if self.quota_manager is not None:
+                with span('quota_check'):
+                    reservation = await self.quota_manager.reserve_async(endpoint.quota_key, tokens=0, requests=1)
+            sent = True
+            result = await self.backend.generate(endpoint.api_key, endpoint.model, request)
+        except QuotaExceeded:
+            with self._lock:
+                endpoint.in_flight -= 1
+                endpoint.headroom, endpoint.headroom_at = 0.0, time.time()
+            raise
+        except asyncio.CancelledError:
+            # Lost a hedge race: not an error, and its partial time would make a slow endpoint look fast.
+            # A request already sent may still be billed, so it counts against the quota.
+            with self._lock:
+                endpoint.in_flight -= 1
+            await self._settle(reservation, sent)
+            raise
+        except ModelCallError as e:
+            if reservation is not None:
+                await self.quota_manager.release_async(reservation)
+            self._record_error(endpoint, e)
+            raise
+        except Exception as e:
+            if reservation is not None:
+                await self.quota_manager.release_async(reservation)
+            self._record_error(endpoint, ModelCallError(str(e)))
+            raise ModelCallError(str(e)) from e
+        if reservation is not None:
+            await self.quota_manager.commit_async(reservation, tokens=result.get('usage', {}).get('total_tokens', 0))
+        self._record_success(endpoint, time.monotonic() - started)
+        return result
+
+    async def stream(self, request, models=None):
+        """Stream request from the healthiest endpoint: yields text chunks, then one
+        {'metadata': ...} dict. Fails over like call() until the first chunk arrives; after
+        that an error ends the stream. Needs a backend with `stream(api_key, model, request)`."""
+        self.start()
+        tried = []
+        last_error = None
+        for attempt in range(self.max_attempts):
+            endpoint = await self._acquire(models, tried)
+            if endpoint is None:
+                break
+            reservation = None
+            sent = streamed = False
+            started = time.monotonic()
+            try:
+                with span('upstream' if attempt == 0 else 'fallback', model=endpoint.model, key=endpoint.key_name,
+                          stream=True):
+                    if self.quota_manager is not None:
+                        with span('quota_check'):
+                            reservation = await self.quota_manager.reserve_async(endpoint.quota_key, tokens=0, requests=1)
+                    sent = True
+                    async for chunk in self.backend.stream(endpoint.api_key, endpoint.model, request):
+                        if chunk:
+                            streamed = True
+                            yield chunk
+            except QuotaExceeded as e:
+                with self._lock:
+                    endpoint.in_flight -= 1
+                    endpoint.headroom, endpoint.headroom_at = 0.0, time.time()
+                last_error = e
+                continue
+            except Exception as e:
+                error = e if isinstance(e, ModelCallError) else ModelCallError(str(e))
+                await self._settle(reservation, sent)
+                self._record_error(endpoint, error)
+                if streamed:
+                    raise error from e
+                last_error = error
+                continue
+            except BaseException:
+                # Cancelled or closed by the consumer: not the endpoint's fault
+                with self._lock:
+                    endpoint.in_flight -= 1
+                await self._settle(reservation, sent)
+                raise
+            await self._settle(reservation, sent)
+            self._record_success(endpoint, time.monotonic() - started)
+            yield {'metadata': {'model': endpoint.model, 'billing_account': endpoint.key_name,
+                                'fallback_count': attempt}}
+            return
+        raise NoHealthyEndpoint(f'No healthy endpoint for {models or "any model"}: {last_error}')
+
+    async def _settle(self, reservation, sent):
+        """Commit a reservation whose request went out (it may be billed), release it otherwise."""
+        if reservation is not None:
+            settle = self.quota_manager.commit if sent else self.quota_manager.release
+            await asyncio.shield(asyncio.to_thread(settle, reservation))
+
+    def _record_success(self, endpoint, elapsed):
+        with self._lock:
+            endpoint.in_flight -= 1
+            endpoint.stats['calls'] += 1
+            endpoint.rate_limits = 0
+            self._observe_latency(endpoint, elapsed)
+            endpoint.breaker.record_success()
+
+    @staticmethod
+    def _observe_latency(endpoint, elapsed):
+        endpoint.latency = elapsed if endpoint.latency is None else (
+            LATENCY_ALPHA * elapsed + (1 - LATENCY_ALPHA) * endpoint.latency)
+
+    def _record_error(self, endpoint, error):
+        now = time.time()
+        with self._lock:
+            endpoint.in_flight -= 1
+            endpoint.stats['calls'] += 1
+            if error.status == 429:
+                endpoint.stats['rate_limited'] += 1
+                endpoint.rate_limits += 1
+                backoff = min(self.max_delay, self.base_delay * 2 ** (endpoint.rate_limits - 1))
+                delay = error.retry_after if error.retry_after is not None else backoff * random.uniform(0.5, 1.0)
+                endpoint.cooldown_until = now + delay
+                return
+            endpoint.stats['errors'] += 1
+            was_open = endpoint.breaker.state == OPEN
+            endpoint.breaker.record_failure(error, now)
+        if not was_open and endpoint.breaker.state == OPEN:
+            self.log(f"Circuit opened for {endpoint.name}: {error}", level='WARNING')
+
+    # Background recovery
+
+    async def probe(self, endpoint):
+        """Send one probe to a half-open endpoint and close or re-open its breaker."""
+        endpoint.stats['probes'] += 1
+        try:
+            if hasattr(self.backend, 'probe'):
+                await self.backend.probe(endpoint.api_key, endpoint.model)
+            else:
+                await self.backend.generate(endpoint.api_key, endpoint.model, {'message': 'ping', 'max_tokens': 1})
+        except Exception as e:
+            with self._lock:
+                endpoint.breaker.record_failure(e, time.time())
+            return False
+        with self._lock:
+            endpoint.breaker.record_success()
+        self.log(f"Circuit closed for {endpoint.name} after successful probe", level='INFO')
+        return True
+
+    async def probe_due(self):
+        now = time.time()
+        with self._lock:
+            due = [e for e in self.endpoints if e.breaker.probe_due(now)]
+        if due:
+            await asyncio.gather(*(self.probe(e) for e in due))
+        return len(due)
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._probe_loop, name='model-router-probes', daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def stop(self):
+        self._stop.set()
+        with self._start_lock:
+            if self._thread is not None:
+                self._thread.join(timeout=5)
+                self._thread = None
+
+    def _probe_loop(self):
+        loop = asyncio.new_event_loop()
+        try:
+            while not self._stop.wait(self.probe_interval):
+                try:
+                    loop.run_until_complete(self.probe_due())
+                except Exception as e:
+                    self.log(f"Endpoint probe sweep failed: {e}", level='ERROR')
+        finally:
+            loop.close()
+
+    def get_status(self):
+        now = time.time()
+        with self._lock:
+            return [endpoint.status(now) for endpoint in self.endpoints]
+
+    def get_hedge_status(self):
+        return {**self.hedge_stats, 'enabled': bool(self.hedge_share), 'budget_ratio': self.hedge_share}
+
+
+class FakeModelBackend:
+    """In-process stand-in for Gemini with configurable latency and injected failures."""
+
+    def __init__(self, latency=0.01, jitter=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._faults = {}  # (api_key or None, model or None) -> {'error_rate', 'rate_limit_rate', 'fail_next', 'latency'}
+        self.calls = []
+
+    def inject(self, model=None, api_key=None, error_rate=0.0, rate_limit_rate=0.0, fail_next=0,
+               latency=None, retry_after=None):
+        self._faults[(api_key, model)] = {
+            'error_rate': error_rate, 'rate_limit_rate': rate_limit_rate, 'fail_next': fail_next,
+            'latency': latency, 'retry_after': retry_after,
+        }
+
+    def clear(self, model=None, api_key=None):
+        self._faults.pop((api_key, model), None)
+
+    def _fault(self, api_key, model):
+        for key in ((api_key, model), (None, model), (api_key, None), (None, None)):
+            if key in self._faults:
+                return self._faults[key]
+        return None
+
+    async def generate(self, api_key, model, request):
+        self.calls.append((api_key, model))
+        fault = self._fault(api_key, model)
+        latency = fault['latency'] if fault and fault['latency'] is not None else self.latency
+        await asyncio.sleep(max(0.0, latency + self._random.uniform(-self.jitter, self.jitter)))
+        if fault:
+            if fault['fail_next'] > 0:
+                fault['fail_next'] -= 1
+                raise ModelCallError(f'{model}: injected failure', status=500)
+            if self._random.random() < fault['rate_limit_rate']:
+                raise ModelCallError(f'{model}: resource exhausted', status=429, retry_after=fault['retry_after'])
+            if self._random.random() < fault['error_rate']:
+                raise ModelCallError(f'{model}: injected error', status=503)
+        message = request.get('message', '')
+        return {
+            'content': f'[{model}] {message}',
+            'usage': {'total_tokens': len(message.split()) + 1},
+        }
+
+    async def stream(self, api_key, model, request):
+        """generate(), delivered one word at a time."""
+        result = await self.generate(api_key, model, request)
+        for index, word in enumerate(result['content'].split(' ')):
+            await asyncio.sleep(0)
+            yield word if index == 0 else ' ' + word
+
+
+def _logger_log(message, level='INFO'):
+    logging.getLogger(__name__).log(getattr(logging, level, logging.INFO), message)
+
+
+def create_model_router(config, backend=None, quota_manager=None, log_func=None):
+    """The app's router: Gemini REST at GEMINI_API_BASE_URL, with the shared QuotaManager
+    so hedges draw on one budget across worker processes."""
+    from gemini_backend import GeminiHTTPBackend
+    from quota_manager import QuotaManager
+    log_func = log_func or _logger_log
+    if backend is None:
+        backend = GeminiHTTPBackend(config.get('GEMINI_API_BASE_URL') or 'https://generativelanguage.googleapis.com')
+    if quota_manager is None:
+        quota_manager = QuotaManager(config, log_func)
+    return ModelRouter(config, backend, quota_manager, log_func)
@@ -1,22 +1,292 @@
 """
 Quota and Usage Tracking for Mama Bear Agents
 - Tracks API/model usage, VM quotas, and alerts
+- Sliding-window limits per key (requests/min, tokens/min, tokens/day, ...) plus lifetime totals
+- Reserve-then-commit is atomic across worker processes via a shared SQLite file
+- Every write is a BEGIN IMMEDIATE transaction, so async callers use the *_async variants,
+  which run it on a worker thread instead of blocking the event loop
+- Expired reservations and buckets are pruned on reserve, commit and release, at most once
+  per PRUNE_INTERVAL
 """
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+# Limit names are "<unit>_per_<period>", e.g. requests_per_minute or tokens_per_day
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+BUCKETS_PER_WINDOW = 60
+LIFETIME = 0
+PRUNE_INTERVAL = 1.0  # Seconds between prunes per process
+
+
+class QuotaExceeded(Exception):
+    def __init__(self, key, limit_name, used, limit):
+        super().__init__(f"Quota exceeded for {key}: {limit_name} {used:g}/{limit:g}")
+        self.key = key
+        self.limit_name = limit_name
+        self.used = used
+        self.limit = limit
+
+
+class Reservation:
+    __slots__ = ('id', 'key', 'amounts')
+
+    def __init__(self, reservation_id, key, amounts):
+        self.id = reservation_id
+        self.key = key
+        self.amounts = amounts
+
+
+def parse_limits(spec):
+    """Normalize a quota entry to [(name, unit, window_seconds, limit)]; scalars are lifetime token limits."""
+    if spec is None:
+        return []
+    if not isinstance(spec, dict):
+        return [('tokens_total', 'tokens', LIFETIME, float(spec))]
+    limits = []
+    for name, limit in spec.items():
+        unit, _, period = name.partition('_per_')
+        if period not in PERIODS:
+            raise ValueError(f"Unknown quota period in {name!r}")
+        limits.append((name, unit, PERIODS[period], float(limit)))
+    return limits
+
+
 class QuotaManager:
     def __init__(self, config, log_func):
         self.config = config
         self.log = log_func
-        self.usage = {}
+        self.safety_margin = float(config.get('QUOTA_SAFETY_MARGIN', 0.0))
+        self.reservation_ttl = float(config.get('QUOTA_RESERVATION_TTL', 120))
+        self.db_path = config.get('QUOTA_DB_PATH', 'quota.db')
+        self._local = threading.local()
+        self._tracked = {}  # key -> extra windows recorded without a configured limit
+        self._pruned_at = 0.0
+        self._init_schema()
         self.log('QuotaManager initialized', level='INFO')
-    def record_usage(self, key, amount):
-        self.usage[key] = self.usage.get(key, 0) + amount
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _init_schema(self):
+        conn = self._conn()
+        conn.executescript(
+            "CREATE TABLE IF NOT EXISTS quota_buckets ("
+            " key TEXT, unit TEXT, window INTEGER, bucket INTEGER, amount REAL,"
+            " PRIMARY KEY (key, unit, window, bucket)) WITHOUT ROWID;"
+            "CREATE TABLE IF NOT EXISTS quota_reservations ("
+            " id TEXT, key TEXT, unit TEXT, amount REAL, expires REAL,"
+            " PRIMARY KEY (id, unit));"
+            "CREATE INDEX IF NOT EXISTS ix_quota_reservations_key ON quota_reservations (key, unit, expires);"
+        )
+
+    def _limits(self, key):
+        return parse_limits(self.config.get('quota', {}).get(key))
+
+    def _effective(self, limit):
+        return limit * (1.0 - self.safety_margin)
+
+    @staticmethod
+    def _bucket_width(window):
+        return max(1, window // BUCKETS_PER_WINDOW)
+
+    def _used(self, conn, key, unit, window, now):
+        if window == LIFETIME:
+            used = conn.execute(
+                "SELECT COALESCE(SUM(amount), 0) FROM quota_buckets WHERE key = ? AND unit = ? AND window = ?",
+                (key, unit, LIFETIME),
+            ).fetchone()[0]
+        else:
+            width = self._bucket_width(window)
+            oldest = int(now // width) - BUCKETS_PER_WINDOW + 1
+            used = conn.execute(
+                "SELECT COALESCE(SUM(amount), 0) FROM quota_buckets"
+                " WHERE key = ? AND unit = ? AND window = ? AND bucket >= ?",
+                (key, unit, window, oldest),
+            ).fetchone()[0]
+        reserved = conn.execute(
+            "SELECT COALESCE(SUM(amount), 0) FROM quota_reservations WHERE key = ? AND unit = ? AND expires > ?",
+            (key, unit, now),
+        ).fetchone()[0]
+        return used + reserved
+
+    def _record(self, conn, key, amounts, now):
+        windows = {LIFETIME} | {window for _n, _u, window, _l in self._limits(key)} | self._tracked.get(key, set())
+        rows = []
+        for unit, amount in amounts.items():
+            if not amount:
+                continue
+            for window in windows:
+                bucket = 0 if window == LIFETIME else int(now // self._bucket_width(window))
+                rows.append((key, unit, window, bucket, amount))
+        conn.executemany(
+            "INSERT INTO quota_buckets (key, unit, window, bucket, amount) VALUES (?, ?, ?, ?, ?)"
+            " ON CONFLICT (key, unit, window, bucket) DO UPDATE SET amount = amount + excluded.amount",
+            rows,
+        )
+
+    def _prune(self, conn, now):
+        if now - self._pruned_at < PRUNE_INTERVAL:
+            return
+        self._pruned_at = now
+        conn.execute("DELETE FROM quota_reservations WHERE expires <= ?", (now,))
+        conn.execute(
+            "DELETE FROM quota_buckets WHERE window > 0"
+            " AND bucket < CAST(? / MAX(1, window / ?) AS INTEGER) - ?",
+            (now, BUCKETS_PER_WINDOW, BUCKETS_PER_WINDOW),
+        )
+
+    def reserve(self, key, tokens=0, requests=1):
+        """Atomically hold capacity for a call; raises QuotaExceeded if any window would overflow."""
+        amounts = {'requests': requests, 'tokens': tokens}
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._prune(conn, now)
+            for name, unit, window, limit in self._limits(key):
+                used = self._used(conn, key, unit, window, now)
+                if used + amounts.get(unit, 0) > self._effective(limit):
+                    raise QuotaExceeded(key, name, used, limit)
+            reservation = Reservation(uuid.uuid4().hex, key, amounts)
+            conn.executemany(
+                "INSERT INTO quota_reservations (id, key, unit, amount, expires) VALUES (?, ?, ?, ?, ?)",
+                [(reservation.id, key, unit, amount, now + self.reservation_ttl) for unit, amount in amounts.items()],
+            )
+            conn.execute("COMMIT")
+        except QuotaExceeded as e:
+            conn.execute("ROLLBACK")
+            if self.config.get('LOG_QUOTA_WARNINGS', True):
+                self.log(str(e), level='WARNING')
+            raise
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return reservation
+
+    def commit(self, reservation, tokens=None, requests=None):
+        """Replace a reservation with the actual usage."""
+        amounts = dict(reservation.amounts)
+        if tokens is not None:
+            amounts['tokens'] = tokens
+        if requests is not None:
+            amounts['requests'] = requests
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM quota_reservations WHERE id = ?", (reservation.id,))
+            self._record(conn, reservation.key, amounts, now)
+            self._prune(conn, now)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self.log(f"Usage recorded: {reservation.key} += {amounts}", level='DEBUG')
+
+    def track(self, key, window):
+        """Keep sliding-window usage for key over window seconds even though it has no limit."""
+        self._tracked.setdefault(key, set()).add(window)
+
+    def reserve_share(self, key, base_key, share, window, requests=1):
+        """Reserve requests on key only while its windowed count stays within share of base_key's.
+        Both keys must be tracked for window; raises QuotaExceeded otherwise."""
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            used = self._used(conn, key, 'requests', window, now)
+            allowed = share * self._used(conn, base_key, 'requests', window, now)
+            if used + requests > allowed:
+                raise QuotaExceeded(key, f'share_of_{base_key}', used, allowed)
+            reservation = Reservation(uuid.uuid4().hex, key, {'requests': requests})
+            conn.execute(
+                "INSERT INTO quota_reservations (id, key, unit, amount, expires) VALUES (?, ?, 'requests', ?, ?)",
+                (reservation.id, key, requests, now + self.reservation_ttl),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return reservation
+
+    def release(self, reservation):
+        """Drop a reservation whose call never happened."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM quota_reservations WHERE id = ?", (reservation.id,))
+            self._prune(conn, time.time())
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def record_usage(self, key, amount, requests=1):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._record(conn, key, {'tokens': amount, 'requests': requests}, time.time())
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
         self.log(f"Usage recorded: {key} += {amount}", level='DEBUG')
+
+    # Event-loop friendly wrappers: the same transactions, run on a worker thread
+
+    async def reserve_async(self, key, tokens=0, requests=1):
+        return await asyncio.to_thread(self.reserve, key, tokens, requests)
+
+    async def commit_async(self, reservation, tokens=None, requests=None):
+        await asyncio.to_thread(self.commit, reservation, tokens, requests)
+
+    async def release_async(self, reservation):
+        await asyncio.to_thread(self.release, reservation)
+
+    async def reserve_share_async(self, key, base_key, share, window, requests=1):
+        return await asyncio.to_thread(self.reserve_share, key, base_key, share, window, requests)
+
+    async def record_usage_async(self, key, amount, requests=1):
+        await asyncio.to_thread(self.record_usage, key, amount, requests)
+
     def get_status(self):
-        return dict(self.usage)
+        rows = self._conn().execute(
+            "SELECT key, amount FROM quota_buckets WHERE unit = 'tokens' AND window = ?", (LIFETIME,)
+        ).fetchall()
+        return dict(rows)
+
+    def get_usage(self, key):
+        """Current usage against every configured limit for a key."""
+        conn = self._conn()
+        now = time.time()
+        usage = {}
+        for name, unit, window, limit in self._limits(key):
+            used = self._used(conn, key, unit, window, now)
+            usage[name] = {'used': used, 'limit': limit, 'effective_limit': self._effective(limit)}
+        return usage
+
+    def headroom(self, key):
+        """Smallest remaining fraction across a key's limits (1.0 when unlimited)."""
+        fractions = [
+            max(0.0, 1.0 - u['used'] / u['effective_limit']) if u['effective_limit'] > 0 else 0.0
+            for u in self.get_usage(key).values()
+        ]
+        return min(fractions, default=1.0)
+
     def check_quota(self, key):
-        limit = self.config.get('quota', {}).get(key)
-        used = self.usage.get(key, 0)
-        if limit is not None and used >= limit:
-            self.log(f"Quota exceeded for {key}", level='WARNING')
-            return False
+        for name, u in self.get_usage(key).items():
+            if u['used'] >= u['effective_limit']:
+                self.log(f"Quota exceeded for {key}", level='WARNING')
+                return False
         return True
@@ -0,0 +1,144 @@
+"""
+Micro-batching dispatcher for non-interactive model requests
+- Collects concurrent requests per key (variant/model) up to BATCH_SIZE or a max-wait deadline
+- Submits each batch in one call and fans results back out to the waiting callers
+- A failing batch is retried item by item, so one bad request can't fail its neighbours
+- Runs its own event loop thread, since Flask gives every async view a separate loop; a batch
+  runs in a copy of its first caller's context (request trace, Flask context) and a retried
+  item in its own caller's
+"""
+import asyncio
+import concurrent.futures
+import contextvars
+import threading
+import time
+
+
+class BatcherFull(Exception):
+    """Raised when too many requests are already waiting for a batch."""
+
+
+class RequestBatcher:
+    def __init__(self, batch_fn, batch_size=5, max_wait=0.05, max_pending=1000, on_batch=None):
+        """batch_fn: async callable taking a list of payloads and returning one result
+        (or Exception instance) per payload, in order."""
+        self.batch_fn = batch_fn
+        self.batch_size = max(1, batch_size)
+        self.max_wait = max_wait
+        self.max_pending = max_pending
+        self.on_batch = on_batch
+        self._pending = {}  # key -> [(payload, future, enqueued_at, context)]
+        self._timers = {}
+        self._count = 0
+        self._count_lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.stats = {'batches': 0, 'items': 0, 'retried_items': 0}
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._loop.run_forever, name='request-batcher', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._loop is None:
+            return
+        done = asyncio.run_coroutine_threadsafe(self._flush_all(), self._loop)
+        done.result(timeout=30)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self._thread = None
+
+    def submit(self, payload, key='default'):
+        """Thread-safe; returns a concurrent.futures.Future for this payload's result."""
+        self.start()
+        with self._count_lock:
+            if self._count >= self.max_pending:
+                raise BatcherFull('request batcher queue is full')
+            self._count += 1
+        future = concurrent.futures.Future()
+        self._loop.call_soon_threadsafe(self._enqueue, key, payload, future, time.monotonic(),
+                                        contextvars.copy_context())
+        return future
+
+    async def submit_async(self, payload, key='default'):
+        return await asyncio.wrap_future(self.submit(payload, key))
+
+    @property
+    def depth(self):
+        return self._count
+
+    def _enqueue(self, key, payload, future, enqueued_at, context):
+        items = self._pending.setdefault(key, [])
+        items.append((payload, future, enqueued_at, context))
+        if len(items) >= self.batch_size:
+            self._flush(key)
+        elif key not in self._timers:
+            self._timers[key] = self._loop.call_later(self.max_wait, self._flush, key)
+
+    def _flush(self, key):
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        items = self._pending.pop(key, [])
+        while items:
+            batch, items = items[:self.batch_size], items[self.batch_size:]
+            self._loop.create_task(self._run_batch(batch), context=batch[0][3])
+
+    async def _flush_all(self):
+        for key in list(self._pending):
+            self._flush(key)
+        tasks = [t for t in asyncio.all_tasks(self._loop) if t is not asyncio.current_task()]
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run_batch(self, batch):
+        started = time.monotonic()
+        self.stats['batches'] += 1
+        self.stats['items'] += len(batch)
+        if self.on_batch is not None:
+            self.on_batch(len(batch), self.batch_size, [started - enqueued for _p, _f, enqueued, _c in batch])
+        try:
+            results = await self.batch_fn([payload for payload, _f, _e, _c in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(f'batch_fn returned {len(results)} results for {len(batch)} requests')
+        except Exception as e:
+            if len(batch) == 1:
+                self._resolve(batch[0][1], e)
+                return
+            # Isolate the failure: resubmit each request on its own
+            self.stats['retried_items'] += len(batch)
+            await asyncio.gather(*(self._loop.create_task(self._run_single(item), context=item[3]) for item in batch))
+            return
+        for (_payload, future, _enqueued, _context), result in zip(batch, results):
+            self._resolve(future, result)
+
+    async def _run_single(self, item):
+        payload, future, _enqueued, _context = item
+        try:
+            result = (await self.batch_fn([payload]))[0]
+        except Exception as e:
+            result = e
+        self._resolve(future, result)
+
+    def _resolve(self, future, result):
+        with self._count_lock:
+            self._count -= 1
+        if future.done():
+            return
+        if isinstance(result, BaseException):
+            future.set_exception(result)
+        else:
+            future.set_result(result)
+
+    def get_status(self):
+        batches = self.stats['batches']
+        return {
+            **self.stats,
+            'pending': self._count,
+            'avg_fill_ratio': self.stats['items'] / (batches * self.batch_size) if batches else 0.0,
+        }
@@ -0,0 +1,150 @@
+"""
+Response cache for Mama Bear model calls
+- Keyed on (variant system prompt, normalized message, model, sampling parameters)
+- In-memory tier with TTL and LRU eviction bounded by total bytes
+- Optional SQLite tier on disk so warm entries survive restarts
+"""
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_message(message):
+    return _WHITESPACE.sub(' ', unicodedata.normalize('NFC', message)).strip()
+
+def make_cache_key(system_prompt, message, model, temperature, top_p, top_k):
+    material = json.dumps(
+        [system_prompt, normalize_message(message), model, temperature, top_p, top_k],
+        ensure_ascii=False, separators=(',', ':'),
+    )
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+class _DiskTier:
+    def __init__(self, path, max_bytes):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS response_cache ("
+            " key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, expires REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_response_cache_expires ON response_cache (expires)")
+
+    def get(self, key, now):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires FROM response_cache WHERE key = ? AND expires > ?", (key, now)
+            ).fetchone()
+        return row
+
+    def put(self, key, value, expires):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO response_cache (key, value, size, expires) VALUES (?, ?, ?, ?)",
+                (key, value, len(value), expires),
+            )
+
+    def prune(self, now):
+        """Drop expired rows, then the soonest-to-expire until under max_bytes; returns rows evicted."""
+        with self._lock:
+            evicted = self._conn.execute("DELETE FROM response_cache WHERE expires <= ?", (now,)).rowcount
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM response_cache").fetchone()[0]
+            while total > self.max_bytes:
+                row = self._conn.execute(
+                    "SELECT key, size FROM response_cache ORDER BY expires LIMIT 1"
+                ).fetchone()
+                if row is None:
+                    break
+                self._conn.execute("DELETE FROM response_cache WHERE key = ?", (row[0],))
+                total -= row[1]
+                evicted += 1
+        return evicted
+
+
+class ResponseCache:
+    def __init__(self, ttl=3600, max_bytes=64 * 1024 * 1024, disk_path=None,
+                 disk_max_bytes=512 * 1024 * 1024, on_event=None):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.on_event = on_event
+        self._items = OrderedDict()  # key -> (encoded value, expires)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._disk = _DiskTier(disk_path, disk_max_bytes) if disk_path else None
+        self._puts_since_prune = 0
+        self.stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0, 'expired': 0}
+
+    def _event(self, name, count=1):
+        self.stats[name] += count
+        if self.on_event is not None:
+            self.on_event(name, count)
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires > now:
+                    self._items.move_to_end(key)
+                    self._event('hits')
+                    return json.loads(value)
+                self._remove(key)
+                self._event('expired')
+        if self._disk is not None:
+            row = self._disk.get(key, now)
+            if row is not None:
+                value, expires = row
+                with self._lock:
+                    self._insert(key, value, expires)
+                self._event('disk_hits')
+                return json.loads(value)
+        self._event('misses')
+        return None
+
+    def put(self, key, response):
+        value = json.dumps(response, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        expires = time.time() + self.ttl
+        with self._lock:
+            self._insert(key, value, expires)
+        if self._disk is not None:
+            self._disk.put(key, value, expires)
+            self._puts_since_prune += 1
+            if self._puts_since_prune >= 100:
+                self._puts_since_prune = 0
+                evicted = self._disk.prune(time.time())
+                if evicted:
+                    self._event('evictions', evicted)
+
+    def _insert(self, key, value, expires):
+        if len(value) > self.max_bytes:
+            return
+        if key in self._items:
+            self._remove(key)
+        self._items[key] = (value, expires)
+        self._bytes += len(value)
+        evicted = 0
+        while self._bytes > self.max_bytes:
+            old_key = next(iter(self._items))
+            self._remove(old_key)
+            evicted += 1
+        if evicted:
+            self._event('evictions', evicted)
+
+    def _remove(self, key):
+        value, _expires = self._items.pop(key)
+        self._bytes -= len(value)
+
+    def get_status(self):
+        with self._lock:
+            return {**self.stats, 'entries': len(self._items), 'bytes': self._bytes}
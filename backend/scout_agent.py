@@ -2,22 +2,36 @@
 Scout Agent Core Logic
 - Scrapybara orchestration, VM/desktop management
 - Extensible for multi-agent workflows
+- With a VMPool, VMs are leased warm and handed back instead of booted and torn down per job
 """
 class ScoutAgent:
-    def __init__(self, scrapybara_client, log_func):
+    def __init__(self, scrapybara_client, log_func, vm_pool=None):
         self.scrapybara = scrapybara_client
         self.log = log_func
+        self.vm_pool = vm_pool
         self.log('ScoutAgent initialized', level='INFO')
-    def spin_up_vm(self, vm_type):
-        # Placeholder for Scrapybara VM orchestration
-        self.log(f"Spinning up VM: {vm_type}", level='INFO')
-        # ...actual SDK call goes here...
-        pass
+    def spin_up_vm(self, vm_type, timeout=120):
+        if self.vm_pool is None:
+            # Placeholder for Scrapybara VM orchestration
+            self.log(f"Spinning up VM: {vm_type}", level='INFO')
+            # ...actual SDK call goes here...
+            return None
+        lease = self.vm_pool.lease(vm_type, timeout=timeout)
+        self.log(f"Leased {'cold' if lease.cold else 'warm'} VM {lease.instance_id} ({vm_type}) in {lease.wait:.2f}s", level='INFO')
+        return lease.instance_id
     def monitor_vm(self, vm_id):
-        # Placeholder for VM monitoring
         self.log(f"Monitoring VM: {vm_id}", level='INFO')
-        pass
+        if self.vm_pool is not None:
+            return self.vm_pool.client.status(vm_id)
+        # Placeholder for VM monitoring
+        return None
+    def release_vm(self, vm_id):
+        """Return a VM to the pool for reuse once a job is done with it."""
+        self.log(f"Releasing VM: {vm_id}", level='INFO')
+        if self.vm_pool is not None:
+            self.vm_pool.release(vm_id)
     def terminate_vm(self, vm_id):
-        # Placeholder for VM termination
         self.log(f"Terminating VM: {vm_id}", level='INFO')
-        pass
+        if self.vm_pool is not None:
+            self.vm_pool.terminate(vm_id)
+        # Placeholder for VM termination when no pool is attached
@@ -2,35 +2,100 @@
 Scrapybara SDK Integration
 - Manages VM/desktop orchestration endpoints
 - Uses config from .env and mama_bear_config_setup.py
+- VMs are leased from a pre-warmed pool (vm_pool.py) instead of booted per request
+- Statuses come from one background sweep (vm_status.py), served in bulk and pushed as deltas
 """
-import os
-from flask import Blueprint, request, jsonify
-# from scrapybara import Scrapybara  # Uncomment when SDK is installed
+from flask import Blueprint, request, jsonify, current_app
+from vm_pool import PoolExhausted, create_vm_pool
+from vm_status import VMStatusCollector, register_vm_status_handlers
 
 bp = Blueprint('scrapybara', __name__)
 
-# Placeholder for Scrapybara client init
+def get_vm_pool():
+    """The app's VM pool, built from config on first use (app.extensions['vm_pool'])."""
+    pool = current_app.extensions.get('vm_pool')
+    if pool is None:
+        pool = current_app.extensions['vm_pool'] = create_vm_pool(current_app.config)
+    return pool
+
 def get_scrapybara_client():
-    # api_key = os.environ.get('SCRAPYBARA_API_KEY')
-    # return Scrapybara(api_key=api_key)
-    return None
+    return get_vm_pool().client
+
+def get_vm_status_collector():
+    """The app's status collector (app.extensions['vm_status']), pushing over the app's SocketIO if any."""
+    collector = current_app.extensions.get('vm_status')
+    if collector is None:
+        pool = get_vm_pool()
+        socketio = current_app.extensions.get('socketio')
+        collector = VMStatusCollector(
+            pool.client,
+            pool=pool,
+            interval=current_app.config.get('VM_STATUS_INTERVAL', 5),
+            concurrency=current_app.config.get('VM_STATUS_CONCURRENCY', 8),
+            chunk_size=current_app.config.get('VM_STATUS_CHUNK_SIZE', 25),
+            emit=(lambda event, data, room: socketio.emit(event, data, to=room)) if socketio is not None else None,
+        )
+        current_app.extensions['vm_status'] = collector
+        collector.start()
+    return collector
+
+def init_scrapybara(app, start=True):
+    """Register the status SocketIO handlers; start=False leaves the VM pool and status
+    collector to be created on first use."""
+    socketio = app.extensions.get('socketio')
+    if socketio is not None:
+        register_vm_status_handlers(socketio, get_vm_status_collector)
+    if start:
+        with app.app_context():
+            get_vm_status_collector()
 
 @bp.route('/scrapybara/start_vm', methods=['POST'])
 def start_vm():
-    # client = get_scrapybara_client()
     vm_type = request.json.get('type', 'ubuntu')
-    # instance = client.start_ubuntu() if vm_type == 'ubuntu' else client.start_windows()
-    # For now, just log and return a stub
-    return jsonify({"status": "started", "vm_type": vm_type, "instance_id": "stub-id"})
+    timeout = current_app.config.get('VM_LEASE_TIMEOUT', 120)
+    try:
+        lease = get_vm_pool().lease(vm_type, timeout=timeout)
+    except PoolExhausted as e:
+        return jsonify({"status": "unavailable", "vm_type": vm_type, "error": str(e)}), 503
+    except Exception as e:
+        return jsonify({"status": "error", "vm_type": vm_type, "error": str(e)}), 502
+    get_vm_status_collector().track(lease.instance_id, vm_type)
+    return jsonify({"status": "started", **lease.to_dict()})
 
 @bp.route('/scrapybara/monitor_vm/<instance_id>', methods=['GET'])
 def monitor_vm(instance_id):
-    # client = get_scrapybara_client()
-    # status = client.get_instance_status(instance_id)
-    return jsonify({"instance_id": instance_id, "status": "running"})
+    collector = get_vm_status_collector()
+    row = collector.get(instance_id)
+    if row is not None:
+        return jsonify(row)
+    # Not swept yet: ask the provider once, and keep it in the sweep only if the provider knows it
+    try:
+        status = get_scrapybara_client().status(instance_id)
+    except Exception as e:
+        return jsonify({"instance_id": instance_id, "error": f"Unknown instance: {e}"}), 404
+    if status in ('terminated', 'unknown', None):
+        return jsonify({"instance_id": instance_id, "error": "Unknown instance"}), 404
+    collector.track(instance_id)
+    return jsonify({"instance_id": instance_id, "status": status})
+
+@bp.route('/scrapybara/vms', methods=['GET'])
+def list_vms():
+    """Every known VM's last swept status; ?since_version=N returns only what changed after N."""
+    since = request.args.get('since_version', type=int)
+    return jsonify(get_vm_status_collector().changes(since))
+
+@bp.route('/scrapybara/release_vm/<instance_id>', methods=['POST'])
+def release_vm(instance_id):
+    """Hand a leased VM back to the pool so the next Scout job gets it warm."""
+    if not get_vm_pool().release(instance_id):
+        return jsonify({"instance_id": instance_id, "error": "Instance is not leased from the pool"}), 404
+    return jsonify({"instance_id": instance_id, "status": "released"})
 
 @bp.route('/scrapybara/terminate_vm/<instance_id>', methods=['POST'])
 def terminate_vm(instance_id):
-    # client = get_scrapybara_client()
-    # client.terminate_instance(instance_id)
+    get_vm_pool().terminate(instance_id)
     return jsonify({"instance_id": instance_id, "status": "terminated"})
+
+@bp.route('/scrapybara/pool', methods=['GET'])
+def pool_status():
+    return jsonify(get_vm_pool().get_status())
@@ -0,0 +1,133 @@
+"""
+Semantic (near-duplicate) response cache for Mama Bear chat
+- Messages are embedded locally with signed feature hashing (word unigrams + bigrams), no network
+- One bounded float32 matrix per namespace (variant + model settings); lookup is a single
+  vectorized dot product against every live row
+- Matrices start small and double up to capacity; full namespaces evict their
+  least-recently-used row
+- Namespace keys come from client-chosen model settings, so at most max_namespaces are kept,
+  the least recently used dropped first
+"""
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+try:
+    import numpy as np
+except ImportError:  # Semantic caching is optional
+    np = None
+
+_TOKEN = re.compile(r"[\w']+")
+
+
+class HashingEmbedder:
+    def __init__(self, dim=512):
+        self.dim = dim
+
+    def features(self, text):
+        words = _TOKEN.findall(text.lower())
+        return words + [f'{a} {b}' for a, b in zip(words, words[1:])]
+
+    def embed(self, text):
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for feature in self.features(text):
+            h = zlib.crc32(feature.encode('utf-8'))
+            vec[h % self.dim] += 1.0 if (h >> 31) & 1 else -1.0
+        norm = float(np.linalg.norm(vec))
+        return vec / norm if norm else vec
+
+
+class _Namespace:
+    INITIAL_ROWS = 16
+
+    def __init__(self, capacity, dim):
+        self.capacity = capacity
+        rows = min(capacity, self.INITIAL_ROWS)
+        self.vectors = np.zeros((rows, dim), dtype=np.float32)
+        self.expires = np.zeros(rows, dtype=np.float64)  # 0 marks a free slot
+        self.last_used = np.zeros(rows, dtype=np.float64)
+        self.responses = [None] * rows
+
+    def grow(self):
+        """Double the rows (up to capacity); returns the first new slot, or None when full."""
+        rows = len(self.responses)
+        if rows >= self.capacity:
+            return None
+        extra = min(self.capacity, rows * 2) - rows
+        self.vectors = np.vstack([self.vectors, np.zeros((extra, self.vectors.shape[1]), dtype=np.float32)])
+        self.expires = np.concatenate([self.expires, np.zeros(extra)])
+        self.last_used = np.concatenate([self.last_used, np.zeros(extra)])
+        self.responses.extend([None] * extra)
+        return rows
+
+
+class SemanticCache:
+    def __init__(self, threshold=0.85, capacity=1000, dim=512, ttl=3600, max_namespaces=64, on_event=None):
+        if np is None:
+            raise ImportError("numpy is required for the semantic cache")
+        self.threshold = threshold
+        self.capacity = capacity
+        self.ttl = ttl
+        self.on_event = on_event
+        self.max_namespaces = max(1, max_namespaces)
+        self.embedder = HashingEmbedder(dim)
+        self._namespaces = OrderedDict()  # Least recently used first
+        self._lock = threading.Lock()
+
+    def _event(self, name):
+        if self.on_event is not None:
+            self.on_event(name, 1)
+
+    def lookup(self, namespace, message):
+        """Return (response, similarity) for the closest live entry above threshold, else (None, best)."""
+        query = self.embedder.embed(message)
+        now = time.time()
+        with self._lock:
+            ns = self._namespaces.get(namespace)
+            if ns is None:
+                self._event('semantic_misses')
+                return None, 0.0
+            self._namespaces.move_to_end(namespace)
+            scores = ns.vectors @ query
+            scores[ns.expires <= now] = -1.0
+            best = int(np.argmax(scores))
+            similarity = float(scores[best])
+            if similarity >= self.threshold:
+                ns.last_used[best] = now
+                self._event('semantic_hits')
+                return ns.responses[best], similarity
+        self._event('semantic_misses')
+        return None, similarity
+
+    def store(self, namespace, message, response):
+        vec = self.embedder.embed(message)
+        if not vec.any():
+            return
+        now = time.time()
+        with self._lock:
+            ns = self._namespaces.get(namespace)
+            if ns is None:
+                while len(self._namespaces) >= self.max_namespaces:
+                    self._namespaces.popitem(last=False)
+                    self._event('semantic_namespace_evictions')
+                ns = self._namespaces[namespace] = _Namespace(self.capacity, self.embedder.dim)
+            self._namespaces.move_to_end(namespace)
+            free = np.flatnonzero(ns.expires <= now)
+            if free.size:
+                slot = int(free[0])
+            else:
+                slot = ns.grow()
+                if slot is None:
+                    slot = int(np.argmin(ns.last_used))
+                    self._event('semantic_evictions')
+            ns.vectors[slot] = vec
+            ns.expires[slot] = now + self.ttl
+            ns.last_used[slot] = now
+            ns.responses[slot] = response
+
+    def get_status(self):
+        now = time.time()
+        with self._lock:
+            return {name: int((ns.expires > now).sum()) for name, ns in self._namespaces.items()}
@@ -0,0 +1,223 @@
+"""
+Lazy startup support for the backend bootstrap
+- StartupTimer records import and startup-phase durations into one report, printed at the
+  end of startup and served from /health so regressions show up
+- LazyIntegration defers an optional integration's import and setup until its first use
+- LazyApp is a WSGI dispatcher: /health answers while the full app is still being built in
+  the background, then every request (the app's own /health included) goes to the full app;
+  the startup report stays at /health/startup
+- serve() runs the dispatcher on the server SocketIO.run would pick (eventlet, gevent, else
+  werkzeug), so SocketIO traffic is served the same way as on the eager path
+- Model warm-up runs on its own thread and loop once the app is up
+"""
+import asyncio
+import contextlib
+import importlib
+import json
+import threading
+import time
+
+
+class StartupTimer:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = []  # (name, seconds), in completion order
+        self.imports = []
+        self.ready_at = None
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds):
+        with self._lock:
+            self.phases.append((name, seconds))
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def timed_import(self, module_name):
+        """importlib.import_module, recording how long it took (near zero if already imported)."""
+        started = time.perf_counter()
+        module = importlib.import_module(module_name)
+        with self._lock:
+            self.imports.append((module_name, time.perf_counter() - started))
+        return module
+
+    def mark_ready(self):
+        self.ready_at = time.perf_counter()
+
+    def report(self):
+        with self._lock:
+            return {
+                'uptime': time.perf_counter() - self.started,
+                'time_to_ready': self.ready_at - self.started if self.ready_at is not None else None,
+                'phases': [{'name': n, 'seconds': round(s, 4)} for n, s in self.phases],
+                'imports': [{'module': m, 'seconds': round(s, 4)} for m, s in self.imports],
+            }
+
+    def format_report(self):
+        report = self.report()
+        lines = ['Startup timing:']
+        for item in report['imports']:
+            lines.append(f"  import {item['module']:<32} {item['seconds'] * 1000:8.1f} ms")
+        for item in report['phases']:
+            lines.append(f"  {item['name']:<39} {item['seconds'] * 1000:8.1f} ms")
+        if report['time_to_ready'] is not None:
+            lines.append(f"  {'ready after':<39} {report['time_to_ready'] * 1000:8.1f} ms")
+        return '\n'.join(lines)
+
+
+class LazyIntegration:
+    """Loads on first call to get() (thread-safe, once); a failed load is remembered, not retried."""
+
+    def __init__(self, name, loader, timer=None):
+        self.name = name
+        self.loader = loader
+        self.timer = timer
+        self._value = None
+        self._error = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def get(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    started = time.perf_counter()
+                    try:
+                        self._value = self.loader()
+                    except ImportError as e:
+                        self._error = e
+                        print(f"[INFO] {self.name} integration unavailable: {e}")
+                    if self.timer is not None:
+                        self.timer.record(f'lazy {self.name}', time.perf_counter() - started)
+                    self._loaded = True
+        return self._value
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    def __call__(self, *args, **kwargs):
+        """Call the loaded integration; a no-op returning None when it is unavailable."""
+        target = self.get()
+        return target(*args, **kwargs) if target is not None else None
+
+
+class Warmup:
+    """Runs an async warm-up callable on a daemon thread with its own event loop."""
+
+    def __init__(self, coro_fn, name='warm-up'):
+        self.coro_fn = coro_fn
+        self.name = name
+        self.state = 'pending'
+        self.error = None
+        self.seconds = None
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        self.state = 'running'
+        started = time.perf_counter()
+        try:
+            asyncio.run(self.coro_fn())
+            self.state = 'done'
+        except Exception as e:
+            self.error = str(e)
+            self.state = 'failed'
+            print(f"[WARN] {self.name} failed: {e}")
+        self.seconds = time.perf_counter() - started
+
+    def to_dict(self):
+        return {'state': self.state, 'seconds': self.seconds, 'error': self.error}
+
+
+class LazyApp:
+    """WSGI app that serves /health itself until build() has produced the full app."""
+
+    def __init__(self, timer, health_path='/health', startup_path='/health/startup'):
+        self.timer = timer
+        self.health_path = health_path
+        self.startup_path = startup_path
+        self.app = None
+        self.error = None
+        self.warmup = None
+
+    def build_in_background(self, build):
+        """build() returns the full WSGI app (optionally as (app, warmup))."""
+        def run():
+            try:
+                with self.timer.phase('build app'):
+                    result = build()
+                self.app, self.warmup = result if isinstance(result, tuple) else (result, None)
+                self.timer.mark_ready()
+                print(self.timer.format_report())
+            except Exception as e:
+                self.error = str(e)
+                print(f"[ERROR] Failed to start Mama Bear system: {e}")
+        threading.Thread(target=run, name='app-builder', daemon=True).start()
+
+    @property
+    def status(self):
+        if self.error is not None:
+            return 'failed'
+        return 'ready' if self.app is not None else 'starting'
+
+    def health(self):
+        return {
+            'status': self.status,
+            'error': self.error,
+            'warm_up': self.warmup.to_dict() if self.warmup is not None else None,
+            'startup': self.timer.report(),
+        }
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO')
+        if self.app is not None and path != self.startup_path:
+            return self.app(environ, start_response)
+        if path in (self.health_path, self.startup_path):
+            code = '500 INTERNAL SERVER ERROR' if self.error is not None else '200 OK'
+            body = self.health()
+        else:
+            code = '503 SERVICE UNAVAILABLE'
+            body = {'status': self.status, 'error': self.error or 'Backend is still starting'}
+        payload = json.dumps(body, default=str).encode('utf-8')
+        headers = [('Content-Type', 'application/json'), ('Content-Length', str(len(payload)))]
+        if code.startswith('503'):
+            headers.append(('Retry-After', '1'))
+        start_response(code, headers)
+        return [payload]
+
+
+def serve(wsgi_app, host, port):
+    """Serve wsgi_app with the server flask_socketio's SocketIO.run picks for the installed async
+    mode: eventlet, then gevent (with gevent-websocket when present), then werkzeug threaded."""
+    try:
+        import eventlet
+        import eventlet.wsgi
+    except ImportError:
+        pass
+    else:
+        eventlet.wsgi.server(eventlet.listen((host, port)), wsgi_app)
+        return
+    try:
+        from gevent import pywsgi
+    except ImportError:
+        pass
+    else:
+        try:
+            from geventwebsocket.handler import WebSocketHandler
+            server = pywsgi.WSGIServer((host, port), wsgi_app, handler_class=WebSocketHandler)
+        except ImportError:
+            server = pywsgi.WSGIServer((host, port), wsgi_app)
+        server.serve_forever()
+        return
+    from werkzeug.serving import run_simple
+    run_simple(host, port, wsgi_app, threaded=True)
@@ -1,9 +1,34 @@
 """
 Taskmaster-AI backend module bootstrap
 """
-from .models import db
+from .models import db, ensure_schema
 from .api import bp
+from .writer import WriteBehindQueue
+from .storage import configure_engines
+from .search import ensure_search_index
+from .retention import RetentionJob
 
 def init_app(app):
     app.register_blueprint(bp, url_prefix='/podplay-planning')
     db.init_app(app)
+    configure_engines(app, db)
+    with app.app_context():
+        ensure_schema()
+        app.extensions['taskmaster_search'] = ensure_search_index(db.engine)
+    app.extensions['taskmaster_writer'] = WriteBehindQueue(
+        app, db,
+        batch_size=app.config.get('TASKMASTER_WRITE_BATCH_SIZE', 100),
+        flush_interval_ms=app.config.get('TASKMASTER_WRITE_FLUSH_MS', 50),
+        max_queue=app.config.get('TASKMASTER_WRITE_QUEUE_SIZE', 10000),
+    )
+    retention = RetentionJob(
+        app, db,
+        policy_hours=app.config.get('LOG_RETENTION_HOURS'),
+        default_hours=app.config.get('LOG_RETENTION_DEFAULT_HOURS', 24 * 30),
+        interval=app.config.get('RETENTION_INTERVAL', 600),
+        chunk_size=app.config.get('RETENTION_CHUNK_SIZE', 5000),
+        vacuum_pages=app.config.get('RETENTION_VACUUM_PAGES', 2000),
+    )
+    app.extensions['taskmaster_retention'] = retention
+    if app.config.get('RETENTION_ENABLED', True):
+        retention.start()
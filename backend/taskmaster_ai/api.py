@@ -1,60 +1,233 @@
 """
 API endpoints for Podplay Planning & Logging System
 - Logs, Tasks, Plans, ContextSnapshots
+- Single-record POSTs go through the write-behind queue; /batch endpoints take arrays or NDJSON
+- Context snapshots are listed as metadata; bodies are fetched by id and decompressed lazily
+- Logs past their retention window are served as hourly rollups; /retention reports pruning
+- /search runs ranked full-text queries over logs, plans and snapshots
+- List endpoints read through the query_only engine, page with ?cursor=&limit= and filter with ?since=&until= (plus level/status)
 """
-from flask import Blueprint, request, jsonify
-from .models import db, Log, Task, Plan, ContextSnapshot
+import json
+from flask import Blueprint, request, jsonify, current_app
+from sqlalchemy.exc import DataError, IntegrityError, OperationalError, SQLAlchemyError
+from sqlalchemy.orm import defer
+from tracing import span
+from .models import db, Log, Task, Plan, ContextSnapshot, LogRollup
+from .writer import QueueFull
+from .pagination import paginate, split_param
+from .storage import read_session
+from .search import SOURCES, search, to_match_query
+from .snapshots import new_snapshot, load_content
 
 bp = Blueprint('podplay_planning', __name__)
 
+
+def _log_from(data):
+    return Log(level=data.get('level', 'INFO'), message=data['message'], context=data.get('context', ''))
+
+def _task_from(data):
+    return Task(title=data['title'], status=data.get('status', 'pending'), details=data.get('details', ''))
+
+def _plan_from(data):
+    return Plan(description=data['description'], steps=data.get('steps', ''))
+
+def _snapshot_from(data):
+    return new_snapshot(data['snapshot'], agent_id=data.get('agent_id'), session_id=data.get('session_id'))
+
+def _task_dict(t):
+    iso = lambda value: value.isoformat() if value else None
+    return {'id': t.id, 'created_at': t.created_at.isoformat(), 'updated_at': t.updated_at.isoformat(), 'title': t.title,
+            'status': t.status, 'details': t.details, 'task_key': t.task_key, 'priority': t.priority,
+            'started_at': iso(t.started_at), 'finished_at': iso(t.finished_at)}
+
+def _snapshot_meta(s):
+    return {'id': s.id, 'timestamp': s.timestamp.isoformat(), 'agent_id': s.agent_id, 'session_id': s.session_id,
+            'content_hash': s.content_hash, 'size': s.size if s.content_hash else len(s.snapshot or '')}
+
+
+def _read_records():
+    """Parse a batch body: a JSON array, or one JSON object per line for NDJSON."""
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        lines = request.get_data(as_text=True).splitlines()
+        return [json.loads(line) for line in lines if line.strip()]
+    records = request.get_json()
+    if not isinstance(records, list):
+        raise ValueError('expected a JSON array of records')
+    return records
+
+def _create_one(build):
+    if not isinstance(request.json, dict):
+        return jsonify({'error': 'expected a JSON object'}), 400
+    try:
+        obj = build(request.json)
+    except KeyError as e:
+        return jsonify({'error': f'missing field {e}'}), 400
+    writer = current_app.extensions['taskmaster_writer']
+    try:
+        pending = writer.submit(obj)
+    except QueueFull as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
+    if request.args.get('wait', 'true').lower() == 'false':
+        pending.detach()
+        return jsonify({'queued': True}), 202
+    try:
+        # Queueing plus the writer's batched SQLite commit
+        with span('db_write_wait'):
+            obj_id = pending.wait(current_app.config.get('TASKMASTER_WRITE_WAIT_TIMEOUT', 30))
+    except TimeoutError:
+        pending.detach()
+        return jsonify({'queued': True}), 202
+    except (IntegrityError, DataError) as e:
+        return jsonify({'error': f'invalid record: {e.orig}'}), 400
+    except Exception as e:
+        return jsonify({'error': f"write failed: {getattr(e, 'orig', None) or e}"}), 500
+    return jsonify({'id': obj_id}), 201
+
+def _create_many(build):
+    try:
+        records = _read_records()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if len(records) > current_app.config.get('TASKMASTER_MAX_BULK_RECORDS', 5000):
+        return jsonify({'error': 'too many records in one batch'}), 413
+    objs = []
+    for i, data in enumerate(records):
+        if not isinstance(data, dict):
+            return jsonify({'error': f'record {i}: expected a JSON object'}), 400
+        try:
+            objs.append(build(data))
+        except KeyError as e:
+            return jsonify({'error': f'record {i}: missing field {e}'}), 400
+    try:
+        with span('db_commit', rows=len(objs)):
+            db.session.add_all(objs)
+            db.session.flush()
+            ids = [o.id for o in objs]
+            db.session.commit()
+    except (IntegrityError, DataError) as e:
+        db.session.rollback()
+        return jsonify({'error': f'invalid record: {e.orig}'}), 400
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        return jsonify({'error': f"write failed: {getattr(e, 'orig', None) or e}"}), 500
+    return jsonify({'ids': ids, 'count': len(ids)}), 201
+
+def _reader():
+    return read_session(current_app, db)
+
+def _page(query, ts_col, id_col, serialize):
+    try:
+        rows, next_cursor = paginate(query, ts_col, id_col, request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    headers = {'X-Next-Cursor': next_cursor} if next_cursor else {}
+    return jsonify([serialize(r) for r in rows]), 200, headers
+
+
 @bp.route('/podplay_logs', methods=['POST'])
 def create_log():
-    data = request.json
-    log = Log(level=data.get('level', 'INFO'), message=data['message'], context=data.get('context', ''))
-    db.session.add(log)
-    db.session.commit()
-    return jsonify({'id': log.id}), 201
+    return _create_one(_log_from)
+
+@bp.route('/podplay_logs/batch', methods=['POST'])
+def create_logs_batch():
+    return _create_many(_log_from)
 
 @bp.route('/podplay_logs', methods=['GET'])
 def get_logs():
-    logs = Log.query.order_by(Log.timestamp.desc()).limit(100).all()
-    return jsonify([{'id': l.id, 'timestamp': l.timestamp.isoformat(), 'level': l.level, 'message': l.message, 'context': l.context} for l in logs])
+    query = _reader().query(Log)
+    levels = split_param(request.args.get('level'))
+    if levels:
+        query = query.filter(Log.level.in_(levels))
+    return _page(query, Log.timestamp, Log.id, lambda l: {'id': l.id, 'timestamp': l.timestamp.isoformat(), 'level': l.level, 'message': l.message, 'context': l.context})
+
+@bp.route('/podplay_log_rollups', methods=['GET'])
+def get_log_rollups():
+    query = _reader().query(LogRollup)
+    levels = split_param(request.args.get('level'))
+    if levels:
+        query = query.filter(LogRollup.level.in_(levels))
+    return _page(query, LogRollup.bucket, LogRollup.id, lambda r: {'id': r.id, 'bucket': r.bucket.isoformat(), 'level': r.level, 'count': r.count, 'first_timestamp': r.first_timestamp.isoformat(), 'last_timestamp': r.last_timestamp.isoformat(), 'sample_message': r.sample_message})
+
+@bp.route('/retention', methods=['GET'])
+def get_retention():
+    return jsonify(current_app.extensions['taskmaster_retention'].describe())
+
+@bp.route('/retention/run', methods=['POST'])
+def run_retention():
+    return jsonify(current_app.extensions['taskmaster_retention'].run_once())
 
 @bp.route('/podplay_tasks', methods=['POST'])
 def create_task():
-    data = request.json
-    task = Task(title=data['title'], status=data.get('status', 'pending'), details=data.get('details', ''))
-    db.session.add(task)
-    db.session.commit()
-    return jsonify({'id': task.id}), 201
+    return _create_one(_task_from)
+
+@bp.route('/podplay_tasks/batch', methods=['POST'])
+def create_tasks_batch():
+    return _create_many(_task_from)
 
 @bp.route('/podplay_tasks', methods=['GET'])
 def get_tasks():
-    tasks = Task.query.order_by(Task.created_at.desc()).limit(100).all()
-    return jsonify([{'id': t.id, 'created_at': t.created_at.isoformat(), 'updated_at': t.updated_at.isoformat(), 'title': t.title, 'status': t.status, 'details': t.details} for t in tasks])
+    query = _reader().query(Task)
+    statuses = split_param(request.args.get('status'))
+    if statuses:
+        query = query.filter(Task.status.in_(statuses))
+    return _page(query, Task.created_at, Task.id, _task_dict)
 
 @bp.route('/podplay_plans', methods=['POST'])
 def create_plan():
-    data = request.json
-    plan = Plan(description=data['description'], steps=data.get('steps', ''))
-    db.session.add(plan)
-    db.session.commit()
-    return jsonify({'id': plan.id}), 201
+    return _create_one(_plan_from)
+
+@bp.route('/podplay_plans/batch', methods=['POST'])
+def create_plans_batch():
+    return _create_many(_plan_from)
 
 @bp.route('/podplay_plans', methods=['GET'])
 def get_plans():
-    plans = Plan.query.order_by(Plan.created_at.desc()).limit(100).all()
-    return jsonify([{'id': p.id, 'created_at': p.created_at.isoformat(), 'description': p.description, 'steps': p.steps} for p in plans])
+    return _page(_reader().query(Plan), Plan.created_at, Plan.id, lambda p: {'id': p.id, 'created_at': p.created_at.isoformat(), 'description': p.description, 'steps': p.steps})
 
 @bp.route('/podplay_context_snapshots', methods=['POST'])
 def create_context_snapshot():
-    data = request.json
-    snap = ContextSnapshot(snapshot=data['snapshot'])
-    db.session.add(snap)
-    db.session.commit()
-    return jsonify({'id': snap.id}), 201
+    return _create_one(_snapshot_from)
+
+@bp.route('/podplay_context_snapshots/batch', methods=['POST'])
+def create_context_snapshots_batch():
+    return _create_many(_snapshot_from)
 
 @bp.route('/podplay_context_snapshots', methods=['GET'])
 def get_context_snapshots():
-    snaps = ContextSnapshot.query.order_by(ContextSnapshot.timestamp.desc()).limit(100).all()
-    return jsonify([{'id': s.id, 'timestamp': s.timestamp.isoformat(), 'snapshot': s.snapshot} for s in snaps])
+    query = _reader().query(ContextSnapshot).options(defer(ContextSnapshot.snapshot))
+    for field in ('agent_id', 'session_id'):
+        if request.args.get(field):
+            query = query.filter(getattr(ContextSnapshot, field) == request.args[field])
+    return _page(query, ContextSnapshot.timestamp, ContextSnapshot.id, _snapshot_meta)
+
+@bp.route('/podplay_context_snapshots/<int:snapshot_id>', methods=['GET'])
+def get_context_snapshot(snapshot_id):
+    session = _reader()
+    snap = session.get(ContextSnapshot, snapshot_id)
+    if snap is None:
+        return jsonify({'error': 'snapshot not found'}), 404
+    return jsonify({**_snapshot_meta(snap), 'snapshot': load_content(session, snap)})
+
+@bp.route('/search', methods=['GET'])
+def search_records():
+    if not current_app.extensions.get('taskmaster_search'):
+        return jsonify({'error': 'full-text search is not available'}), 503
+    q = request.args.get('q', '').strip()
+    match = q if request.args.get('mode') == 'raw' else to_match_query(q)
+    if not match:
+        return jsonify({'error': 'q is required'}), 400
+    kinds = split_param(request.args.get('kind'))
+    unknown = [k for k in kinds if k not in SOURCES]
+    if unknown:
+        return jsonify({'error': f'unknown kind: {", ".join(unknown)}'}), 400
+    try:
+        limit = max(1, min(int(request.args.get('limit', 20)), 100))
+        offset = max(0, int(request.args.get('offset', 0)))
+    except ValueError:
+        return jsonify({'error': 'limit and offset must be integers'}), 400
+    try:
+        results = search(_reader(), match, kinds, limit + 1, offset)
+    except OperationalError as e:
+        return jsonify({'error': f'invalid search query: {e.orig}'}), 400
+    next_offset = offset + limit if len(results) > limit else None
+    return jsonify({'results': results[:limit], 'next_offset': next_offset})
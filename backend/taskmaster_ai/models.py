@@ -4,6 +4,8 @@ Models for Taskmaster-AI Logging System
 - Task
 - Plan
 - ContextSnapshot
+- SnapshotBlob (content-addressed, compressed snapshot bodies)
+- LogRollup (hourly per-level counts for logs past retention)
 """
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
@@ -11,6 +13,10 @@ from flask_sqlalchemy import SQLAlchemy
 db = SQLAlchemy()
 
 class Log(db.Model):
+    __table_args__ = (
+        db.Index('ix_log_timestamp_id', 'timestamp', 'id'),
+        db.Index('ix_log_level_timestamp_id', 'level', 'timestamp', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     level = db.Column(db.String(16), default='INFO')
@@ -18,20 +24,82 @@ class Log(db.Model):
     context = db.Column(db.Text)
 
 class Task(db.Model):
+    __table_args__ = (
+        db.Index('ix_task_created_at_id', 'created_at', 'id'),
+        db.Index('ix_task_status_created_at_id', 'status', 'created_at', 'id'),
+        db.Index('ix_task_task_key', 'task_key'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     title = db.Column(db.String(128))
     status = db.Column(db.String(32), default='pending')
     details = db.Column(db.Text)
+    # Agent scheduler state (see agent_scheduler.py)
+    task_key = db.Column(db.String(128))
+    priority = db.Column(db.String(16))
+    dependencies = db.Column(db.Text)  # JSON list of task keys
+    deadline = db.Column(db.DateTime)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    result = db.Column(db.Text)
 
 class Plan(db.Model):
+    __table_args__ = (
+        db.Index('ix_plan_created_at_id', 'created_at', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     description = db.Column(db.Text)
     steps = db.Column(db.Text)
 
 class ContextSnapshot(db.Model):
+    __table_args__ = (
+        db.Index('ix_context_snapshot_timestamp_id', 'timestamp', 'id'),
+        db.Index('ix_context_snapshot_stream', 'agent_id', 'session_id', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
-    snapshot = db.Column(db.Text)
+    snapshot = db.Column(db.Text)  # Legacy inline body; new rows reference a SnapshotBlob
+    content_hash = db.Column(db.String(64), index=True)
+    size = db.Column(db.Integer)
+    agent_id = db.Column(db.String(64))
+    session_id = db.Column(db.String(64))
+
+class SnapshotBlob(db.Model):
+    hash = db.Column(db.String(64), primary_key=True)  # sha256 of the raw body
+    codec = db.Column(db.String(16))  # 'zlib' or 'zlib-delta'
+    base_hash = db.Column(db.String(64))  # Delta base, when codec is 'zlib-delta'
+    depth = db.Column(db.Integer, default=0)
+    raw_size = db.Column(db.Integer)
+    stored_size = db.Column(db.Integer)
+    data = db.Column(db.LargeBinary)
+
+class LogRollup(db.Model):
+    __table_args__ = (
+        db.UniqueConstraint('bucket', 'level', name='uq_log_rollup_bucket_level'),
+        db.Index('ix_log_rollup_bucket_id', 'bucket', 'id'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    bucket = db.Column(db.DateTime)  # Start of the hour
+    level = db.Column(db.String(16))
+    count = db.Column(db.Integer, default=0)
+    first_timestamp = db.Column(db.DateTime)
+    last_timestamp = db.Column(db.DateTime)
+    sample_message = db.Column(db.Text)  # Latest message rolled into the bucket
+
+
+def ensure_schema():
+    """Create missing tables, and columns/indexes added to tables that already exist."""
+    db.create_all()
+    inspector = db.inspect(db.engine)
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            existing = {c['name'] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    col_type = column.type.compile(dialect=db.engine.dialect)
+                    conn.execute(db.text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}'))
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
@@ -0,0 +1,67 @@
+"""
+Keyset (cursor) pagination for the Taskmaster list endpoints
+- Pages newest-first on (timestamp, id) so each page is an index range scan
+- Cursors are opaque url-safe tokens carried in the X-Next-Cursor header
+"""
+import base64
+from datetime import datetime, timezone
+from sqlalchemy import and_, or_
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 500
+
+
+def encode_cursor(ts, row_id):
+    raw = f"{ts.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        ts, row_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(ts), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError('invalid cursor')
+
+def parse_time(value):
+    """ISO 8601 to naive UTC, the form timestamps are stored in; values without an offset are taken as UTC."""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError(f'invalid timestamp: {value}')
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def parse_limit(value):
+    try:
+        limit = int(value) if value else DEFAULT_LIMIT
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    return max(1, min(limit, MAX_LIMIT))
+
+def paginate(query, ts_col, id_col, args):
+    """Apply since/until/cursor/limit from request args; return (rows, next_cursor)."""
+    since = parse_time(args.get('since'))
+    until = parse_time(args.get('until'))
+    if since is not None:
+        query = query.filter(ts_col >= since)
+    if until is not None:
+        query = query.filter(ts_col < until)
+    cursor = args.get('cursor')
+    if cursor:
+        c_ts, c_id = decode_cursor(cursor)
+        query = query.filter(or_(ts_col < c_ts, and_(ts_col == c_ts, id_col < c_id)))
+    limit = parse_limit(args.get('limit'))
+    rows = query.order_by(ts_col.desc(), id_col.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, ts_col.key), getattr(last, id_col.key))
+    return rows, next_cursor
+
+def split_param(value):
+    return [v.strip() for v in value.split(',') if v.strip()] if value else []
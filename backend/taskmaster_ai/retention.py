@@ -0,0 +1,190 @@
+"""
+Retention and compaction for the podplay Log table
+- Per-level retention windows (keep DEBUG for hours, ERROR for months)
+- Expired rows are rolled into hourly per-level LogRollup rows, then deleted in short chunks;
+  rows without a level follow the default window
+- Hour buckets are computed in SQL on SQLite and in Python on other databases
+- Freed pages are returned to the filesystem with incremental VACUUM
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import and_, func, or_, select
+from .models import Log, LogRollup
+
+DEFAULT_POLICY_HOURS = {
+    'DEBUG': 6,
+    'INFO': 24 * 7,
+    'WARNING': 24 * 30,
+    'ERROR': 24 * 180,
+    'CRITICAL': 24 * 365,
+}
+
+
+class RetentionJob:
+    def __init__(self, app, db, policy_hours=None, default_hours=24 * 30, interval=600,
+                 chunk_size=5000, vacuum_pages=2000):
+        self.app = app
+        self.db = db
+        self.policy_hours = dict(policy_hours or DEFAULT_POLICY_HOURS)
+        self.default_hours = default_hours
+        self.interval = interval
+        self.chunk_size = chunk_size
+        self.vacuum_pages = vacuum_pages
+        self._stop = threading.Event()
+        self._run_lock = threading.Lock()
+        self._thread = None
+        self.stats = {
+            'runs': 0,
+            'rows_pruned': 0,
+            'rollups_written': 0,
+            'bytes_reclaimed': 0,
+            'last_run': None,
+            'last_duration': None,
+            'last_error': None,
+        }
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='taskmaster-retention', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                self.stats['last_error'] = str(e)
+                print(f"[Taskmaster] Retention run failed: {e}")
+
+    def run_once(self, now=None):
+        """Prune and roll up every level past its window; returns this run's counters."""
+        with self._run_lock, self.app.app_context():
+            started = time.monotonic()
+            now = now or datetime.utcnow()
+            run = {'rows_pruned': 0, 'rollups_written': 0, 'bytes_reclaimed': 0}
+            levels = [row[0] for row in self.db.session.execute(select(Log.level).distinct())]
+            for level in levels:
+                hours = self.policy_hours.get(level, self.default_hours)
+                pruned, rollups = self._compact_level(level, now - timedelta(hours=hours))
+                run['rows_pruned'] += pruned
+                run['rollups_written'] += rollups
+            if run['rows_pruned']:
+                run['bytes_reclaimed'] = self._incremental_vacuum()
+            self.db.session.remove()
+            for key, value in run.items():
+                self.stats[key] += value
+            self.stats['runs'] += 1
+            self.stats['last_run'] = now.isoformat()
+            self.stats['last_duration'] = time.monotonic() - started
+            self.stats['last_error'] = None
+            return run
+
+    def _compact_level(self, level, cutoff):
+        session = self.db.session
+        pruned = rollups = 0
+        expired = and_(_level_is(Log.level, level), Log.timestamp < cutoff)
+        while True:
+            # Bound each chunk by the (timestamp, id) of its last row so the
+            # aggregate and the delete cover exactly the same rows.
+            edge = session.execute(
+                select(Log.timestamp, Log.id).where(expired)
+                .order_by(Log.timestamp, Log.id).offset(self.chunk_size - 1).limit(1)
+            ).first()
+            chunk = expired
+            if edge is not None:
+                chunk = and_(expired, or_(Log.timestamp < edge.timestamp,
+                                          and_(Log.timestamp == edge.timestamp, Log.id <= edge.id)))
+            groups = self._hour_groups(session, chunk)
+            if not groups:
+                break
+            samples = dict(session.execute(
+                select(Log.id, Log.message).where(Log.id.in_([g[4] for g in groups]))
+            ).all())
+            for bucket, count, first_ts, last_ts, max_id in groups:
+                rollups += self._merge_rollup(session, level, bucket, count, first_ts, last_ts, samples.get(max_id))
+            result = session.execute(Log.__table__.delete().where(chunk))
+            session.commit()
+            pruned += result.rowcount
+            if edge is None:
+                break
+        return pruned, rollups
+
+    def _hour_groups(self, session, chunk):
+        """(hour bucket, count, first timestamp, last timestamp, max id) per hour in chunk."""
+        if self.db.engine.dialect.name == 'sqlite':
+            bucket = func.strftime('%Y-%m-%d %H:00:00', Log.timestamp)
+            return session.execute(
+                select(bucket.label('bucket'), func.count(), func.min(Log.timestamp),
+                       func.max(Log.timestamp), func.max(Log.id))
+                .where(chunk).group_by(bucket)
+            ).all()
+        # No portable hour truncation; a chunk is at most chunk_size rows, so group here
+        groups = {}
+        for row_id, ts in session.execute(select(Log.id, Log.timestamp).where(chunk)):
+            hour = ts.replace(minute=0, second=0, microsecond=0)
+            group = groups.get(hour)
+            if group is None:
+                groups[hour] = [hour, 1, ts, ts, row_id]
+            else:
+                group[1] += 1
+                group[2], group[3], group[4] = min(group[2], ts), max(group[3], ts), max(group[4], row_id)
+        return list(groups.values())
+
+    def _merge_rollup(self, session, level, bucket, count, first_ts, last_ts, message):
+        if isinstance(bucket, str):
+            bucket = datetime.strptime(bucket, '%Y-%m-%d %H:%M:%S')
+        first_ts, last_ts = _as_datetime(first_ts), _as_datetime(last_ts)
+        rollup = session.execute(
+            select(LogRollup).where(LogRollup.bucket == bucket, _level_is(LogRollup.level, level))
+        ).scalar_one_or_none()
+        if rollup is None:
+            session.add(LogRollup(bucket=bucket, level=level, count=count, first_timestamp=first_ts,
+                                  last_timestamp=last_ts, sample_message=message))
+            return 1
+        rollup.count += count
+        rollup.first_timestamp = min(rollup.first_timestamp, first_ts)
+        if last_ts >= rollup.last_timestamp:
+            rollup.last_timestamp = last_ts
+            rollup.sample_message = message
+        return 0
+
+    def _incremental_vacuum(self):
+        engine = self.db.engine
+        if engine.dialect.name != 'sqlite':
+            return 0
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            page_size = conn.exec_driver_sql('PRAGMA page_size').scalar()
+            before = conn.exec_driver_sql('PRAGMA page_count').scalar()
+            if conn.exec_driver_sql('PRAGMA auto_vacuum').scalar() != 2:
+                # auto_vacuum only changes with a full VACUUM; pay that once
+                conn.exec_driver_sql('PRAGMA auto_vacuum = INCREMENTAL')
+                conn.exec_driver_sql('VACUUM')
+            else:
+                conn.exec_driver_sql(f'PRAGMA incremental_vacuum({int(self.vacuum_pages)})').all()
+            conn.exec_driver_sql('PRAGMA wal_checkpoint(TRUNCATE)').all()
+            after = conn.exec_driver_sql('PRAGMA page_count').scalar()
+        return max(0, before - after) * page_size
+
+    def describe(self):
+        return {
+            'policy_hours': {**self.policy_hours, '*': self.default_hours},
+            'interval': self.interval,
+            'stats': dict(self.stats),
+        }
+
+
+def _level_is(column, level):
+    # `column == None` never matches in SQL; rows without a level need IS NULL
+    return column.is_(None) if level is None else column == level
+
+
+def _as_datetime(value):
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    return value
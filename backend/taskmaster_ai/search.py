@@ -0,0 +1,133 @@
+"""
+Full-text search over logs, plans and context snapshots
+- FTS5 index kept in sync with the source tables by SQLite triggers
+- Snapshot bodies are stored compressed, so those rows are indexed from the flush path instead
+- rowid = source id * 4 + kind code, so trigger deletes are a rowid lookup, not a scan
+- Ranked (bm25), paginated results with highlighted title and snippet; stored text is
+  HTML-escaped and only the <mark> tags around matches are markup
+"""
+import html
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+FTS_TABLE = 'podplay_search'
+KIND_SHIFT = 4
+
+# kind -> (code, source table, title expr, body expr, timestamp column)
+SOURCES = {
+    'log': (1, 'log', "{r}.message", "{r}.context", 'timestamp'),
+    'plan': (2, 'plan', "{r}.description", "{r}.steps", 'created_at'),
+    'snapshot': (3, 'context_snapshot', "''", "{r}.snapshot", 'timestamp'),
+}
+KIND_BY_CODE = {code: kind for kind, (code, *_rest) in SOURCES.items()}
+# FTS5 wraps matches in these control characters, swapped for <mark> after escaping
+MARK_OPEN, MARK_CLOSE = '\x02', '\x03'
+WRITE_PATH_KINDS = {'snapshot'}
+
+_enabled = False
+
+
+def _trigger_sql(kind):
+    code, table, title, body, ts = SOURCES[kind]
+    new_row = f"NEW.id * {KIND_SHIFT} + {code}, coalesce({title.format(r='NEW')}, ''), coalesce({body.format(r='NEW')}, ''), NEW.{ts}"
+    delete = f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_{table}_ad AFTER DELETE ON {table} BEGIN
+            DELETE FROM {FTS_TABLE} WHERE rowid = OLD.id * {KIND_SHIFT} + {code};
+        END"""
+    if kind in WRITE_PATH_KINDS:
+        return [
+            f"DROP TRIGGER IF EXISTS {FTS_TABLE}_{table}_ai",
+            f"DROP TRIGGER IF EXISTS {FTS_TABLE}_{table}_au",
+            delete,
+        ]
+    return [
+        f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_{table}_ai AFTER INSERT ON {table} BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, title, body, ts) VALUES ({new_row});
+        END""",
+        delete,
+        f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_{table}_au AFTER UPDATE ON {table} BEGIN
+            DELETE FROM {FTS_TABLE} WHERE rowid = OLD.id * {KIND_SHIFT} + {code};
+            INSERT INTO {FTS_TABLE}(rowid, title, body, ts) VALUES ({new_row});
+        END""",
+    ]
+
+def _backfill_sql(kind):
+    code, table, title, body, ts = SOURCES[kind]
+    return (
+        f"INSERT INTO {FTS_TABLE}(rowid, title, body, ts) "
+        f"SELECT id * {KIND_SHIFT} + {code}, coalesce({title.format(r=table)}, ''), "
+        f"coalesce({body.format(r=table)}, ''), {ts} FROM {table}"
+        + (f" WHERE {table}.snapshot IS NOT NULL" if kind in WRITE_PATH_KINDS else '')
+    )
+
+def ensure_search_index(engine):
+    """Create the FTS5 table and triggers, backfilling existing rows on first run."""
+    global _enabled
+    if engine.dialect.name != 'sqlite':
+        return False
+    with engine.begin() as conn:
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {'name': FTS_TABLE},
+        ).first()
+        try:
+            conn.execute(text(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+                "USING fts5(title, body, ts UNINDEXED, tokenize = 'porter unicode61')"
+            ))
+        except OperationalError as e:
+            print(f"[Taskmaster] Full-text search disabled: {e}")
+            return False
+        for kind in SOURCES:
+            for stmt in _trigger_sql(kind):
+                conn.execute(text(stmt))
+            if not exists:
+                conn.execute(text(_backfill_sql(kind)))
+    _enabled = True
+    return True
+
+def index_row(conn, kind, ref_id, title, body, ts):
+    """Index a row from the write path, for kinds whose body isn't readable by a trigger."""
+    if not _enabled:
+        return
+    conn.execute(
+        text(f"INSERT INTO {FTS_TABLE}(rowid, title, body, ts) VALUES (:rowid, :title, :body, :ts)"),
+        {'rowid': ref_id * KIND_SHIFT + SOURCES[kind][0], 'title': title, 'body': body,
+         'ts': ts.isoformat(sep=' ') if ts else None},
+    )
+
+def to_match_query(q):
+    """Quote each term so arbitrary user text is a valid FTS5 AND query."""
+    terms = [t.replace('"', '""') for t in q.split()]
+    return ' '.join(f'"{t}"' for t in terms if t)
+
+def search(session, match, kinds=None, limit=20, offset=0):
+    where = [f"{FTS_TABLE} MATCH :match"]
+    params = {'match': match, 'limit': limit, 'offset': offset, 'mark_open': MARK_OPEN, 'mark_close': MARK_CLOSE}
+    if kinds:
+        codes = [SOURCES[k][0] for k in kinds]
+        where.append(f"(rowid % {KIND_SHIFT}) IN ({', '.join(str(c) for c in codes)})")
+    rows = session.execute(text(
+        f"SELECT rowid, ts, bm25({FTS_TABLE}, 2.0, 1.0) AS score, "
+        f"highlight({FTS_TABLE}, 0, :mark_open, :mark_close) AS title, "
+        f"snippet({FTS_TABLE}, 1, :mark_open, :mark_close, '…', 24) AS snippet "
+        f"FROM {FTS_TABLE} WHERE {' AND '.join(where)} "
+        "ORDER BY score LIMIT :limit OFFSET :offset"
+    ), params).all()
+    return [
+        {
+            'kind': KIND_BY_CODE[r.rowid % KIND_SHIFT],
+            'id': r.rowid // KIND_SHIFT,
+            'timestamp': r.ts.replace(' ', 'T') if r.ts else None,
+            'score': -r.score,
+            'title': _marked_html(r.title),
+            'snippet': _marked_html(r.snippet),
+        }
+        for r in rows
+    ]
+
+
+def _marked_html(value):
+    if value is None:
+        return None
+    return html.escape(value).replace(MARK_OPEN, '<mark>').replace(MARK_CLOSE, '</mark>')
@@ -0,0 +1,175 @@
+"""
+Content-addressed, compressed storage for ContextSnapshot bodies
+- Bodies are keyed by sha256 and stored once in SnapshotBlob, zlib-compressed
+- Near-identical snapshots from the same agent/session are stored as prefix/suffix deltas
+- Blob writes and search indexing happen at flush time, so the write-behind queue and
+  the batch endpoint both go through the same path
+"""
+import hashlib
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from flask import current_app, has_app_context
+from sqlalchemy import event, insert, inspect, select
+from sqlalchemy.orm import Session
+from .models import ContextSnapshot, SnapshotBlob
+from .search import index_row
+
+_DELTA_HEADER = struct.Struct('>II')  # common prefix length, common suffix length
+DEFAULTS = {
+    'SNAPSHOT_COMPRESSION_LEVEL': 6,
+    'SNAPSHOT_DELTA_ENABLED': True,
+    'SNAPSHOT_MAX_DELTA_DEPTH': 8,
+    'SNAPSHOT_CACHE_BYTES': 32 * 1024 * 1024,
+}
+
+
+def _setting(key):
+    if has_app_context():
+        return current_app.config.get(key, DEFAULTS[key])
+    return DEFAULTS[key]
+
+
+class _RawCache:
+    """Byte-bounded LRU of decompressed bodies, so delta bases and hot fetches skip zlib."""
+
+    def __init__(self):
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            raw = self._items.get(key)
+            if raw is not None:
+                self._items.move_to_end(key)
+            return raw
+
+    def put(self, key, raw):
+        limit = _setting('SNAPSHOT_CACHE_BYTES')
+        if len(raw) > limit:
+            return
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return
+            self._items[key] = raw
+            self._bytes += len(raw)
+            while self._bytes > limit:
+                _, old = self._items.popitem(last=False)
+                self._bytes -= len(old)
+
+_cache = _RawCache()
+
+
+def new_snapshot(content, agent_id=None, session_id=None):
+    """Build a transient ContextSnapshot; its blob is written when the session flushes."""
+    snap = ContextSnapshot(agent_id=agent_id, session_id=session_id)
+    snap.pending_content = content
+    return snap
+
+def _common_length(a, b, limit, from_end=False):
+    # Binary search over slice equality keeps the byte comparisons in C
+    lo, hi = 0, limit
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if from_end:
+            same = a[len(a) - mid:] == b[len(b) - mid:]
+        else:
+            same = a[:mid] == b[:mid]
+        if same:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+def _encode_delta(base, raw, level):
+    limit = min(len(base), len(raw))
+    prefix = _common_length(base, raw, limit)
+    suffix = _common_length(base, raw, limit - prefix, from_end=True)
+    middle = raw[prefix:len(raw) - suffix]
+    return zlib.compress(_DELTA_HEADER.pack(prefix, suffix) + middle, level)
+
+def _apply_delta(base, data):
+    payload = zlib.decompress(data)
+    prefix, suffix = _DELTA_HEADER.unpack_from(payload)
+    middle = payload[_DELTA_HEADER.size:]
+    return base[:prefix] + middle + (base[len(base) - suffix:] if suffix else b'')
+
+def _load_raw(session, content_hash):
+    raw = _cache.get(content_hash)
+    if raw is not None:
+        return raw
+    chain = []
+    key = content_hash
+    while key is not None:
+        raw = _cache.get(key)
+        if raw is not None:
+            break
+        blob = session.get(SnapshotBlob, key)
+        if blob is None:
+            raise LookupError(f'snapshot blob {key} is missing')
+        chain.append(blob)
+        key = blob.base_hash if blob.codec == 'zlib-delta' else None
+    for blob in reversed(chain):
+        if blob.codec == 'zlib-delta':
+            raw = _apply_delta(raw, blob.data)
+        else:
+            raw = zlib.decompress(blob.data)
+        _cache.put(blob.hash, raw)
+    return raw
+
+def load_content(session, snap):
+    """Return the snapshot body as text, decompressing (and caching) on demand."""
+    if snap.content_hash is None:
+        return snap.snapshot
+    return _load_raw(session, snap.content_hash).decode('utf-8')
+
+def _previous_hash(session, agent_id, session_id):
+    if agent_id is None and session_id is None:
+        return None
+    return session.execute(
+        select(ContextSnapshot.content_hash)
+        .where(ContextSnapshot.agent_id == agent_id, ContextSnapshot.session_id == session_id)
+        .order_by(ContextSnapshot.id.desc())
+        .limit(1)
+    ).scalar()
+
+def _blob_values(session, raw, content_hash, base_hash):
+    level = _setting('SNAPSHOT_COMPRESSION_LEVEL')
+    values = {'hash': content_hash, 'codec': 'zlib', 'base_hash': None, 'depth': 0,
+              'raw_size': len(raw), 'data': zlib.compress(raw, level)}
+    if base_hash and base_hash != content_hash and _setting('SNAPSHOT_DELTA_ENABLED'):
+        base = session.get(SnapshotBlob, base_hash)
+        if base is not None and base.depth < _setting('SNAPSHOT_MAX_DELTA_DEPTH'):
+            delta = _encode_delta(_load_raw(session, base_hash), raw, level)
+            if len(delta) < len(values['data']):
+                values.update(codec='zlib-delta', base_hash=base_hash, depth=base.depth + 1, data=delta)
+    values['stored_size'] = len(values['data'])
+    return values
+
+
+@event.listens_for(Session, 'before_flush')
+def _store_pending_snapshots(session, _flush_context, _instances):
+    pending = [o for o in session.new if isinstance(o, ContextSnapshot) and hasattr(o, 'pending_content')]
+    latest = {}
+    for obj in sorted(pending, key=lambda o: inspect(o).insert_order):
+        raw = obj.pending_content.encode('utf-8')
+        content_hash = hashlib.sha256(raw).hexdigest()
+        stream = (obj.agent_id, obj.session_id)
+        base_hash = latest.get(stream) or _previous_hash(session, *stream)
+        exists = session.execute(select(SnapshotBlob.hash).where(SnapshotBlob.hash == content_hash)).first()
+        if not exists:
+            values = _blob_values(session, raw, content_hash, base_hash)
+            session.execute(insert(SnapshotBlob).prefix_with('OR IGNORE', dialect='sqlite').values(**values))
+        _cache.put(content_hash, raw)
+        obj.content_hash = content_hash
+        obj.size = len(raw)
+        latest[stream] = content_hash
+
+@event.listens_for(ContextSnapshot, 'after_insert')
+def _index_snapshot(_mapper, connection, target):
+    content = getattr(target, 'pending_content', None)
+    if content is not None:
+        index_row(connection, 'snapshot', target.id, '', content, target.timestamp)
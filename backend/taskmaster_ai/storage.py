@@ -0,0 +1,60 @@
+"""
+SQLite performance profile for the Taskmaster database
+- Applies WAL / synchronous / cache_size / mmap_size / busy_timeout pragmas on every connection
+- The 'readonly' bind is marked query_only and backs the sessions used by GET endpoints
+"""
+from flask.globals import app_ctx
+from sqlalchemy import event
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+READ_BIND = 'readonly'
+
+
+def sqlite_pragmas(config, read_only=False):
+    pragmas = [
+        f"PRAGMA busy_timeout = {int(config.get('SQLITE_BUSY_TIMEOUT_MS', 5000))}",
+        f"PRAGMA synchronous = {config.get('SQLITE_SYNCHRONOUS', 'NORMAL')}",
+        # Negative cache_size is in KiB rather than pages
+        f"PRAGMA cache_size = -{int(config.get('SQLITE_CACHE_SIZE_KB', 65536))}",
+        f"PRAGMA mmap_size = {int(config.get('SQLITE_MMAP_SIZE', 0))}",
+        "PRAGMA temp_store = MEMORY",
+    ]
+    if read_only:
+        pragmas.append("PRAGMA query_only = ON")
+    else:
+        pragmas.insert(1, f"PRAGMA journal_mode = {config.get('SQLITE_JOURNAL_MODE', 'WAL')}")
+    return pragmas
+
+def _install_pragmas(engine, pragmas):
+    @event.listens_for(engine, 'connect')
+    def _on_connect(dbapi_conn, _record):
+        cursor = dbapi_conn.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+def configure_engines(app, db):
+    """Hook pragmas into every SQLite engine and register the read-only session."""
+    with app.app_context():
+        engines = dict(db.engines)
+    for key, engine in engines.items():
+        if engine.dialect.name == 'sqlite':
+            _install_pragmas(engine, sqlite_pragmas(app.config, read_only=(key == READ_BIND)))
+    read_engine = engines.get(READ_BIND)
+    if read_engine is None:
+        return
+    session = scoped_session(
+        sessionmaker(bind=read_engine, autoflush=False, expire_on_commit=False),
+        scopefunc=lambda: id(app_ctx._get_current_object()),
+    )
+    app.extensions['taskmaster_read_session'] = session
+
+    @app.teardown_appcontext
+    def _remove_read_session(_exc):
+        session.remove()
+
+def read_session(app, db):
+    """Session for GET endpoints; falls back to the primary session without a read bind."""
+    return app.extensions.get('taskmaster_read_session', db.session)
@@ -0,0 +1,185 @@
+"""
+Write-behind buffer for Taskmaster-AI inserts
+- Coalesces single-record POSTs into one transaction per N records / M milliseconds
+- Bounded queue applies backpressure instead of growing without limit
+- A batch that fails to commit is retried row by row, so one bad row fails only itself;
+  primary keys the failed flush assigned are cleared first, and failures of rows nobody
+  waits for (wait=false) are logged
+- Flushes whatever is still buffered on shutdown
+"""
+import atexit
+import queue
+import threading
+import time
+
+from sqlalchemy import inspect
+
+
+class QueueFull(Exception):
+    """Raised when the write-behind queue stays full past the put timeout."""
+
+
+class PendingWrite:
+    __slots__ = ('obj', 'id', 'error', 'done', 'detached')
+
+    def __init__(self, obj):
+        self.obj = obj
+        self.id = None
+        self.error = None
+        self.done = threading.Event()
+        self.detached = False
+
+    def detach(self):
+        """Nobody will wait on this write; the writer logs it if it fails."""
+        self.detached = True
+
+    def wait(self, timeout=None):
+        if not self.done.wait(timeout):
+            raise TimeoutError('write-behind flush did not complete in time')
+        if self.error is not None:
+            raise self.error
+        return self.id
+
+
+def _unset_keys(obj):
+    """Primary key attributes the database will generate for obj."""
+    mapper = inspect(obj).mapper
+    keys = [mapper.get_property_by_column(column).key for column in mapper.primary_key]
+    return [key for key in keys if getattr(obj, key) is None]
+
+
+class WriteBehindQueue:
+    def __init__(self, app, db, batch_size=100, flush_interval_ms=50, max_queue=10000, put_timeout=1.0):
+        self.app = app
+        self.db = db
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.put_timeout = put_timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.stats = {
+            'enqueued': 0,
+            'committed': 0,
+            'failed': 0,
+            'rejected': 0,
+            'batches': 0,
+            'retried_batches': 0,
+        }
+
+    @property
+    def depth(self):
+        return self._queue.qsize()
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='taskmaster-writer', daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def submit(self, obj):
+        """Queue a transient model instance; blocks up to put_timeout when full."""
+        self.start()
+        pending = PendingWrite(obj)
+        try:
+            self._queue.put(pending, timeout=self.put_timeout)
+        except queue.Full:
+            self.stats['rejected'] += 1
+            raise QueueFull('Taskmaster write queue is full')
+        self.stats['enqueued'] += 1
+        return pending
+
+    def stop(self, timeout=10.0):
+        """Stop the writer thread and flush everything still queued."""
+        self._stop.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+        self._thread = None
+        self._drain()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                first = self._queue.get(timeout=0.25)
+            except queue.Empty:
+                continue
+            batch = [first]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._flush(batch)
+
+    def _drain(self):
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return
+            self._flush(batch)
+
+    def _flush(self, batch):
+        with self.app.app_context():
+            session = self.db.session
+            try:
+                generated = [_unset_keys(p.obj) for p in batch]
+                try:
+                    session.add_all([p.obj for p in batch])
+                    session.flush()
+                    ids = [p.obj.id for p in batch]
+                    session.commit()
+                except Exception as e:
+                    session.rollback()
+                    if len(batch) == 1:
+                        self._fail(batch[0], e)
+                        return
+                    # Rolled-back rows are transient again but keep the ids the flush gave them,
+                    # which another writer may have taken since; find the bad ones by committing singly
+                    self.stats['retried_batches'] += 1
+                    for p, keys in zip(batch, generated):
+                        for key in keys:
+                            setattr(p.obj, key, None)
+                        self._flush_one(session, p)
+                    return
+            finally:
+                session.remove()
+        self.stats['committed'] += len(batch)
+        self.stats['batches'] += 1
+        for p, obj_id in zip(batch, ids):
+            p.id = obj_id
+            p.done.set()
+
+    def _flush_one(self, session, p):
+        try:
+            session.add(p.obj)
+            session.flush()
+            obj_id = p.obj.id
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            self._fail(p, e)
+            return
+        self.stats['committed'] += 1
+        p.id = obj_id
+        p.done.set()
+
+    def _fail(self, p, error):
+        self.stats['failed'] += 1
+        p.error = error
+        p.done.set()
+        if p.detached:
+            print(f"[Taskmaster] Dropped queued {type(p.obj).__name__} write: {error}")
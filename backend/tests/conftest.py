@@ -0,0 +1,22 @@
+import pytest
+from flask import Flask
+
+import taskmaster_ai
+from taskmaster_ai.models import db
+
+
+@pytest.fixture
+def taskmaster_app(tmp_path):
+    """A bare Flask app with only the Taskmaster blueprint, on a throwaway SQLite file."""
+    app = Flask(__name__)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=f'sqlite:///{tmp_path / "taskmaster.db"}',
+        RETENTION_ENABLED=False,
+        TESTING=True,
+    )
+    taskmaster_ai.init_app(app)
+    yield app
+    app.extensions['taskmaster_writer'].stop()
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
@@ -0,0 +1,129 @@
+import asyncio
+
+import pytest
+
+from model_router import CLOSED, OPEN, FakeModelBackend, ModelRouter, NoHealthyEndpoint
+from quota_manager import QuotaManager
+
+MODELS = ['gemini-pro', 'gemini-flash']
+
+
+@pytest.fixture
+def make_router():
+    routers = []
+
+    def make(backend, quota_manager=None, **config):
+        config = {'GEMINI_API_KEY_PRIMARY': 'k1', 'GEMINI_API_KEY_BACKUP': 'k2', 'GEMINI_MODELS': MODELS,
+                  'ERROR_THRESHOLD': 3, 'CIRCUIT_PROBE_INTERVAL': 3600, **config}
+        router = ModelRouter(config, backend, quota_manager)
+        routers.append(router)
+        return router
+
+    yield make
+    for router in routers:
+        router.stop()
+
+
+def _endpoint(router, api_key, model):
+    return next(e for e in router.endpoints if e.api_key == api_key and e.model == model)
+
+
+def test_fails_over_to_the_next_endpoint(make_router):
+    backend = FakeModelBackend(latency=0)
+    router = make_router(backend)
+    backend.inject(api_key='k1', model='gemini-pro', fail_next=1)
+
+    result, metadata = asyncio.run(router.call({'message': 'hi'}, models=MODELS))
+
+    assert backend.calls[0] == ('k1', 'gemini-pro')
+    assert len(backend.calls) == 2 and backend.calls[1] != ('k1', 'gemini-pro')
+    assert metadata['fallback_count'] == 1
+    assert result['content'] == f"[{metadata['model']}] hi"
+    failed = _endpoint(router, 'k1', 'gemini-pro')
+    assert failed.breaker.state == CLOSED and failed.breaker.failures == 1
+
+
+def test_breaker_opens_after_threshold_and_traffic_moves_away(make_router):
+    backend = FakeModelBackend(latency=0)
+    router = make_router(backend)
+    backend.inject(api_key='k1', error_rate=1.0)
+
+    async def calls(count):
+        return [await router.call({'message': str(i)}, models=MODELS) for i in range(count)]
+    asyncio.run(calls(6))
+
+    for model in MODELS:
+        assert _endpoint(router, 'k1', model).breaker.state == OPEN
+    failing_calls = [c for c in backend.calls if c[0] == 'k1']
+    assert len(failing_calls) == 2 * 3  # Threshold failures per endpoint, then no more traffic
+
+    backend.calls.clear()
+    asyncio.run(calls(3))
+    assert all(api_key == 'k2' for api_key, _model in backend.calls)
+
+
+def test_open_breaker_closes_after_a_successful_probe(make_router):
+    backend = FakeModelBackend(latency=0)
+    router = make_router(backend, ERROR_THRESHOLD=1, RECOVERY_TIMEOUT=0)
+    backend.inject(api_key='k1', model='gemini-pro', fail_next=1)
+    asyncio.run(router.call({'message': 'hi'}, models=['gemini-pro']))
+    endpoint = _endpoint(router, 'k1', 'gemini-pro')
+    assert endpoint.breaker.state == OPEN
+
+    assert asyncio.run(router.probe_due()) == 1
+    assert endpoint.breaker.state == CLOSED
+    assert endpoint.stats['probes'] == 1
+
+
+def test_rate_limits_cool_down_without_tripping_the_breaker(make_router):
+    backend = FakeModelBackend(latency=0)
+    router = make_router(backend)
+    backend.inject(api_key='k1', model='gemini-pro', rate_limit_rate=1.0, retry_after=60)
+
+    _result, metadata = asyncio.run(router.call({'message': 'hi'}, models=['gemini-pro']))
+
+    limited = _endpoint(router, 'k1', 'gemini-pro')
+    assert metadata['billing_account'] == 'backup'
+    assert limited.breaker.state == CLOSED and limited.breaker.failures == 0
+    assert limited.stats['rate_limited'] == 1
+    assert router.select(['gemini-pro']) is not limited
+
+
+def test_no_healthy_endpoint_when_every_attempt_fails(make_router):
+    backend = FakeModelBackend(latency=0)
+    router = make_router(backend)
+    backend.inject(error_rate=1.0)
+    with pytest.raises(NoHealthyEndpoint):
+        asyncio.run(router.call({'message': 'hi'}, models=MODELS))
+    assert len(backend.calls) == 4  # Every endpoint once, none twice
+
+
+def test_quota_is_committed_on_success_and_released_on_failure(make_router, tmp_path):
+    limit = {'requests_per_minute': 100, 'tokens_per_minute': 1000}
+    quotas = QuotaManager({'QUOTA_DB_PATH': str(tmp_path / 'quota.db'),
+                           'quota': {'primary:gemini-pro': limit, 'backup:gemini-pro': limit}},
+                          lambda message, level='INFO': None)
+    backend = FakeModelBackend(latency=0)
+    router = make_router(backend, quotas)
+    backend.inject(api_key='k1', model='gemini-pro', fail_next=1)
+
+    _result, metadata = asyncio.run(router.call({'message': 'two words'}, models=['gemini-pro']))
+
+    assert metadata['billing_account'] == 'backup'
+    primary, backup = quotas.get_usage('primary:gemini-pro'), quotas.get_usage('backup:gemini-pro')
+    assert primary['requests_per_minute']['used'] == 0  # Released: the call failed
+    assert backup['requests_per_minute']['used'] == 1
+    assert backup['tokens_per_minute']['used'] == 3  # The backend's reported usage, not the reservation
+
+
+def test_stream_fails_over_before_the_first_chunk(make_router):
+    backend = FakeModelBackend(latency=0)
+    router = make_router(backend)
+    backend.inject(api_key='k1', model='gemini-pro', fail_next=1)
+
+    async def collect():
+        return [chunk async for chunk in router.stream({'message': 'hello there'}, models=['gemini-pro'])]
+    chunks = asyncio.run(collect())
+
+    assert ''.join(chunks[:-1]) == '[gemini-pro] hello there'
+    assert chunks[-1] == {'metadata': {'model': 'gemini-pro', 'billing_account': 'backup', 'fallback_count': 1}}
@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+
+import quota_manager
+from quota_manager import QuotaExceeded, QuotaManager
+
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(quota_manager.time, 'time', clock.time)
+    return clock
+
+
+def _manager(tmp_path, quota, **config):
+    return QuotaManager({'QUOTA_DB_PATH': str(tmp_path / 'quota.db'), 'quota': quota, **config},
+                        lambda message, level='INFO': None)
+
+
+def test_reservations_hold_capacity_until_released(tmp_path, clock):
+    quotas = _manager(tmp_path, {'k': {'requests_per_minute': 2}})
+    first = quotas.reserve('k')
+    quotas.reserve('k')
+    with pytest.raises(QuotaExceeded) as excinfo:
+        quotas.reserve('k')
+    assert excinfo.value.limit_name == 'requests_per_minute'
+
+    quotas.release(first)
+    quotas.reserve('k')
+    assert quotas.get_usage('k')['requests_per_minute']['used'] == 2
+
+
+def test_commit_replaces_the_reservation_with_actual_usage(tmp_path, clock):
+    quotas = _manager(tmp_path, {'k': {'tokens_per_minute': 100}})
+    reservation = quotas.reserve('k', tokens=80)
+    assert quotas.get_usage('k')['tokens_per_minute']['used'] == 80
+    quotas.commit(reservation, tokens=30)
+    assert quotas.get_usage('k')['tokens_per_minute']['used'] == 30
+    assert quotas.get_status() == {'k': 30}
+    quotas.reserve('k', tokens=70)
+    with pytest.raises(QuotaExceeded):
+        quotas.reserve('k', tokens=1)
+
+
+def test_usage_slides_out_of_the_window(tmp_path, clock):
+    quotas = _manager(tmp_path, {'k': {'requests_per_minute': 1, 'requests_per_hour': 2}})
+    quotas.commit(quotas.reserve('k'))
+    with pytest.raises(QuotaExceeded):
+        quotas.reserve('k')
+
+    clock.now += 61
+    quotas.commit(quotas.reserve('k'))
+    clock.now += 61
+    with pytest.raises(QuotaExceeded) as excinfo:
+        quotas.reserve('k')
+    assert excinfo.value.limit_name == 'requests_per_hour'
+
+    clock.now += 3600
+    quotas.reserve('k')
+
+
+def test_expired_reservations_stop_counting_and_are_pruned(tmp_path, clock):
+    quotas = _manager(tmp_path, {'k': {'requests_per_hour': 1}}, QUOTA_RESERVATION_TTL=10)
+    quotas.reserve('k')
+    with pytest.raises(QuotaExceeded):
+        quotas.reserve('k')
+    clock.now += 11
+    quotas.reserve('k')
+    rows = quotas._conn().execute("SELECT COUNT(*) FROM quota_reservations").fetchone()[0]
+    assert rows == 2  # One per unit for the live reservation; the expired one was pruned
+
+
+def test_safety_margin_lowers_the_effective_limit(tmp_path, clock):
+    quotas = _manager(tmp_path, {'k': {'requests_per_minute': 10}}, QUOTA_SAFETY_MARGIN=0.2)
+    for _ in range(8):
+        quotas.reserve('k')
+    with pytest.raises(QuotaExceeded):
+        quotas.reserve('k')
+    assert quotas.headroom('k') == pytest.approx(0.0)
+
+
+def test_async_wrappers_share_the_same_windows(tmp_path, clock):
+    quotas = _manager(tmp_path, {'k': {'requests_per_minute': 3}})
+
+    async def scenario():
+        reservations = await asyncio.gather(*(quotas.reserve_async('k') for _ in range(3)))
+        with pytest.raises(QuotaExceeded):
+            await quotas.reserve_async('k')
+        await quotas.commit_async(reservations[0])
+        await quotas.release_async(reservations[1])
+        return await quotas.reserve_async('k')
+
+    asyncio.run(scenario())
+    assert quotas.get_usage('k')['requests_per_minute']['used'] == 3
@@ -0,0 +1,67 @@
+import hashlib
+import zlib
+
+import pytest
+
+from taskmaster_ai import snapshots
+from taskmaster_ai.models import db, SnapshotBlob
+
+
+@pytest.fixture(autouse=True)
+def cold_cache(monkeypatch):
+    monkeypatch.setattr(snapshots, '_cache', snapshots._RawCache())
+
+
+def _bodies(count):
+    base = ''.join(f'line {i}: some agent context that barely changes\n' for i in range(200))
+    return [base.replace('line 100:', f'line 100 (edit {n}):') for n in range(count)]
+
+
+def _post(app, bodies):
+    response = app.test_client().post('/podplay-planning/podplay_context_snapshots/batch',
+                                      json=[{'snapshot': b, 'agent_id': 'scout', 'session_id': 's1'} for b in bodies])
+    assert response.status_code == 201
+    return response.get_json()['ids']
+
+
+def test_delta_snapshots_round_trip(taskmaster_app, monkeypatch):
+    bodies = _bodies(4)
+    ids = _post(taskmaster_app, bodies)
+
+    with taskmaster_app.app_context():
+        blobs = db.session.query(SnapshotBlob).all()
+        codecs = sorted(b.codec for b in blobs)
+        delta = next(b for b in blobs if b.codec == 'zlib-delta')
+        assert delta.stored_size < len(zlib.compress(bodies[1].encode(), 6))
+    assert codecs == ['zlib', 'zlib-delta', 'zlib-delta', 'zlib-delta']
+
+    # Rebuild every body from the database, not the cache the writes filled
+    monkeypatch.setattr(snapshots, '_cache', snapshots._RawCache())
+    client = taskmaster_app.test_client()
+    for snapshot_id, body in zip(ids, bodies):
+        response = client.get(f'/podplay-planning/podplay_context_snapshots/{snapshot_id}')
+        assert response.status_code == 200
+        assert response.get_json()['snapshot'] == body
+
+
+def test_delta_chain_is_capped_at_max_depth(taskmaster_app, monkeypatch):
+    taskmaster_app.config['SNAPSHOT_MAX_DELTA_DEPTH'] = 2
+    bodies = _bodies(5)
+    ids = _post(taskmaster_app, bodies)
+
+    with taskmaster_app.app_context():
+        depths = [db.session.get(SnapshotBlob, hashlib.sha256(b.encode()).hexdigest()).depth for b in bodies]
+    assert depths == [0, 1, 2, 0, 1]
+
+    monkeypatch.setattr(snapshots, '_cache', snapshots._RawCache())
+    response = taskmaster_app.test_client().get(f'/podplay-planning/podplay_context_snapshots/{ids[-1]}')
+    assert response.get_json()['snapshot'] == bodies[-1]
+
+
+def test_identical_bodies_share_one_blob(taskmaster_app):
+    body = _bodies(1)[0]
+    ids = _post(taskmaster_app, [body, body])
+    with taskmaster_app.app_context():
+        assert db.session.query(SnapshotBlob).count() == 1
+    client = taskmaster_app.test_client()
+    assert [client.get(f'/podplay-planning/podplay_context_snapshots/{i}').get_json()['snapshot'] for i in ids] == [body, body]
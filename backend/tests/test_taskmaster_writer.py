@@ -0,0 +1,93 @@
+import pytest
+from sqlalchemy import event, inspect
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from taskmaster_ai import api
+from taskmaster_ai.models import db, Log
+from taskmaster_ai.writer import PendingWrite, WriteBehindQueue
+
+
+def test_full_queue_returns_503(taskmaster_app, monkeypatch):
+    writer = WriteBehindQueue(taskmaster_app, db, max_queue=1, put_timeout=0.01)
+    monkeypatch.setattr(writer, 'start', lambda: None)  # No writer thread, so nothing drains
+    taskmaster_app.extensions['taskmaster_writer'] = writer
+    client = taskmaster_app.test_client()
+
+    first = client.post('/podplay-planning/podplay_logs?wait=false', json={'message': 'one'})
+    second = client.post('/podplay-planning/podplay_logs?wait=false', json={'message': 'two'})
+
+    assert first.status_code == 202
+    assert second.status_code == 503
+    assert second.headers['Retry-After'] == '1'
+    assert writer.stats['rejected'] == 1
+
+
+def test_failed_batch_is_retried_row_by_row_with_fresh_ids(taskmaster_app, monkeypatch):
+    with taskmaster_app.app_context():
+        db.session.add(Log(id=5, message='existing'))
+        db.session.commit()
+    writer = WriteBehindQueue(taskmaster_app, db)
+    good, duplicate, other = Log(message='good'), Log(id=5, message='duplicate'), Log(message='other')
+    batch = [PendingWrite(good), PendingWrite(duplicate), PendingWrite(other)]
+
+    flushed_ids = {}
+    def remember_id(_session):
+        flushed_ids.setdefault('good', inspect(good).dict.get('id'))  # The id the failed flush assigned
+    event.listen(Session, 'after_rollback', remember_id)
+
+    # Between the failed batch and the retry, another writer takes the id the failed flush gave `good`
+    flush_one = writer._flush_one
+    def take_id_then_flush(session, pending):
+        if 'taken' not in flushed_ids:
+            assert flushed_ids['good'] is not None
+            flushed_ids['taken'] = flushed_ids['good']
+            session.add(Log(id=flushed_ids['good'], message='concurrent'))
+            session.commit()
+        flush_one(session, pending)
+    monkeypatch.setattr(writer, '_flush_one', take_id_then_flush)
+
+    try:
+        writer._flush(batch)
+    finally:
+        event.remove(Session, 'after_rollback', remember_id)
+
+    assert writer.stats['retried_batches'] == 1
+    good_id = batch[0].wait(0)
+    assert good_id != flushed_ids['taken']
+    with pytest.raises(IntegrityError):
+        batch[1].wait(0)
+    other_id = batch[2].wait(0)
+    with taskmaster_app.app_context():
+        messages = dict(db.session.query(Log.id, Log.message))
+    assert messages[good_id] == 'good'
+    assert messages[other_id] == 'other'
+    assert messages[flushed_ids['taken']] == 'concurrent'
+    assert writer.stats['committed'] == 2
+    assert writer.stats['failed'] == 1
+
+
+def test_bulk_insert_rejects_non_object_records(taskmaster_app):
+    response = taskmaster_app.test_client().post('/podplay-planning/podplay_logs/batch',
+                                                 json=[{'message': 'ok'}, 'not a record'])
+    assert response.status_code == 400
+    assert 'record 1' in response.get_json()['error']
+
+
+def test_bulk_insert_rolls_back_on_integrity_error(taskmaster_app):
+    with taskmaster_app.app_context():
+        db.session.add(Log(id=1, message='existing'))
+        db.session.commit()
+
+    def build_duplicate(data):
+        return Log(id=1, message=data['message'])
+    with taskmaster_app.test_request_context('/podplay-planning/podplay_logs/batch', method='POST',
+                                             json=[{'message': 'a'}, {'message': 'b'}]):
+        body, status = api._create_many(build_duplicate)
+        assert status == 400
+        assert 'invalid record' in body.get_json()['error']
+        assert not db.session.new  # Rolled back, so the session is usable again
+
+    response = taskmaster_app.test_client().post('/podplay-planning/podplay_logs/batch', json=[{'message': 'after'}])
+    assert response.status_code == 201
+    assert response.get_json()['count'] == 1
@@ -0,0 +1,354 @@
+"""
+Per-request span tracing and sampled profiling
+- Each request gets an ID (a well-formed incoming X-Request-ID is kept). The ID is echoed in
+  the response and readable via current_request_id() from any code running for that request,
+  including tasks and worker threads it starts
+- span(name) times one stage of the current request. Outside a traced request it is a no-op,
+  so library code can call it unconditionally
+- Finished requests get a Server-Timing header (spans summed by name). Their traces go into a
+  bounded ring buffer, served at /api/debug/traces only when TRACE_DEBUG_ENDPOINTS is on (and,
+  with TRACE_DEBUG_TOKEN set, only to requests bearing that token)
+- With PROFILE_SAMPLE_RATE > 0, that share of requests runs under a wall-clock sampling
+  profiler that samples the thread serving it. Its collapsed stacks ("frame;frame;frame count" lines, the input flamegraph.pl
+  and speedscope read) are kept with the trace and written to PROFILE_DIR when set
+"""
+import contextlib
+import contextvars
+import hmac
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+_REQUEST_ID = re.compile(r'^[A-Za-z0-9._:-]{1,128}$')
+_current = contextvars.ContextVar('podplay_trace', default=None)
+
+
+class Trace:
+    def __init__(self, request_id, name):
+        self.request_id = request_id
+        self.name = name
+        self.started = time.perf_counter()
+        self.timestamp = time.time()
+        self.duration = None
+        self.status = None
+        self.spans = []  # (name, offset seconds, seconds, attrs), in completion order
+        self.profile = None  # Collapsed stacks when this request was sampled
+
+    def add(self, name, started, seconds, attrs=None):
+        self.spans.append((name, started - self.started, seconds, attrs or {}))
+
+    def finish(self, status=None):
+        if self.duration is None:
+            self.duration = time.perf_counter() - self.started
+            self.status = status
+
+    def totals(self):
+        """{span name: [seconds, count]}, in the order names first finished."""
+        totals = {}
+        for name, _offset, seconds, _attrs in list(self.spans):
+            entry = totals.setdefault(name, [0.0, 0])
+            entry[0] += seconds
+            entry[1] += 1
+        return totals
+
+    def server_timing(self):
+        parts = []
+        for name, (seconds, count) in self.totals().items():
+            part = f'{_token(name)};dur={seconds * 1000:.1f}'
+            if count > 1:
+                part += f';desc="{count}x"'
+            parts.append(part)
+        if self.duration is not None:
+            parts.append(f'total;dur={self.duration * 1000:.1f}')
+        return ', '.join(parts)
+
+    def to_dict(self, spans=True):
+        data = {
+            'request_id': self.request_id,
+            'name': self.name,
+            'timestamp': self.timestamp,
+            'duration_ms': round(self.duration * 1000, 3) if self.duration is not None else None,
+            'status': self.status,
+            'profiled': self.profile is not None,
+            'totals_ms': {name: round(seconds * 1000, 3) for name, (seconds, _count) in self.totals().items()},
+        }
+        if spans:
+            data['spans'] = [{'name': name, 'offset_ms': round(offset * 1000, 3), 'duration_ms': round(seconds * 1000, 3),
+                              **({'attrs': attrs} if attrs else {})}
+                             for name, offset, seconds, attrs in list(self.spans)]
+        return data
+
+
+def _token(name):
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', name)
+
+
+def current_trace():
+    return _current.get()
+
+
+def current_request_id():
+    trace = _current.get()
+    return trace.request_id if trace is not None else None
+
+
+@contextlib.contextmanager
+def span(name, **attrs):
+    """Time the enclosed block as a stage of the current request; yields the span's attrs
+    (or None when untraced) so the block can annotate it."""
+    trace = _current.get()
+    if trace is None:
+        yield None
+        return
+    started = time.perf_counter()
+    try:
+        yield attrs
+    except BaseException as e:
+        attrs['error'] = type(e).__name__
+        raise
+    finally:
+        trace.add(name, started, time.perf_counter() - started, attrs)
+
+
+class TraceBuffer:
+    """The last `capacity` finished traces, oldest evicted first."""
+
+    def __init__(self, capacity=500):
+        self._traces = deque(maxlen=max(1, capacity))
+        self._lock = threading.Lock()
+        self.stats = {'recorded': 0, 'evicted': 0}
+
+    def add(self, trace):
+        with self._lock:
+            if len(self._traces) == self._traces.maxlen:
+                self.stats['evicted'] += 1
+            self._traces.append(trace)
+            self.stats['recorded'] += 1
+
+    def recent(self, limit=50, min_ms=0.0, name=None):
+        """Newest first, optionally only those at least min_ms long or whose name starts with name."""
+        with self._lock:
+            traces = list(self._traces)
+        found = []
+        for trace in reversed(traces):
+            if trace.duration is not None and trace.duration * 1000 < min_ms:
+                continue
+            if name and not trace.name.startswith(name):
+                continue
+            found.append(trace)
+            if len(found) >= limit:
+                break
+        return found
+
+    def get(self, request_id):
+        with self._lock:
+            for trace in reversed(self._traces):
+                if trace.request_id == request_id:
+                    return trace
+        return None
+
+    def __len__(self):
+        return len(self._traces)
+
+
+class SamplingProfiler:
+    """Wall-clock sampler: while any profiled request is in flight, one daemon thread samples
+    the stack of each request's own thread every interval and counts it towards that session."""
+
+    def __init__(self, interval=0.005, max_stacks=5000):
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self._sessions = {}  # key -> (thread ident, {collapsed stack: samples})
+        self._cond = threading.Condition()
+        self._thread = None
+        self.stats = {'sessions': 0, 'samples': 0}
+
+    def begin(self, key):
+        """Start sampling the calling thread for key."""
+        with self._cond:
+            self._sessions[key] = (threading.get_ident(), {})
+            self.stats['sessions'] += 1
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def end(self, key):
+        """Stop sampling for key; returns its collapsed stacks, heaviest first."""
+        with self._cond:
+            _ident, counts = self._sessions.pop(key, (None, {}))
+        return '\n'.join(f'{stack} {n}' for stack, n in sorted(counts.items(), key=lambda item: -item[1]))
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._sessions:
+                    self._cond.wait()
+                idents = {ident for ident, _counts in self._sessions.values()}
+            frames = sys._current_frames()
+            names = {t.ident: t.name for t in threading.enumerate() if t.ident in idents}
+            stacks = {ident: _collapse(frames[ident], names.get(ident, str(ident))) for ident in idents if ident in frames}
+            del frames
+            # Counted under the lock, so end() never returns a dict that is still being written
+            with self._cond:
+                for ident, counts in self._sessions.values():
+                    stack = stacks.get(ident)
+                    if stack is None:
+                        continue
+                    if stack not in counts and len(counts) >= self.max_stacks:
+                        stack = '[truncated]'
+                    counts[stack] = counts.get(stack, 0) + 1
+                self.stats['samples'] += 1
+            time.sleep(self.interval)
+
+
+def _collapse(frame, thread_name):
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+        frame = frame.f_back
+    frames.append(_token(thread_name))
+    return ';'.join(reversed(frames))
+
+
+class Tracer:
+    def __init__(self, buffer_size=500, sample_rate=0.0, profile_interval=0.005, profile_dir=None):
+        self.buffer = TraceBuffer(buffer_size)
+        self.sample_rate = sample_rate
+        self.profile_dir = profile_dir or None
+        self.profiler = SamplingProfiler(profile_interval) if sample_rate > 0 else None
+
+    def start(self, name, request_id=None):
+        """Begin a trace and make it current; returns (trace, token for finish())."""
+        if not request_id or not _REQUEST_ID.match(request_id):
+            request_id = uuid.uuid4().hex
+        trace = Trace(request_id, name)
+        if self.profiler is not None and random.random() < self.sample_rate:
+            self.profiler.begin(request_id)
+            trace.profile = ''
+        return trace, _current.set(trace)
+
+    def finish(self, trace, token=None, status=None):
+        if trace.duration is not None:
+            return
+        trace.finish(status)
+        if trace.profile is not None:
+            trace.profile = self.profiler.end(trace.request_id)
+            self._dump(trace)
+        self.buffer.add(trace)
+        if token is not None:
+            try:
+                _current.reset(token)
+            except ValueError:
+                _current.set(None)  # Finished from another context
+
+    def _dump(self, trace):
+        if not self.profile_dir:
+            return
+        try:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            with open(os.path.join(self.profile_dir, f'{trace.request_id}.folded'), 'w') as f:
+                f.write(trace.profile + '\n')
+        except OSError as e:
+            print(f"[WARN] Could not write profile for {trace.request_id}: {e}")
+
+    def get_status(self):
+        return {
+            'buffered': len(self.buffer),
+            **self.buffer.stats,
+            'sample_rate': self.sample_rate,
+            'profiler': dict(self.profiler.stats) if self.profiler is not None else None,
+        }
+
+
+def init_tracing(app):
+    """Trace every request of app (app.extensions['tracer']) and, with TRACE_DEBUG_ENDPOINTS on,
+    register the debug endpoints. Returns None when TRACING_ENABLED is off."""
+    if not app.config.get('TRACING_ENABLED', True):
+        return None
+    from flask import g, request
+    tracer = Tracer(
+        buffer_size=app.config.get('TRACE_BUFFER_SIZE', 500),
+        sample_rate=app.config.get('PROFILE_SAMPLE_RATE', 0.0),
+        profile_interval=app.config.get('PROFILE_INTERVAL_MS', 5) / 1000.0,
+        profile_dir=app.config.get('PROFILE_DIR'),
+    )
+    app.extensions['tracer'] = tracer
+
+    @app.before_request
+    def start_trace():
+        g.trace, g.trace_token = tracer.start(f'{request.method} {request.path}', request.headers.get(REQUEST_ID_HEADER))
+
+    @app.after_request
+    def finish_trace(response):
+        trace = g.pop('trace', None)
+        if trace is None:
+            return response
+        tracer.finish(trace, g.pop('trace_token', None), response.status_code)
+        response.headers[REQUEST_ID_HEADER] = trace.request_id
+        response.headers['Server-Timing'] = trace.server_timing()
+        return response
+
+    @app.teardown_request
+    def finish_failed_trace(error=None):
+        # after_request is skipped when the response itself could not be built
+        trace = g.pop('trace', None)
+        if trace is not None:
+            tracer.finish(trace, g.pop('trace_token', None), 500)
+
+    if app.config.get('TRACE_DEBUG_ENDPOINTS', False):
+        app.register_blueprint(_debug_blueprint(app.config.get('TRACE_DEBUG_TOKEN') or None))
+    return tracer
+
+
+def _debug_blueprint(token=None):
+    """Traces and profiles expose request paths and stacks; token, when set, must be sent as
+    `Authorization: Bearer <token>`."""
+    from flask import Blueprint, Response, current_app, jsonify, request
+    bp = Blueprint('tracing_debug', __name__)
+
+    @bp.before_request
+    def require_token():
+        if token is None:
+            return None
+        sent = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(sent.encode(), f'Bearer {token}'.encode()):
+            return jsonify({'error': 'debug token required'}), 401
+        return None
+
+    @bp.route('/api/debug/traces', methods=['GET'])
+    def list_traces():
+        """Recent traces, newest first: ?limit=&min_ms=&name= (e.g. name=POST /api/mama-bear/chat)"""
+        tracer = current_app.extensions['tracer']
+        try:
+            limit = min(int(request.args.get('limit', 50)), 500)
+            min_ms = float(request.args.get('min_ms', 0))
+        except ValueError:
+            return jsonify({'error': 'limit and min_ms must be numbers'}), 400
+        traces = tracer.buffer.recent(limit, min_ms, request.args.get('name'))
+        return jsonify({'traces': [t.to_dict(spans=request.args.get('spans') == 'true') for t in traces],
+                        'status': tracer.get_status()})
+
+    @bp.route('/api/debug/traces/<request_id>', methods=['GET'])
+    def get_trace(request_id):
+        trace = current_app.extensions['tracer'].buffer.get(request_id)
+        if trace is None:
+            return jsonify({'error': 'trace not found'}), 404
+        return jsonify(trace.to_dict())
+
+    @bp.route('/api/debug/traces/<request_id>/profile', methods=['GET'])
+    def get_profile(request_id):
+        """Collapsed stacks for a sampled request, ready for flamegraph.pl or speedscope"""
+        trace = current_app.extensions['tracer'].buffer.get(request_id)
+        if trace is None or not trace.profile:
+            return jsonify({'error': 'no profile for this request'}), 404
+        return Response(trace.profile + '\n', mimetype='text/plain')
+
+    return bp
@@ -0,0 +1,418 @@
+"""
+Pre-warmed Scrapybara VM pool for Scout
+- Keeps a target number of idle, booted instances per vm_type so a lease skips the cold boot
+- lease() health-checks an idle instance before handing it out; unhealthy ones are terminated
+  and the next one is tried, falling back to a cold boot while the type is under max_size
+- release() returns an instance to the idle set (or terminates it when recycle=True)
+- A maintenance thread refills each type to its target and reaps surplus instances idle past
+  idle_timeout; idle instances are terminated at exit so none are left billing
+- VM providers sit behind VMClient; FakeVMClient boots nothing, so the pool works offline
+"""
+import atexit
+import concurrent.futures
+import contextlib
+import itertools
+import os
+import random
+import threading
+import time
+from collections import deque
+
+from latency_histogram import WINDOWS, WindowedHistogram
+
+
+class PoolExhausted(Exception):
+    """Raised when no instance of a vm_type frees up before the lease timeout."""
+
+
+class VMClient:
+    """Provider interface; implementations may block and are called from several threads."""
+
+    def start(self, vm_type):
+        """Boot an instance and return its id once it is usable."""
+        raise NotImplementedError
+
+    def status(self, instance_id):
+        """'running' when the instance can take work; anything else counts as unhealthy."""
+        raise NotImplementedError
+
+    def terminate(self, instance_id):
+        raise NotImplementedError
+
+    def statuses(self, instance_ids):
+        """{instance_id: status} for many instances; providers with a bulk call should override.
+        Instances whose lookup fails are left out, so one bad id doesn't fail the rest."""
+        result, errors = {}, {}
+        for instance_id in instance_ids:
+            try:
+                result[instance_id] = self.status(instance_id)
+            except Exception as e:
+                errors[instance_id] = e
+        if errors:
+            instance_id, error = next(iter(errors.items()))
+            print(f"[WARN] VM status lookup failed for {len(errors)} instances (e.g. {instance_id}: {error})")
+        return result
+
+
+class ScrapybaraClient(VMClient):
+    """Scrapybara SDK backend (pip install scrapybara)."""
+
+    def __init__(self, api_key):
+        from scrapybara import Scrapybara
+        self.client = Scrapybara(api_key=api_key)
+        self._instances = {}
+
+    def start(self, vm_type):
+        if vm_type == 'windows':
+            instance = self.client.start_windows()
+        elif vm_type == 'browser':
+            instance = self.client.start_browser()
+        else:
+            instance = self.client.start_ubuntu()
+        self._instances[instance.id] = instance
+        return instance.id
+
+    def status(self, instance_id):
+        # Fetched fresh: the Instance objects start() returns keep their boot-time status
+        return getattr(self.client.get(instance_id), 'status', 'running')
+
+    def terminate(self, instance_id):
+        instance = self._instances.pop(instance_id, None) or self.client.get(instance_id)
+        instance.stop()
+
+
+class FakeVMClient(VMClient):
+    """In-process backend: boots take boot_time seconds and fail at fail_rate."""
+
+    def __init__(self, boot_time=0.5, fail_rate=0.0, seed=None):
+        self.boot_time = boot_time
+        self.fail_rate = fail_rate
+        self._random = random.Random(seed)
+        self._ids = itertools.count(1)
+        self._status = {}
+        self._lock = threading.Lock()
+        self.stats = {'started': 0, 'terminated': 0, 'status_calls': 0}
+
+    def start(self, vm_type):
+        time.sleep(self.boot_time)
+        with self._lock:
+            if self._random.random() < self.fail_rate:
+                raise RuntimeError(f'fake {vm_type} boot failed')
+            instance_id = f'fake-{vm_type}-{next(self._ids)}'
+            self._status[instance_id] = 'running'
+            self.stats['started'] += 1
+        return instance_id
+
+    def status(self, instance_id):
+        with self._lock:
+            self.stats['status_calls'] += 1
+            return self._status.get(instance_id, 'terminated')
+
+    def terminate(self, instance_id):
+        with self._lock:
+            self._status[instance_id] = 'terminated'
+            self.stats['terminated'] += 1
+
+    def statuses(self, instance_ids):
+        with self._lock:
+            self.stats['status_calls'] += 1
+            return {instance_id: self._status.get(instance_id, 'terminated') for instance_id in instance_ids}
+
+    def fail(self, instance_id, status='error'):
+        """Make an instance unhealthy, as a crashed VM would be."""
+        with self._lock:
+            self._status[instance_id] = status
+
+
+class VMLease:
+    __slots__ = ('instance_id', 'vm_type', 'cold', 'wait')
+
+    def __init__(self, instance_id, vm_type, cold, wait):
+        self.instance_id = instance_id
+        self.vm_type = vm_type
+        self.cold = cold  # Booted for this lease rather than taken warm from the pool
+        self.wait = wait
+
+    def to_dict(self):
+        return {'instance_id': self.instance_id, 'vm_type': self.vm_type, 'cold': self.cold, 'wait': self.wait}
+
+
+class _TypePool:
+    def __init__(self):
+        self.idle = deque()  # (instance_id, idle_since), oldest on the left
+        self.leased = set()
+        self.booting = 0
+
+    @property
+    def size(self):
+        return len(self.idle) + len(self.leased) + self.booting
+
+
+class VMPool:
+    def __init__(self, client, targets=None, max_size=5, idle_timeout=600, check_interval=30, max_boots=4):
+        """targets: {vm_type: idle instances to keep warm}. max_size caps instances per type."""
+        self.client = client
+        self.targets = dict(targets or {})
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.check_interval = check_interval
+        self._pools = {}
+        self._cond = threading.Condition()
+        self._boots = concurrent.futures.ThreadPoolExecutor(max_workers=max_boots, thread_name_prefix='vm-pool-boot')
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lease_waits = WindowedHistogram()
+        self.stats = {'leases': 0, 'hits': 0, 'misses': 0, 'timeouts': 0, 'boots': 0, 'boot_failures': 0,
+                      'unhealthy': 0, 'reaped': 0, 'recycled': 0}
+
+    def _pool(self, vm_type):
+        pool = self._pools.get(vm_type)
+        if pool is None:
+            pool = self._pools[vm_type] = _TypePool()
+        return pool
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='vm-pool', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self, terminate_idle=True):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self._boots.shutdown(wait=True)
+        if terminate_idle:
+            with self._cond:
+                idle = [(vm_type, instance_id) for vm_type, pool in self._pools.items() for instance_id, _t in pool.idle]
+                for pool in self._pools.values():
+                    pool.idle.clear()
+            for _vm_type, instance_id in idle:
+                self._terminate(instance_id)
+
+    # Leasing
+
+    def lease(self, vm_type, timeout=120):
+        """Hand out a healthy instance, warm if one is idle; raises PoolExhausted after timeout."""
+        started = time.monotonic()
+        deadline = started + timeout
+        cold = False
+        while True:
+            instance_id = None
+            with self._cond:
+                pool = self._pool(vm_type)
+                while True:
+                    if pool.idle:
+                        instance_id, _since = pool.idle.pop()
+                        pool.leased.add(instance_id)
+                        break
+                    if pool.size < self.max_size:
+                        pool.booting += 1
+                        cold = True
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.stats['timeouts'] += 1
+                        raise PoolExhausted(f'No {vm_type} instance available within {timeout}s')
+                    self._cond.wait(remaining)
+            self._wake.set()  # Refill behind this lease
+            if cold:
+                instance_id = self._cold_start(vm_type)
+                break
+            if self._healthy(instance_id):
+                break
+            self.stats['unhealthy'] += 1
+            with self._cond:
+                pool.leased.discard(instance_id)
+                self._cond.notify_all()
+            self._terminate(instance_id)
+        wait = time.monotonic() - started
+        self._lease_waits.record(wait)
+        self.stats['leases'] += 1
+        self.stats['misses' if cold else 'hits'] += 1
+        return VMLease(instance_id, vm_type, cold, wait)
+
+    def _cold_start(self, vm_type):
+        pool = self._pool(vm_type)
+        try:
+            instance_id = self.client.start(vm_type)
+        except Exception:
+            self.stats['boot_failures'] += 1
+            with self._cond:
+                pool.booting -= 1
+                self._cond.notify_all()
+            raise
+        self.stats['boots'] += 1
+        with self._cond:
+            pool.booting -= 1
+            pool.leased.add(instance_id)
+        return instance_id
+
+    def release(self, instance_id, recycle=False):
+        """Return a leased instance; recycle=True terminates it instead of keeping it warm."""
+        with self._cond:
+            pool = next((p for p in self._pools.values() if instance_id in p.leased), None)
+            if pool is None:
+                return False
+            pool.leased.discard(instance_id)
+            if not recycle:
+                pool.idle.append((instance_id, time.monotonic()))
+            self._cond.notify_all()
+        if recycle:
+            self.stats['recycled'] += 1
+            self._terminate(instance_id)
+            self._wake.set()
+        return True
+
+    def terminate(self, instance_id):
+        """Terminate an instance whether it is leased, idle in the pool or unknown to it."""
+        with self._cond:
+            for pool in self._pools.values():
+                pool.leased.discard(instance_id)
+                for item in [item for item in pool.idle if item[0] == instance_id]:
+                    pool.idle.remove(item)
+            self._cond.notify_all()
+        self._terminate(instance_id)
+        self._wake.set()
+
+    @contextlib.contextmanager
+    def leased(self, vm_type, timeout=120):
+        """with pool.leased('ubuntu') as lease: ... (the instance is recycled if the block raises)."""
+        lease = self.lease(vm_type, timeout)
+        try:
+            yield lease
+        except BaseException:
+            self.release(lease.instance_id, recycle=True)
+            raise
+        self.release(lease.instance_id)
+
+    def instances(self):
+        """{instance_id: (vm_type, 'idle' | 'leased')} for every booted instance in the pool."""
+        with self._cond:
+            result = {}
+            for vm_type, pool in self._pools.items():
+                for instance_id, _since in pool.idle:
+                    result[instance_id] = (vm_type, 'idle')
+                for instance_id in pool.leased:
+                    result[instance_id] = (vm_type, 'leased')
+            return result
+
+    def is_leased(self, instance_id):
+        with self._cond:
+            return any(instance_id in pool.leased for pool in self._pools.values())
+
+    def _healthy(self, instance_id):
+        try:
+            return self.client.status(instance_id) == 'running'
+        except Exception:
+            return False
+
+    def _terminate(self, instance_id):
+        try:
+            self.client.terminate(instance_id)
+        except Exception as e:
+            print(f"[WARN] VM pool could not terminate {instance_id}: {e}")
+
+    # Maintenance
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.maintain()
+            except Exception as e:
+                print(f"[WARN] VM pool maintenance failed: {e}")
+            self._wake.wait(self.check_interval)
+            self._wake.clear()
+
+    def maintain(self):
+        """Reap surplus instances idle past idle_timeout, then start boots up to each target."""
+        now = time.monotonic()
+        reaped = []
+        with self._cond:
+            for vm_type, pool in self._pools.items():
+                surplus = len(pool.idle) - self.targets.get(vm_type, 0)
+                # Oldest-returned first
+                while surplus > 0 and pool.idle and now - pool.idle[0][1] >= self.idle_timeout:
+                    reaped.append(pool.idle.popleft()[0])
+                    surplus -= 1
+            boots = []
+            for vm_type, target in self.targets.items():
+                pool = self._pool(vm_type)
+                missing = min(target - len(pool.idle) - pool.booting, self.max_size - pool.size)
+                for _ in range(max(0, missing)):
+                    pool.booting += 1
+                    boots.append(vm_type)
+        for instance_id in reaped:
+            self.stats['reaped'] += 1
+            self._terminate(instance_id)
+        for vm_type in boots:
+            self._boots.submit(self._warm_start, vm_type)
+
+    def _warm_start(self, vm_type):
+        pool = self._pool(vm_type)
+        try:
+            instance_id = self.client.start(vm_type)
+        except Exception as e:
+            self.stats['boot_failures'] += 1
+            print(f"[WARN] VM pool could not boot a {vm_type} instance: {e}")
+            instance_id = None
+        else:
+            self.stats['boots'] += 1
+        with self._cond:
+            pool.booting -= 1
+            if instance_id is not None:
+                pool.idle.append((instance_id, time.monotonic()))
+            self._cond.notify_all()
+
+    # Metrics
+
+    def get_status(self):
+        waits = self._lease_waits.window(WINDOWS['5m'])
+        with self._cond:
+            types = {
+                vm_type: {'idle': len(pool.idle), 'leased': len(pool.leased), 'booting': pool.booting,
+                          'target': self.targets.get(vm_type, 0)}
+                for vm_type, pool in self._pools.items()
+            }
+        leases = self.stats['leases']
+        return {
+            **self.stats,
+            'hit_rate': self.stats['hits'] / leases if leases else 0.0,
+            'lease_wait_p50': waits.percentile(50) if waits.count else None,
+            'lease_wait_p99': waits.percentile(99) if waits.count else None,
+            'max_size': self.max_size,
+            'types': types,
+        }
+
+    def lease_wait_histogram(self):
+        return self._lease_waits.total
+
+
+def create_vm_client(config):
+    """ScrapybaraClient, or FakeVMClient when SCRAPYBARA_BACKEND is 'fake' or the SDK/key is missing."""
+    if config.get('SCRAPYBARA_BACKEND', 'scrapybara') != 'fake':
+        api_key = os.environ.get('SCRAPYBARA_API_KEY')
+        try:
+            if api_key:
+                return ScrapybaraClient(api_key)
+            print("[INFO] SCRAPYBARA_API_KEY is not set; using the fake VM backend")
+        except ImportError:
+            print("[INFO] Scrapybara SDK is not installed; using the fake VM backend")
+    return FakeVMClient(boot_time=config.get('FAKE_VM_BOOT_SECONDS', 0.5))
+
+
+def create_vm_pool(config, client=None):
+    pool = VMPool(
+        client or create_vm_client(config),
+        targets=config.get('VM_POOL_TARGETS'),
+        max_size=config.get('VM_POOL_MAX_SIZE', 5),
+        idle_timeout=config.get('VM_POOL_IDLE_TIMEOUT', 600),
+        check_interval=config.get('VM_POOL_CHECK_INTERVAL', 30),
+    )
+    pool.start()
+    return pool
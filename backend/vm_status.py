@@ -0,0 +1,184 @@
+"""
+Bulk VM status collection for the Scrapybara dashboard
+- One background sweep per interval refreshes every known instance (the pool's, plus any
+  tracked by id) through VMClient.statuses, in chunks run at most `concurrency` at a time
+- Results land in a versioned in-memory table; a sweep that changes anything bumps the
+  version once and stamps the changed rows with it
+- Readers ask for changes since a version; removed instances leave tombstones so deltas stay
+  complete, and readers older than the oldest tombstone get the full table
+- Only changed rows are pushed over SocketIO, so provider calls scale with the interval
+  rather than with the number of dashboards open
+"""
+import concurrent.futures
+import threading
+import time
+from collections import OrderedDict
+
+DELTA_EVENT = 'vm_status_delta'
+ROOM = 'vm_status'
+
+
+class VMStatusCollector:
+    def __init__(self, client, pool=None, interval=5.0, concurrency=8, chunk_size=25, emit=None, tombstones=1024):
+        """emit(event, data, room) pushes changes, e.g. lambda e, d, r: socketio.emit(e, d, to=r)."""
+        self.client = client
+        self.pool = pool
+        self.interval = interval
+        self.concurrency = concurrency
+        self.chunk_size = chunk_size
+        self.emit = emit
+        self.max_tombstones = tombstones
+        self.version = 0
+        self._rows = {}  # instance_id -> row dict
+        self._removed = OrderedDict()  # instance_id -> version it was removed at
+        self._floor = 0  # Deltas from versions below this are incomplete
+        self._tracked = {}  # instance_id -> vm_type, for instances outside the pool
+        self._lock = threading.Lock()
+        self._sweep_lock = threading.Lock()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='vm-status')
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = {'sweeps': 0, 'provider_calls': 0, 'instances_checked': 0, 'errors': 0, 'rows_pushed': 0,
+                      'last_sweep_seconds': None, 'last_sweep_at': None}
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='vm-status', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self._executor.shutdown(wait=False)
+
+    def _loop(self):
+        while True:
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"[WARN] VM status sweep failed: {e}")
+            if self._stop.wait(self.interval):
+                return
+
+    def track(self, instance_id, vm_type=None):
+        """Include an instance the pool doesn't know about in future sweeps. Only pass ids that
+        came from a lease or that the provider has confirmed."""
+        with self._lock:
+            self._tracked[instance_id] = vm_type
+
+    def untrack(self, instance_id):
+        with self._lock:
+            self._tracked.pop(instance_id, None)
+
+    # Collection
+
+    def sweep(self):
+        """Refresh every known instance; returns the rows that changed."""
+        with self._sweep_lock:
+            started = time.monotonic()
+            known = {instance_id: (vm_type, None) for instance_id, vm_type in list(self._tracked.items())}
+            if self.pool is not None:
+                known.update(self.pool.instances())
+            ids = list(known)
+            chunks = [ids[i:i + self.chunk_size] for i in range(0, len(ids), self.chunk_size)]
+            results, failed = {}, set()
+            futures = {self._executor.submit(self.client.statuses, chunk): chunk for chunk in chunks}
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    answered = future.result()
+                    results.update(answered)
+                    # Ids the provider couldn't look up keep their last known status
+                    failed.update(i for i in futures[future] if i not in answered)
+                except Exception as e:
+                    self.stats['errors'] += 1
+                    failed.update(futures[future])
+                    print(f"[WARN] VM status call failed for {len(futures[future])} instances: {e}")
+            now = time.time()
+            with self._lock:
+                changed, removed = self._apply(known, results, failed, now)
+                version = self.version
+            self.stats['sweeps'] += 1
+            self.stats['provider_calls'] += len(chunks)
+            self.stats['instances_checked'] += len(results)
+            self.stats['last_sweep_seconds'] = time.monotonic() - started
+            self.stats['last_sweep_at'] = now
+        if (changed or removed) and self.emit is not None:
+            self.stats['rows_pushed'] += len(changed)
+            try:
+                self.emit(DELTA_EVENT, {'version': version, 'full': False, 'vms': changed, 'removed': removed}, ROOM)
+            except Exception as e:
+                print(f"[WARN] VM status push failed: {e}")
+        return changed
+
+    def _apply(self, known, results, failed, now):
+        next_version = self.version + 1
+        changed = []
+        for instance_id, (vm_type, pool_state) in known.items():
+            if instance_id in failed:
+                continue  # Keep the last known status until the provider answers again
+            status = results[instance_id]
+            row = self._rows.get(instance_id)
+            if row is None or (row['status'], row['vm_type'], row['pool_state']) != (status, vm_type, pool_state):
+                row = {'instance_id': instance_id, 'vm_type': vm_type, 'pool_state': pool_state, 'status': status,
+                       'changed_at': now, 'checked_at': now, 'version': next_version}
+                self._rows[instance_id] = row
+                self._removed.pop(instance_id, None)
+                changed.append(dict(row))
+            else:
+                row['checked_at'] = now
+            if status == 'terminated':
+                self._tracked.pop(instance_id, None)
+        removed = [instance_id for instance_id in self._rows if instance_id not in known]
+        for instance_id in removed:
+            del self._rows[instance_id]
+            self._removed[instance_id] = next_version
+        while len(self._removed) > self.max_tombstones:
+            _instance_id, dropped_version = self._removed.popitem(last=False)
+            self._floor = max(self._floor, dropped_version)
+        if changed or removed:
+            self.version = next_version
+        return changed, removed
+
+    # Reads
+
+    def get(self, instance_id):
+        with self._lock:
+            row = self._rows.get(instance_id)
+            return dict(row) if row is not None else None
+
+    def changes(self, since_version=None):
+        """Rows changed after since_version and ids removed since; the full table (full=True)
+        when since_version is None or older than the tombstones kept."""
+        with self._lock:
+            full = since_version is None or since_version < self._floor or since_version > self.version
+            if full:
+                rows = [dict(row) for row in self._rows.values()]
+                removed = []
+            else:
+                rows = [dict(row) for row in self._rows.values() if row['version'] > since_version]
+                removed = [i for i, v in self._removed.items() if v > since_version]
+            return {'version': self.version, 'full': full, 'vms': rows, 'removed': removed,
+                    'checked_at': self.stats['last_sweep_at']}
+
+    def get_status(self):
+        with self._lock:
+            return {**self.stats, 'version': self.version, 'instances': len(self._rows), 'tracked': len(self._tracked)}
+
+
+def register_vm_status_handlers(socketio, get_collector):
+    """`subscribe_vm_status` joins the push room and answers with changes since the client's version.
+    get_collector() is called per subscription, so the collector can be created on first use."""
+    from flask_socketio import emit, join_room, leave_room
+
+    @socketio.on('subscribe_vm_status')
+    def handle_subscribe_vm_status(data=None):
+        join_room(ROOM)
+        emit(DELTA_EVENT, get_collector().changes((data or {}).get('since_version')))
+
+    @socketio.on('unsubscribe_vm_status')
+    def handle_unsubscribe_vm_status(data=None):
+        leave_room(ROOM)
@@ -25,23 +25,88 @@ export interface AgentPlan {
   context?: string;
 }
 
+type PlanOp =
+  | { op: "add" | "replace"; path: string; value: any }
+  | { op: "remove"; path: string };
+
+interface PlanDelta {
+  epoch: string;
+  from_version: number;
+  to_version: number;
+  ops: PlanOp[];
+}
+
+// Paths are /plans/<planId>[/<field> | /subtasks/<subtaskId>/<field>]
+function applyOps(plans: Map<string, AgentPlan>, ops: PlanOp[]) {
+  for (const op of ops) {
+    const [, planId, key, subtaskId, field] = op.path.split("/").slice(1);
+    if (key === undefined) {
+      if (op.op === "remove") plans.delete(planId);
+      else plans.set(planId, op.value);
+      continue;
+    }
+    const plan = plans.get(planId);
+    if (!plan || op.op === "remove") continue;
+    if (key === "subtasks" && subtaskId !== undefined && field !== undefined) {
+      plans.set(planId, {
+        ...plan,
+        subtasks: plan.subtasks.map(s => (s.id === subtaskId ? { ...s, [field]: op.value } : s)),
+      });
+    } else {
+      plans.set(planId, { ...plan, [key]: op.value });
+    }
+  }
+}
+
 export function useLivePlans(userId: string) {
   const [plans, setPlans] = useState<AgentPlan[]>([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState<string | null>(null);
   const socketRef = useRef<Socket | null>(null);
+  const planMapRef = useRef<Map<string, AgentPlan>>(new Map());
+  const versionRef = useRef<number | null>(null);
+  // Versions restart with the server; the epoch says which run they belong to
+  const epochRef = useRef<string | null>(null);
 
   useEffect(() => {
     const socket = io("http://localhost:5000", { transports: ["websocket"] });
     socketRef.current = socket;
+    planMapRef.current = new Map();
+    versionRef.current = null;
+    epochRef.current = null;
     setLoading(true);
 
-    socket.emit("get_agent_plans", { user_id: userId });
+    // On (re)connect, ask only for what changed since the last version we applied
+    const sync = () =>
+      socket.emit("get_agent_plans", { user_id: userId, since_version: versionRef.current, epoch: epochRef.current });
+    socket.on("connect", () => {
+      setError(null);
+      sync();
+    });
 
-    socket.on("agent_plans_update", (data: { plans: AgentPlan[] }) => {
+    socket.on("agent_plans_update", (data: { plans: AgentPlan[]; version?: number; epoch?: string }) => {
+      planMapRef.current = new Map(data.plans.map(p => [p.id, p]));
+      versionRef.current = data.version ?? null;
+      epochRef.current = data.epoch ?? null;
       setPlans(data.plans);
       setLoading(false);
     });
+    socket.on("agent_plans_delta", (delta: PlanDelta) => {
+      if (delta.epoch !== epochRef.current) {
+        sync(); // The server restarted; its versions don't line up with ours
+        return;
+      }
+      const version = versionRef.current ?? 0;
+      if (delta.to_version <= version) return; // Already applied
+      if (delta.from_version > version) {
+        sync(); // Missed a frame
+        return;
+      }
+      applyOps(planMapRef.current, delta.ops);
+      versionRef.current = delta.to_version;
+      setPlans(Array.from(planMapRef.current.values()));
+      setLoading(false);
+    });
     socket.on("connect_error", err => {
       setError("WebSocket connection failed");
       setLoading(false);
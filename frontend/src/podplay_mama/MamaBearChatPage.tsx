@@ -65,7 +65,11 @@ export const MamaBearChatPage: React.FC = () => {
     chatEndRef.current?.scrollIntoView({ behavior: "smooth" });
   }, [messages]);
 
-  function sendMessage(e: React.FormEvent) {
+  // Abort the in-flight stream (and the upstream model call) when leaving the page
+  const streamRef = useRef<AbortController | null>(null);
+  useEffect(() => () => streamRef.current?.abort(), []);
+
+  async function sendMessage(e: React.FormEvent) {
     e.preventDefault();
     if (!input.trim()) return;
     const userMsg: ChatMessage = {
@@ -74,30 +78,60 @@ export const MamaBearChatPage: React.FC = () => {
       content: input,
       timestamp: new Date().toISOString(),
     };
-    setMessages((msgs) => [...msgs, userMsg]);
+    const mamaId = userMsg.id + "_mama";
+    setMessages((msgs) => [
+      ...msgs,
+      userMsg,
+      { id: mamaId, sender: "mama", content: "", timestamp: new Date().toISOString() },
+    ]);
     setInput("");
     setSending(true);
-    // Simulate backend chat with Mama Bear
-    fetch("/mama_bear_chat", {
-      method: "POST",
-      headers: { "Content-Type": "application/json" },
-      body: JSON.stringify({ message: userMsg.content }),
-    })
-      .then((res) => {
-        if (!res.ok) throw new Error("Failed to get response from Mama Bear");
-        return res.json();
-      })
-      .then((data) => {
-        const mamaMsg: ChatMessage = {
-          id: Date.now().toString() + "_mama",
-          sender: "mama",
-          content: data.reply,
-          timestamp: new Date().toISOString(),
-        };
-        setMessages((msgs) => [...msgs, mamaMsg]);
-        setSending(false);
-      })
-      .catch(() => setSending(false));
+    const appendToReply = (text: string) =>
+      setMessages((msgs) => msgs.map((m) => (m.id === mamaId ? { ...m, content: m.content + text } : m)));
+
+    const controller = new AbortController();
+    streamRef.current = controller;
+    try {
+      // Tokens arrive as Server-Sent Events: "token" events, then "done" or "error"
+      const res = await fetch("/api/mama-bear/chat", {
+        method: "POST",
+        headers: { "Content-Type": "application/json", Accept: "text/event-stream" },
+        body: JSON.stringify({ message: userMsg.content, page_context: "main_chat", user_id: userId, stream: true }),
+        signal: controller.signal,
+      });
+      if (!res.ok || !res.body) throw new Error("Failed to get response from Mama Bear");
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      for (;;) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const frames = buffer.split("\n\n");
+        buffer = frames.pop() ?? "";
+        for (const frame of frames) {
+          const event = /^event: (.*)$/m.exec(frame)?.[1];
+          const data = /^data: (.*)$/m.exec(frame)?.[1];
+          if (!event || !data) continue;
+          const payload = JSON.parse(data);
+          if (event === "token") appendToReply(payload.text);
+          if (event === "error") throw new Error(payload.error);
+        }
+      }
+    } catch (err) {
+      // Aborted on unmount: nothing to show. Failed: keep whatever arrived and say why it stopped
+      if (!controller.signal.aborted) {
+        const reason = err instanceof Error ? err.message : "Mama Bear could not answer";
+        setMessages((msgs) =>
+          msgs.map((m) =>
+            m.id === mamaId ? { ...m, content: m.content ? `${m.content} ⚠️ ${reason}` : `⚠️ ${reason}` } : m
+          )
+        );
+      }
+    } finally {
+      if (streamRef.current === controller) streamRef.current = null;
+      setSending(false);
+    }
   }
 
   return (